@@ -1,8 +1,8 @@
-import requests
 import json
 import logging
 import re
-from config import OLLAMA_BASE_URL, LYRIC_MODEL
+from config import LYRIC_MODEL
+from tools.ollama import get_ollama_client
 from tools.utils import strip_thinking
 from tools.rag import RAGTool
 from tools.perplexity import PerplexityClient
@@ -53,17 +53,101 @@ VOCAL_KEYWORDS_REGEX = re.compile(
     re.IGNORECASE
 )
 
+# Line openings that start LLM meta-commentary; everything from such a line on is dropped
+META_MARKERS = (
+    'note:', 'explanation:', 'i tried to', "i've tried to",
+    'the lyrics', 'this song', 'these lyrics', 'i focused on',
+    'i aimed to', 'i wanted to', 'i incorporated', 'i used',
+    'i avoided', 'i created', 'i wrote', 'i included'
+)
+
+# Streaming early stop: a sung line is assumed to fill about two bars, and generation
+# stops once the lines written exceed the bar budget by this factor
+BARS_PER_LINE = 2
+BAR_BUDGET_TOLERANCE = 1.25
+
+
+class LyricStreamGuard:
+    """
+    Watches streamed lyrics line by line and says when to stop generating.
+
+    Generation stops once the [Outro] section is complete (a blank line or a new section
+    after its lines), when meta-commentary starts, or when the sung lines exceed the
+    bar budget from calculate_lyric_budget. Everything past those points would be thrown
+    away by normalize_lyrics anyway. `text` holds the lines accepted before the stop.
+    """
+
+    def __init__(self, total_bars):
+        self.max_lines = int(total_bars * BAR_BUDGET_TOLERANCE / BARS_PER_LINE) if total_bars else None
+        self.pending = ""
+        self.accepted = []
+        self.in_thinking = False
+        self.in_outro = False
+        self.outro_lines = 0
+        self.sung_lines = 0
+
+    def feed(self, chunk):
+        """Adds a streamed chunk; returns the reason to stop, or None to keep going."""
+        self.pending += chunk
+        *lines, self.pending = self.pending.split('\n')
+        for line in lines:
+            reason = self._check_line(line.strip())
+            if reason:
+                return reason
+            self.accepted.append(line)
+        return None
+
+    @property
+    def text(self):
+        return '\n'.join(self.accepted).strip()
+
+    def _check_line(self, line):
+        lower = line.lower()
+        if self.in_thinking:
+            self.in_thinking = '</think>' not in lower
+            return None
+        if lower.startswith('<think>'):
+            self.in_thinking = '</think>' not in lower
+            return None
+
+        if any(lower.startswith(marker) for marker in META_MARKERS):
+            return "meta-commentary"
+
+        if not line:
+            return "outro complete" if self.in_outro and self.outro_lines else None
+
+        if line.startswith('[') and line.endswith(']'):
+            if self.in_outro and self.outro_lines:
+                return "outro complete"
+            self.in_outro = 'outro' in lower
+            return None
+
+        # Lines wholly in parentheses are directions or backing vocals, not new bars
+        if line.startswith('(') and line.endswith(')'):
+            return None
+
+        self.sung_lines += 1
+        if self.in_outro:
+            self.outro_lines += 1
+        if self.max_lines and self.sung_lines > self.max_lines:
+            return "bar budget exceeded"
+        return None
+
 class LyricsAgent:
     def __init__(self):
-        self.base_url = OLLAMA_BASE_URL
+        self.ollama = get_ollama_client()
         self.model = LYRIC_MODEL
         self.rag = RAGTool()
         self.perplexity = PerplexityClient()
 
-    def write_lyrics_node(self, state):
-        """Node: Research and Generate ACE-formatted lyrics."""
-        
-        # 1. Research (Combined)
+    def research_node(self, state):
+        """
+        Node: Research songwriting themes (Perplexity + LightRAG) for the lyrics.
+
+        Runs before the music direction so the LLM-backed searches don't evict the lyric
+        model between the music and lyrics calls; the lyric model is preloaded while
+        LightRAG answers.
+        """
         trending_data = state.get("trending_data", "")
         if trending_data:
             query = f"Using this trend: {trending_data}, find songwriting themes for {state['genre']} in the style of {state['artist_style']}"
@@ -76,14 +160,24 @@ class LyricsAgent:
             logging.error(f"Perplexity search failed: {e}")
             search_results = "No search results."
 
+        self.ollama.preload_async(self.model)
+
         try:
             rag_results = self.rag.query_lightrag(f"Lyrics by {state['artist_style']}")
         except Exception as e:
             logging.error(f"RAG query failed: {e}")
             rag_results = "No RAG results."
 
-        research_notes = f"Perplexity: {search_results}\n\nLightRAG: {rag_results}"
-        state["research_notes"] = research_notes
+        state["research_notes"] = f"Perplexity: {search_results}\n\nLightRAG: {rag_results}"
+        return state
+
+    def write_lyrics_node(self, state):
+        """Node: Generate ACE-formatted lyrics (researching first unless research_node already ran)."""
+
+        # 1. Research (Combined)
+        if not state.get("research_notes"):
+            self.research_node(state)
+        research_notes = state["research_notes"]
 
         # 2. Determine Time Budget
         # Use target duration from state if available, otherwise 240s
@@ -109,23 +203,10 @@ INSTRUCTIONS (POETIC MODE):
 Goal: Produce unique, high-quality, raw, and 'street' lyrics for a {state['genre']} track.
 """
 
-        prompt = f"""{role_description}
-Artist: {state['artist_name']}
-Background: {state['artist_background']}
-Style: {state['artist_style']}
-Song Title: {state.get('song_title', 'Untitled')}
-Musical Direction: {state.get('musical_direction', {})}
-User Direction (High Priority): {state.get('user_direction', 'No specific direction.')}
-Research Notes: {research_notes}
-
-TIME BUDGET (CRITICAL):
-- Target Duration: {budget['duration']} seconds
-- BPM: {budget['bpm']}
-- Seconds per Bar: {budget['seconds_per_bar']:.2f}
-- Total Bar Budget: ~{budget['total_bars']} bars
-- STRICTLY FOLLOW THIS STRUCTURE:
-{budget['structure_template']}
-
+        # The static instructions form the system message and the song's details come last,
+        # so every track of an album shares the same prompt prefix (KV-cache reuse).
+        # Details are ordered from album-wide (artist, budget, research) to per-track.
+        system_prompt = f"""{role_description}
 Output Requirements:
 - PRIMARY GOAL: Strictly follow the User Direction (High Priority) regarding vocal types, themes, and specific avoidances.
 - STRUCTURE: You MUST use ACE-Step markers like [Intro], [Verse], [Chorus], [Bridge], [Outro], [Instrumental Break].
@@ -152,28 +233,40 @@ CRITICAL CONSTRAINTS:
 - DO NOT include ANY meta-commentary, notes, or explanations about your creative process.
 - DO NOT write lines like "Note:", "Explanation:", "I tried to...", or any self-referential text.
 - OUTPUT ONLY the lyrics themselves with ACE-Step markers.
-- If you find yourself wanting to explain something, DON'T. Just write better lyrics instead.
+- If you find yourself wanting to explain something, DON'T. Just write better lyrics instead."""
+
+        prompt = f"""Artist: {state['artist_name']}
+Background: {state['artist_background']}
+Style: {state['artist_style']}
+
+TIME BUDGET (CRITICAL):
+- Target Duration: {budget['duration']} seconds
+- BPM: {budget['bpm']}
+- Seconds per Bar: {budget['seconds_per_bar']:.2f}
+- Total Bar Budget: ~{budget['total_bars']} bars
+- STRICTLY FOLLOW THIS STRUCTURE:
+{budget['structure_template']}
+
+Research Notes: {research_notes}
+
+Song Title: {state.get('song_title', 'Untitled')}
+Musical Direction: {state.get('musical_direction', {})}
+User Direction (High Priority): {state.get('user_direction', 'No specific direction.')}
 
 Begin creative workflow immediately."""
 
         try:
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.8,  # Creative but controlled
-                        "min_p": 0.05,       # Filter out low-probability garbage while keeping creativity
-                        "top_p": 0.9,
-                        "top_k": 40
-                    }
+            lyrics = self.stream_lyrics(
+                system_prompt,
+                prompt,
+                options={
+                    "temperature": 0.8,  # Creative but controlled
+                    "min_p": 0.05,       # Filter out low-probability garbage while keeping creativity
+                    "top_p": 0.9,
+                    "top_k": 40
                 },
-                timeout=90
+                total_bars=budget["total_bars"]
             )
-            response.raise_for_status()
-            lyrics = response.json().get("response", "").strip()
             state["lyrics"] = lyrics
 
             # Apply cleaning immediately
@@ -186,6 +279,27 @@ Begin creative workflow immediately."""
 
         return state
 
+    def stream_lyrics(self, system_prompt, prompt, options, total_bars):
+        """
+        Streams the lyrics completion and stops it as soon as LyricStreamGuard sees the
+        song is finished, so tokens that would be discarded are never generated.
+        """
+        guard = LyricStreamGuard(total_bars)
+        chunks = []
+        # The stop rule is part of the cache key, so a cached (truncated) answer is only reused by the same guard
+        stop_condition = f"lyric-guard:bars={total_bars}:per_line={BARS_PER_LINE}:tolerance={BAR_BUDGET_TOLERANCE}"
+        stream = self.ollama.chat_stream(self.model, system_prompt, prompt, options=options, stop_condition=stop_condition)
+        try:
+            for chunk in stream:
+                chunks.append(chunk)
+                reason = guard.feed(chunk)
+                if reason:
+                    logging.info(f"Stopping lyrics generation early: {reason}")
+                    return guard.text
+        finally:
+            stream.close()
+        return "".join(chunks).strip()
+
     def strip_musical_directions(self, lyrics):
         """
         Removes lines that are purely parenthetical instrumental/musical directions.
@@ -274,16 +388,8 @@ Begin creative workflow immediately."""
             stripped = line.strip()
             lower = stripped.lower()
             
-            # Check for meta-commentary markers
-            meta_markers = [
-                'note:', 'explanation:', 'i tried to', "i've tried to",
-                'the lyrics', 'this song', 'these lyrics', 'i focused on',
-                'i aimed to', 'i wanted to', 'i incorporated', 'i used',
-                'i avoided', 'i created', 'i wrote', 'i included'
-            ]
-            
             # If we find meta-commentary, skip this line and all following lines
-            if any(lower.startswith(marker) for marker in meta_markers):
+            if any(lower.startswith(marker) for marker in META_MARKERS):
                 skip_rest = True
                 continue
             
@@ -1,25 +1,24 @@
 import requests
 import json
 import logging
-from config import MUSIC_PROMPTS, OLLAMA_BASE_URL, LYRIC_MODEL
+from config import MUSIC_PROMPTS, LYRIC_MODEL
+from tools.ollama import get_ollama_client
 from tools.utils import strip_thinking
 
 
 class MusicAgent:
     def __init__(self):
-        self.base_url = OLLAMA_BASE_URL
+        self.ollama = get_ollama_client()
         self.model = LYRIC_MODEL
 
     def generate_direction(self, genre, user_direction, trending_data=None):
-        system_prompt = MUSIC_PROMPTS.get(genre.upper(), MUSIC_PROMPTS.get("POP", "Default POP Prompt"))
-        
-        trending_context = f"TRENDING DATA (Incorporate if relevant): {trending_data}\n\n" if trending_data else ""
+        genre_prompt = MUSIC_PROMPTS.get(genre.upper(), MUSIC_PROMPTS.get("POP", "Default POP Prompt"))
 
-        user_prompt = (
-            f"PRIMARY INSTRUCTION (USER DIRECTION): {user_direction}\n\n"
-            f"GENRE CONTEXT: {genre}\n\n"
-            f"{trending_context}"
-            "Task: Create a musical direction for this song.\n"
+        # Static task instructions go in the system message and the song's direction last,
+        # so consecutive songs share the prompt prefix Ollama has already evaluated
+        system_prompt = (
+            f"{genre_prompt}\n\n"
+            "Task: Create a musical direction for the song described in the user message.\n"
             "INSTRUCTIONS:\n"
             "1. STRICTLY ADHERE to all stylistic details, vocals, and instruments mentioned in the PRIMARY INSTRUCTION.\n"
             "2. Use the GENRE CONTEXT for atmospheric inspiration but do not let it override specific user requests.\n"
@@ -32,25 +31,27 @@ class MusicAgent:
             "- 'keyscale': A string representing the key (e.g., 'C major', 'F# minor'). Use lowercase for 'major' and 'minor'."
         )
 
+        trending_context = f"TRENDING DATA (Incorporate if relevant): {trending_data}\n\n" if trending_data else ""
+
+        user_prompt = (
+            f"GENRE CONTEXT: {genre}\n\n"
+            f"{trending_context}"
+            f"PRIMARY INSTRUCTION (USER DIRECTION): {user_direction}"
+        )
+
         try:
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": f"{system_prompt}\n\n{user_prompt}",
-                    "stream": False,
-                    "format": "json",
-                    "options": {
-                        "temperature": 0.7,  # Slightly lower for structured JSON output
-                        "min_p": 0.05,
-                        "top_p": 0.9,
-                        "top_k": 40
-                    }
-                },
-                timeout=60
+            response_text = self.ollama.chat(
+                self.model,
+                system_prompt,
+                user_prompt,
+                format="json",
+                options={
+                    "temperature": 0.7,  # Slightly lower for structured JSON output
+                    "min_p": 0.05,
+                    "top_p": 0.9,
+                    "top_k": 40
+                }
             )
-            response.raise_for_status()
-            response_text = response.json().get("response", "").strip()
             
             # Strip thinking blocks before parsing JSON
             response_text = strip_thinking(response_text)
@@ -1,12 +1,11 @@
-import requests
 import logging
-import json
-from config import OLLAMA_BASE_URL, ALBUM_MODEL
+from config import ALBUM_MODEL
+from tools.ollama import get_ollama_client
 from tools.utils import strip_thinking
 
 class NarrativeAgent:
     def __init__(self):
-        self.base_url = OLLAMA_BASE_URL
+        self.ollama = get_ollama_client()
         self.model = ALBUM_MODEL
 
     def generate_album_narrative(self, genre, theme, album_title, band_bio=None, num_songs=6):
@@ -43,24 +42,15 @@ class NarrativeAgent:
         Focus purely on the narrative content.
         """
 
-        payload = {
-            "model": self.model,
-            "prompt": f"{system_prompt}\n\n{user_prompt}",
-            "stream": False,
-            "options": {
-                "temperature": 0.8,
-                "top_p": 0.9
-            }
-        }
-
         try:
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json=payload,
-                timeout=120
+            text = self.ollama.generate(
+                self.model,
+                f"{system_prompt}\n\n{user_prompt}",
+                options={
+                    "temperature": 0.8,
+                    "top_p": 0.9
+                }
             )
-            response.raise_for_status()
-            text = response.json().get("response", "").strip()
             return strip_thinking(text)
         except Exception as e:
             logging.error(f"Error generating album narrative: {e}")
@@ -1,10 +1,12 @@
 import os
+import sys
 import time
 import argparse
 import logging
 import re
 import config
 import random
+import shutil
 from config import DEFAULT_NEGATIVE_PROMPT_SUFFIX
 from dotenv import load_dotenv
 load_dotenv()
@@ -16,7 +18,12 @@ from agents.music import MusicAgent
 from agents.lyrics import LyricsAgent
 from agents.narrative import NarrativeAgent
 from tools.comfy import ComfyClient
-from tools.metadata import scan_recent_songs, save_metadata
+from tools.comfy_events import format_progress
+from tools.comfy_pool import ComfyPool, comfy_urls_from_env
+from tools.render_cache import RenderCache
+from tools.render_journal import RenderJournal
+from tools.ollama import get_ollama_client
+from tools.metadata import scan_recent_songs, save_metadata, remove_metadata, load_render_job
 from tools.utils import sanitize_input, sanitize_filename, normalize_keyscale
 from tools.audio_engineering import calculate_song_parameters
 from agents.director import generate_next_direction, generate_album_title, generate_song_title
@@ -31,19 +38,41 @@ from tools.band import (
 )
 
 SONG_FILENAME_PATTERN = re.compile(r"song_(\d+)_")
+# Appended to a draft's filename so it never collides with the promoted full render
+DRAFT_SUFFIX = "_draft"
+
+def print_render_progress(event):
+    """Renders ComfyUI progress events as a single updating terminal line."""
+    end = "\n" if event["type"] in ("completed", "failed") else ""
+    print(f"\r\033[K  Rendering {format_progress(event)}", end=end, flush=True)
+
 
 class SongbirdWorkflow:
     def __init__(self, output_dir="output"):
         self.artist_agent = ArtistAgent()
         self.music_agent = MusicAgent()
         self.lyrics_agent = LyricsAgent()
-        self.comfy = ComfyClient(output_dir=output_dir)
+        self.ollama = get_ollama_client()
+        # Several COMFYUI_URLS form a render farm; a single server keeps the plain client
+        comfy_urls = comfy_urls_from_env()
+        # Submitted-but-uncollected renders, so a restart can collect them (see resume_renders)
+        self.journal = RenderJournal(output_dir=output_dir)
+        if len(comfy_urls) > 1:
+            self.comfy = ComfyPool(comfy_urls, output_dir=output_dir, journal=self.journal)
+        else:
+            self.comfy = ComfyClient(output_dir=output_dir, journal=self.journal)
+        self.render_cache = RenderCache()
+        # Draft tier: short, low-step previews that can be promoted to a full render later
+        self.draft_seconds = int(os.getenv("SONGBIRD_DRAFT_SECONDS", "30"))
+        self.draft_steps = int(os.getenv("SONGBIRD_DRAFT_STEPS", "4"))
         
         # Build the graph
         workflow = StateGraph(SongState)
         
         # Define nodes
         workflow.add_node("create_artist", self.node_create_artist)
+        # Research runs ahead of the music direction so the music and lyrics calls (same model) run back to back
+        workflow.add_node("research", self.lyrics_agent.research_node)
         workflow.add_node("create_music_direction", self.node_create_music)
         # Combined lyrics generation node
         workflow.add_node("write_lyrics", self.lyrics_agent.write_lyrics_node)
@@ -51,7 +80,8 @@ class SongbirdWorkflow:
         
         # Define edges
         workflow.set_entry_point("create_artist")
-        workflow.add_edge("create_artist", "create_music_direction")
+        workflow.add_edge("create_artist", "research")
+        workflow.add_edge("research", "create_music_direction")
         workflow.add_edge("create_music_direction", "write_lyrics")
         workflow.add_edge("write_lyrics", "generate_audio")
         workflow.add_edge("generate_audio", END)
@@ -142,7 +172,7 @@ class SongbirdWorkflow:
             filename_prefix = f"{state['track_number']:02d}_{safe_title}"
 
         # Dynamic Audio Engineering
-        params = calculate_song_parameters(state["genre"], state.get("cleaned_lyrics", ""))
+        params = calculate_song_parameters(state["genre"], state.get("cleaned_lyrics", ""), seed=seed)
 
         # Resolve Key
         # Priority: User Input > Genre Default > Generated/Fallback
@@ -179,8 +209,8 @@ class SongbirdWorkflow:
 
         logging.info(f"Optimizing for [{state['genre']}]: Duration {params['duration']}s, Sampler {params['sampler_name']}, Scheduler {params['scheduler']}, Key {keyscale}")
 
-        result = self.comfy.submit_prompt(
-            state["cleaned_lyrics"], 
+        job = dict(
+            lyrics=state["cleaned_lyrics"],
             tags=tags,
             bpm=bpm,
             keyscale=keyscale,
@@ -192,44 +222,256 @@ class SongbirdWorkflow:
             sampler_name=params["sampler_name"],
             scheduler=params["scheduler"],
             negative_prompt=negative_prompt,
-            cfg_scale=params.get("cfg_scale", 4.0)
+            cfg_scale=params.get("cfg_scale", 4.0),
+            # Several takes share one sampling pass as a latent batch
+            batch_size=max(1, state.get("variants") or 1)
         )
 
+        # A draft renders a short, low-step preview; the full job is kept for promotion
+        if state.get("draft"):
+            state["render_job"] = job
+            job = self.draft_job(job)
+
+        # Identical inputs with a fixed seed reproduce the same audio: reuse an earlier render
+        state["render_key"] = self.render_key(job)
+        cached_path = self.reuse_cached_render(state, job)
+        if cached_path:
+            state["audio_path"] = cached_path
+            return state
+
+        # Deferred mode (album pipelining): queue the render and let the caller collect it later
+        if state.get("defer_audio"):
+            # Load the caller's next LLM model while we wait for a free render slot
+            self.ollama.preload_async(state.get("next_model"))
+            result = self.comfy.submit_when_ready(**job)
+            if result and "prompt_id" in result:
+                state["prompt_id"] = result["prompt_id"]
+                state["audio_path"] = self.planned_audio_path(job["filename_prefix"])
+                self.journal_context(state, result["prompt_id"])
+                logging.info(f"Audio generation queued. Prompt ID: {state['prompt_id']}")
+            else:
+                state["audio_path"] = "error"
+            return state
+
+        result = self.comfy.submit_prompt(**job)
+
         if result and "prompt_id" in result:
             prompt_id = result["prompt_id"]
             logging.info(f"Audio generation started. Prompt ID: {prompt_id}")
+            self.journal_context(state, prompt_id)
             audio_path = self.comfy.wait_and_download_output(prompt_id)
-
-            # Rename file to remove ComfyUI suffix if needed
-            if audio_path and state.get("track_number") and state.get("song_title"):
-                dir_name = os.path.dirname(audio_path)
-                ext = os.path.splitext(audio_path)[1]
-                safe_title = sanitize_filename(state["song_title"])
-                new_filename = f"{state['track_number']:02d}_{safe_title}{ext}"
-                new_path = os.path.join(dir_name, new_filename)
-
-                try:
-                    if audio_path != new_path:
-                        if not os.path.exists(audio_path):
-                            logging.error(f"Source file does not exist for rename: {audio_path}")
-                        elif os.path.exists(new_path):
-                            logging.warning(f"Target file already exists, skipping rename: {new_path}")
-                        else:
-                            os.rename(audio_path, new_path)
-                            logging.info(f"Renamed {audio_path} to {new_path}")
-                            audio_path = new_path
-                except OSError as e:
-                    logging.error(f"Failed to rename file: {e}")
-
-            state["audio_path"] = audio_path
+            state["audio_path"] = self.finalize_audio(state, audio_path)
+            state["take_paths"] = self.finalize_takes(state, prompt_id)
         else:
             state["audio_path"] = "error"
 
         return state
 
-    def run(self, genre, user_direction, seed=None, artist_style=None, artist_background=None, song_title=None, album_name=None, track_number=None, vocals="auto", vocal_strength=1.2, key=None, trending_data=None, poetic_mode=False, artist_name=None, bpm_override=None):
+    def draft_job(self, job):
+        """The draft tier of a render job: same seed and inputs, shorter and with fewer steps."""
+        return dict(
+            job,
+            duration=min(job["duration"], self.draft_seconds),
+            steps=min(job["steps"], self.draft_steps),
+            filename_prefix=f"{job['filename_prefix']}{DRAFT_SUFFIX}",
+        )
+
+    def reuse_cached_render(self, state, job):
+        """Places an earlier identical render (state["render_key"]) in the output dir. Returns its final path or None."""
+        cached_path = self.render_cache.get(state.get("render_key"))
+        if not cached_path:
+            return None
+        ext = os.path.splitext(cached_path)[1]
+        audio_path = self.render_cache.materialize(cached_path, os.path.join(self.comfy.output_dir, f"{job['filename_prefix']}{ext}"))
+        logging.info(f"Reusing cached render for identical inputs: {cached_path}")
+        return self.finalize_audio(state, audio_path)
+
+    def promote_drafts(self, draft_paths):
+        """
+        Re-renders drafts at full quality from the render job saved next to each draft, with
+        identical seed and inputs. The full render lands beside the draft, with its metadata.
+        Returns {draft_path: promoted audio path or None}.
+        """
+        results = {}
+        by_dir = {}
+        for draft_path in draft_paths:
+            record = load_render_job(draft_path)
+            if record:
+                by_dir.setdefault(os.path.dirname(os.path.abspath(draft_path)), []).append((draft_path, record))
+            else:
+                results[draft_path] = None
+
+        for output_dir, drafts in by_dir.items():
+            self.set_output_dir(output_dir)
+            pending = {}
+            for draft_path, record in drafts:
+                job = record["job"]
+                state = {
+                    "track_number": record.get("track_number"),
+                    "song_title": record.get("song_title"),
+                    "render_key": self.render_key(job),
+                }
+                cached_path = self.reuse_cached_render(state, job)
+                if cached_path:
+                    results[draft_path] = self.copy_draft_metadata(draft_path, cached_path)
+                    continue
+                result = self.comfy.submit_when_ready(**job)
+                if result and "prompt_id" in result:
+                    logging.info(f"Promoting {draft_path} (Prompt ID: {result['prompt_id']})")
+                    self.journal_context(state, result["prompt_id"])
+                    pending[result["prompt_id"]] = (draft_path, state)
+                else:
+                    results[draft_path] = None
+
+            for prompt_id, audio_path in self.comfy.await_all(list(pending)):
+                draft_path, state = pending[prompt_id]
+                audio_path = self.finalize_audio(state, audio_path)
+                state["audio_path"] = audio_path
+                self.finalize_takes(state, prompt_id)
+                results[draft_path] = self.copy_draft_metadata(draft_path, audio_path) if audio_path else None
+        return results
+
+    def journal_context(self, state, prompt_id):
+        """Records what finalize_audio needs for a queued render, so a later run can finish it."""
+        self.journal.annotate(
+            prompt_id, track_number=state.get("track_number"), song_title=state.get("song_title"),
+            draft=bool(state.get("draft")), render_key=state.get("render_key")
+        )
+
+    def resume_renders(self):
+        """
+        Collects renders an earlier, interrupted run queued on ComfyUI but never collected,
+        finalizing each into the directory it was meant for. Returns {prompt_id: audio path or None}.
+        """
+        reattached = self.comfy.reattach()
+        if not reattached:
+            return {}
+
+        results = {}
+        original_dir = self.comfy.output_dir
+        by_dir = {}
+        for prompt_id, entry in reattached.items():
+            by_dir.setdefault(entry.get("output_dir") or original_dir, []).append(prompt_id)
+        for output_dir, prompt_ids in by_dir.items():
+            self.set_output_dir(output_dir)
+            for prompt_id, audio_path in self.comfy.await_all(prompt_ids):
+                entry = reattached[prompt_id]
+                state = dict(entry.get("context") or {})
+                audio_path = self.finalize_audio(state, audio_path)
+                state["audio_path"] = audio_path
+                self.finalize_takes(state, prompt_id)
+                if not audio_path and entry.get("filename_prefix"):
+                    remove_metadata(self.planned_audio_path(entry["filename_prefix"]))
+                results[prompt_id] = audio_path
+        self.set_output_dir(original_dir)
+        return results
+
+    def collect_render(self, state, prompt_id, audio_path):
+        """
+        Finishes a render queued by run(defer_audio=True) once await_all() has returned it:
+        names the file and its takes, and updates the metadata saved at queue time. When the
+        render failed, that metadata and the draft's render job are removed again, so later
+        songs are not directed by, and --promote does not offer, a song without audio.
+        Returns the final audio path or None.
+        """
+        planned_path = state.get("audio_path")
+        audio_path = self.finalize_audio(state, audio_path)
+        state["audio_path"] = audio_path
+        state["take_paths"] = self.finalize_takes(state, prompt_id)
+        if not audio_path:
+            if planned_path and planned_path != "error":
+                remove_metadata(planned_path)
+        elif state["take_paths"]:
+            # Re-save so the metadata lists every take
+            save_metadata(state)
+        return audio_path
+
+    def copy_draft_metadata(self, draft_path, audio_path):
+        """Gives a promoted render the draft's metadata file. Returns audio_path."""
+        draft_meta = f"{os.path.splitext(draft_path)[0]}_metadata.txt"
+        meta_path = f"{os.path.splitext(audio_path)[0]}_metadata.txt"
+        if os.path.exists(draft_meta) and not os.path.exists(meta_path):
+            try:
+                shutil.copyfile(draft_meta, meta_path)
+            except OSError as e:
+                logging.error(f"Failed to copy draft metadata: {e}")
+        return audio_path
+
+    def finalize_takes(self, state, prompt_id):
+        """
+        Names the extra takes of a batched render after the finalized first take
+        (`<name>_take2.mp3`, ...). Returns every take's path, or [] for a single take.
+        """
+        takes = self.comfy.pop_takes(prompt_id)
+        primary = state.get("audio_path")
+        if len(takes) < 2 or not primary or primary == "error":
+            return []
+
+        base, ext = os.path.splitext(primary)
+        paths = [primary]
+        for number, take_path in enumerate(takes[1:], start=2):
+            new_path = f"{base}_take{number}{ext}"
+            try:
+                if os.path.exists(new_path):
+                    logging.warning(f"Target file already exists, keeping take as {take_path}")
+                else:
+                    os.rename(take_path, new_path)
+                    take_path = new_path
+            except OSError as e:
+                logging.error(f"Failed to rename take: {e}")
+            paths.append(take_path)
+        logging.info(f"Rendered {len(paths)} takes: {', '.join(os.path.basename(p) for p in paths)}")
+        return paths
+
+    def render_key(self, job):
+        """Render cache key for a job, or None when the render is not reproducible (no fixed seed)."""
+        # The cache holds one file per key, so batched takes are not cached
+        if job.get("seed") is None or job.get("batch_size", 1) > 1:
+            return None
+        try:
+            return self.render_cache.key(self.comfy.build_prompt(**job))
+        except Exception as e:
+            logging.debug(f"Could not compute render cache key: {e}")
+            return None
+
+    def planned_audio_path(self, filename_prefix):
+        """Where a deferred render will end up once collected and renamed."""
+        return os.path.join(self.comfy.output_dir, f"{filename_prefix}.mp3")
+
+    def finalize_audio(self, state, audio_path):
+        """Renames a downloaded file to remove the ComfyUI suffix. Returns the final path."""
+        if audio_path and state.get("track_number") and state.get("song_title"):
+            dir_name = os.path.dirname(audio_path)
+            ext = os.path.splitext(audio_path)[1]
+            safe_title = sanitize_filename(state["song_title"])
+            draft_suffix = DRAFT_SUFFIX if state.get("draft") else ""
+            new_filename = f"{state['track_number']:02d}_{safe_title}{draft_suffix}{ext}"
+            new_path = os.path.join(dir_name, new_filename)
+
+            try:
+                if audio_path != new_path:
+                    if not os.path.exists(audio_path):
+                        logging.error(f"Source file does not exist for rename: {audio_path}")
+                    elif os.path.exists(new_path):
+                        logging.warning(f"Target file already exists, skipping rename: {new_path}")
+                    else:
+                        os.rename(audio_path, new_path)
+                        logging.info(f"Renamed {audio_path} to {new_path}")
+                        audio_path = new_path
+            except OSError as e:
+                logging.error(f"Failed to rename file: {e}")
+
+        self.render_cache.put(state.get("render_key"), audio_path)
+        return audio_path
+
+    def run(self, genre, user_direction, seed=None, artist_style=None, artist_background=None, song_title=None, album_name=None, track_number=None, vocals="auto", vocal_strength=1.2, key=None, trending_data=None, poetic_mode=False, artist_name=None, bpm_override=None, defer_audio=False, draft=False, variants=1, next_model=None):
         """
         Executes the Songbird workflow.
+        With defer_audio=True the render is only queued; collect it with comfy.await_all() and
+        pass the result to collect_render().
+        next_model names the LLM model the caller uses next; it is preloaded while the render is queued.
+        With draft=True a short preview is rendered; promote it later with promote_drafts().
+        variants > 1 renders that many takes of the song in one batched pass.
         """
         initial_state = {
             "genre": genre,
@@ -252,7 +494,15 @@ class SongbirdWorkflow:
             "key": key,
             "trending_data": trending_data,
             "poetic_mode": poetic_mode,
-            "bpm_override": bpm_override
+            "bpm_override": bpm_override,
+            "defer_audio": defer_audio,
+            "prompt_id": None,
+            "render_key": None,
+            "draft": draft,
+            "render_job": None,
+            "variants": variants,
+            "take_paths": [],
+            "next_model": next_model
         }
         final_state = self.app.invoke(initial_state)
         save_metadata(final_state)
@@ -268,6 +518,13 @@ def main():
     parser.add_argument("--key", type=str, help="Musical key (e.g. \'C Minor\')")
     parser.add_argument("--verbose", action="store_true", help="Enable verbose logging")
     parser.add_argument("--output", type=str, default="output", help="Output directory (default: output)")
+    parser.add_argument("--no-progress", action="store_true", help="Hide the live render progress line")
+    parser.add_argument("--cleanup-comfy", action="store_true", help="Cancel queued Songbird renders and prune their ComfyUI history, then exit")
+    parser.add_argument("--draft", action="store_true", help="Render short, low-step previews that can be promoted later")
+    parser.add_argument("--promote", nargs="+", metavar="DRAFT", help="Re-render the given draft files at full quality, then exit")
+    parser.add_argument("--resume", action="store_true", help="First collect renders an interrupted earlier run left on ComfyUI (see SONGBIRD_RENDER_JOURNAL)")
+    parser.add_argument("--replay", action="store_true", help="Reuse every cached LLM answer (SONGBIRD_LLM_CACHE), e.g. to re-run a failed album quickly")
+    parser.add_argument("--variants", type=int, default=1, help="Takes per song, rendered together in one batched pass (default: 1)")
 
     # Album mode arguments
     parser.add_argument("--album", action="store_true", help="Enable album mode")
@@ -286,6 +543,13 @@ def main():
 
     args = parser.parse_args()
 
+    if args.replay:
+        llm_cache = get_ollama_client().cache
+        if llm_cache.enabled:
+            llm_cache.replay = True
+        else:
+            print("--replay has no effect: set SONGBIRD_LLM_CACHE to a cache file to record LLM answers.")
+
     # --suggest logic
     if args.suggest:
         print("Analyzing your history...")
@@ -334,6 +598,35 @@ def main():
     ensure_band_directory(args.output)
 
     flow = SongbirdWorkflow(output_dir=args.output)
+    if args.cleanup_comfy:
+        result = flow.comfy.cleanup_orphans()
+        print(f"ComfyUI cleanup: cancelled {result['cancelled']} queued render(s), pruned {result['pruned']} history entries.")
+        flow.comfy.close()
+        return
+
+    if sys.stdout.isatty() and not args.no_progress:
+        flow.comfy.add_progress_callback(print_render_progress)
+
+    # Collect renders an interrupted earlier run left on ComfyUI instead of losing them
+    if args.resume:
+        resumed = flow.resume_renders()
+        if resumed:
+            print(f"Collected {len(resumed)} render(s) from an interrupted earlier run:")
+            for prompt_id, audio_path in resumed.items():
+                print(f"  {audio_path or f'Prompt {prompt_id} failed'}")
+    else:
+        orphaned = flow.journal.orphaned()
+        if orphaned:
+            print(f"{len(orphaned)} render(s) from an interrupted earlier run are not collected yet; run with --resume to collect them.")
+
+    if args.promote:
+        print(f"Promoting {len(args.promote)} draft(s) to full renders...")
+        for draft_path, audio_path in flow.promote_drafts(args.promote).items():
+            print(f"{draft_path} -> {audio_path or 'failed'}")
+        return
+
+    # Load the checkpoint on ComfyUI while the LLM stages below run
+    flow.comfy.warm_up_async()
 
     # Gather Trending Data
     trending_data = None
@@ -415,75 +708,118 @@ def main():
 
         logging.info(f"Album Master Seed: {master_seed}")
 
-        # Generate Album Narrative
-        print("Designing unique album story arc...")
-        narrative_agent = NarrativeAgent()
-        album_narrative = narrative_agent.generate_album_narrative(
-            args.genre, 
-            args.theme, 
-            album_name, 
-            band_bio=persistent_artist_background,
-            num_songs=args.num_songs
-        )
-        logging.info(f"Generated Album Narrative: {album_narrative}")
-        print(f"Narrative Arc: {album_narrative[:200]}...")
+        # Keep the models the track loop alternates between (directions and titles on the album
+        # model, music and lyrics on the lyric model) loaded for the whole album
+        ollama = get_ollama_client()
+        ollama.pin(config.ALBUM_MODEL, config.LYRIC_MODEL)
 
-        for i in range(1, args.num_songs + 1):
-            print(f"\n--- Generating Song {i}/{args.num_songs} ---")
+        pending_renders = {}
 
-            # Generate song title
-            song_title = generate_song_title(album_name, i, args.genre, args.theme, args.base_direction, album_narrative=album_narrative)
-            print(f"Title: {song_title}")
+        def collect_renders(prompt_ids):
+            """Collects queued renders as they finish and reports each song."""
+            for prompt_id, audio_path in flow.comfy.await_all(prompt_ids):
+                song_state = pending_renders.pop(prompt_id)
+                audio_path = flow.collect_render(song_state, prompt_id, audio_path)
+                if audio_path:
+                    print(f"Song {song_state['track_number']} complete: {audio_path}")
+                else:
+                    print(f"Song {song_state['track_number']} failed to generate audio.")
 
-            if i == 1:
-                # First song direction
-                current_direction = f"{args.base_direction} Start the album saga: {args.theme}. Begin with the awakening/escape/origin story."
-            else:
-                # Subsequent songs: get context from previous songs
-                print("Retrieving context from previous songs...")
-                recent_summaries = scan_recent_songs(album_output_dir, n=3)
-                current_direction = generate_next_direction(
-                    args.theme,
-                    args.base_direction,
-                    recent_summaries,
-                    i,
-                    args.num_songs,
-                    album_narrative=album_narrative
-                )
-
-            logging.info(f"Song {i} Direction: {current_direction}")
-            print(f"Direction: {current_direction}")
-
-            # Run workflow for this song
-            final_state = flow.run(
-                args.genre,
-                current_direction,
-                seed=master_seed,
-                artist_style=persistent_artist_style,
-                artist_background=persistent_artist_background,
-                song_title=song_title,
-                album_name=album_name,
-                track_number=i,
-                vocals=args.vocals,
-                vocal_strength=args.vocal_strength,
-                key=args.key,
-                trending_data=trending_data,
-                poetic_mode=args.poetic,
-                artist_name=band_name_for_flow,
-                bpm_override=args.bpm
+        try:
+            # Generate Album Narrative
+            print("Designing unique album story arc...")
+            narrative_agent = NarrativeAgent()
+            album_narrative = narrative_agent.generate_album_narrative(
+                args.genre, 
+                args.theme, 
+                album_name, 
+                band_bio=persistent_artist_background,
+                num_songs=args.num_songs
             )
+            logging.info(f"Generated Album Narrative: {album_narrative}")
+            print(f"Narrative Arc: {album_narrative[:200]}...")
+
+            # Titles only depend on the narrative: write them all now, back to back on the album model
+            song_titles = [
+                generate_song_title(album_name, i, args.genre, args.theme, args.base_direction, album_narrative=album_narrative)
+                for i in range(1, args.num_songs + 1)
+            ]
+
+            for i in range(1, args.num_songs + 1):
+                print(f"\n--- Generating Song {i}/{args.num_songs} ---")
+
+                song_title = song_titles[i - 1]
+                print(f"Title: {song_title}")
+
+                if i == 1:
+                    # First song direction
+                    current_direction = f"{args.base_direction} Start the album saga: {args.theme}. Begin with the awakening/escape/origin story."
+                else:
+                    # Subsequent songs: get context from previous songs
+                    print("Retrieving context from previous songs...")
+                    recent_summaries = scan_recent_songs(album_output_dir, n=3)
+                    current_direction = generate_next_direction(
+                        args.theme,
+                        args.base_direction,
+                        recent_summaries,
+                        i,
+                        args.num_songs,
+                        album_narrative=album_narrative
+                    )
+
+                logging.info(f"Song {i} Direction: {current_direction}")
+                print(f"Direction: {current_direction}")
+
+                # Run workflow for this song. The render is only queued so the next
+                # song's LLM stages overlap with this one on the GPU.
+                final_state = flow.run(
+                    args.genre,
+                    current_direction,
+                    seed=master_seed,
+                    artist_style=persistent_artist_style,
+                    artist_background=persistent_artist_background,
+                    song_title=song_title,
+                    album_name=album_name,
+                    track_number=i,
+                    vocals=args.vocals,
+                    vocal_strength=args.vocal_strength,
+                    key=args.key,
+                    trending_data=trending_data,
+                    poetic_mode=args.poetic,
+                    artist_name=band_name_for_flow,
+                    bpm_override=args.bpm,
+                    defer_audio=True,
+                    draft=args.draft,
+                    variants=args.variants,
+                    # The next song starts with its direction on the album model
+                    next_model=config.ALBUM_MODEL if i < args.num_songs else None
+                )
 
-            # Capture artist info from the first song if not already captured, but only if successful
-            # (Note: In centralized mode, we already have this, but this handles non-band mode too)
-            if persistent_artist_style is None and final_state.get('audio_path') and final_state['audio_path'] != "error":
-                persistent_artist_style = final_state.get("artist_style")
-                persistent_artist_background = final_state.get("artist_background")
-                logging.info(f"Captured Persistent Artist Style: {persistent_artist_style}")
-
-            if final_state.get('audio_path') and final_state['audio_path'] != "error":
-                print(f"Song {i} complete: {final_state['audio_path']}")
-            else:
-                print(f"Song {i} failed to generate audio.")
+                if final_state.get('prompt_id'):
+                    pending_renders[final_state['prompt_id']] = final_state
+                    print(f"Song {i} queued for rendering (Prompt ID: {final_state['prompt_id']})")
+                elif final_state.get('audio_path') and final_state['audio_path'] != "error":
+                    print(f"Song {i} reused an identical earlier render: {final_state['audio_path']}")
+                else:
+                    print(f"Song {i} failed to generate audio.")
+
+                # Capture artist info from the first song if not already captured, but only if successful
+                # (Note: In centralized mode, we already have this, but this handles non-band mode too)
+                if persistent_artist_style is None:
+                    if final_state.get('prompt_id'):
+                        # Only a song that actually rendered defines the album's artist, so wait for this one
+                        print("Waiting for this render before fixing the album's artist...")
+                        collect_renders([final_state['prompt_id']])
+                    if final_state.get('audio_path') and final_state['audio_path'] != "error":
+                        persistent_artist_style = final_state.get("artist_style")
+                        persistent_artist_background = final_state.get("artist_background")
+                        logging.info(f"Captured Persistent Artist Style: {persistent_artist_style}")
+        finally:
+            ollama.unpin()
+
+        if pending_renders:
+            print(f"\nWaiting for {len(pending_renders)} queued render(s)...")
+        collect_renders(list(pending_renders))
 
         # Post-Album Updates for Band
         if args.band:
@@ -491,6 +827,8 @@ def main():
             update_discography(args.output, args.band, album_name)
             copy_band_profile_to_album(args.output, args.band, album_output_dir)
 
+        if args.draft:
+            print(f"\nDrafts saved in {album_output_dir}. Promote the keepers with: python app.py --promote <draft.mp3> ...")
         print("\nAlbum Generation Complete!")
 
     else:
@@ -507,7 +845,9 @@ def main():
             trending_data=trending_data,
             poetic_mode=args.poetic,
             artist_name=band_name_for_flow,
-            bpm_override=args.bpm
+            bpm_override=args.bpm,
+            draft=args.draft,
+            variants=args.variants
         )
 
         print("Workflow Complete!")
@@ -516,8 +856,13 @@ def main():
 
         if final_state.get('audio_path'):
             print(f"Audio Path: {final_state['audio_path']}")
+            for take_path in final_state.get('take_paths', [])[1:]:
+                print(f"Alternate Take: {take_path}")
         else:
             print("Audio Path: None")
 
+    swaps = get_ollama_client().model_swap_summary()
+    print(f"LLM model swaps: {swaps['switches']} ({swaps['loads']} cold loads, {swaps['load_seconds']:.1f}s loading)")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark: end-to-end batch rendering through ComfyClient against the fake ComfyUI server.
+
+Submits a batch with submit_batch, collects it with await_all and reports wall time,
+overhead beyond the simulated render time, and HTTP calls made per render. Failure
+injection, dropped WebSockets and HTTP-only polling can be switched on to compare
+how the client copes. Example:
+
+    python benchmarks/bench_comfy_render.py --renders 10 --render-seconds 0.5
+    python benchmarks/bench_comfy_render.py --no-ws --ws-drop-rate 0 --renders 10
+    python benchmarks/bench_comfy_render.py --ws-drop-rate 0.05 --fail-rate 0.1
+    python benchmarks/bench_comfy_render.py --shared-output --audio-kb 8192
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools.comfy import ComfyClient
+from tools.fake_comfy import FakeComfyServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ComfyClient end-to-end render benchmark")
+    parser.add_argument("--renders", type=int, default=10, help="Renders in the batch (default: 10)")
+    parser.add_argument("--render-seconds", type=float, default=0.5, help="Simulated time per render")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Probability of an execution_error")
+    parser.add_argument("--ws-drop-rate", type=float, default=0.0, help="Probability per event of dropping the WebSocket")
+    parser.add_argument("--no-ws", action="store_true", help="Disable /ws to measure HTTP polling")
+    parser.add_argument("--backlog", type=int, default=0, help="Foreign prompts queued ahead of the batch")
+    parser.add_argument("--http-latency", type=float, default=0.0, help="Seconds added to every HTTP response")
+    parser.add_argument("--audio-kb", type=int, default=1024, help="Size of each synthetic MP3")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shared-output", action="store_true",
+                        help="Let the server write to a directory the client maps via COMFYUI_OUTPUT_DIR")
+    args = parser.parse_args()
+
+    shared_dir = tempfile.mkdtemp(prefix="songbird_comfy_out_") if args.shared_output else None
+
+    server = FakeComfyServer(
+        render_seconds=args.render_seconds, fail_rate=args.fail_rate, ws_drop_rate=args.ws_drop_rate,
+        ws_enabled=not args.no_ws, backlog=args.backlog, http_latency=args.http_latency,
+        audio_bytes=args.audio_kb * 1024, seed=args.seed, output_dir=shared_dir,
+    ).start()
+    output_dir = tempfile.mkdtemp(prefix="songbird_bench_")
+    client = ComfyClient(url=server.url, output_dir=output_dir)
+    client.shared_output_dirs = [shared_dir] if shared_dir else []
+    client.events.wait_connected(5)
+
+    jobs = [{"lyrics": "la la la", "tags": "pop", "duration": 30, "steps": 8, "filename_prefix": f"bench{i}"}
+            for i in range(args.renders)]
+
+    start = time.perf_counter()
+    prompt_ids = client.submit_batch(jobs, max_pending=args.renders)
+    results = dict(client.await_all(prompt_ids, timeout=args.renders * args.render_seconds * 4 + 60))
+    wall = time.perf_counter() - start
+
+    ideal = (args.renders + args.backlog) * args.render_seconds
+    succeeded = sum(1 for path in results.values() if path)
+    http_calls = sum(count for route, count in server.request_counts.items() if route != "GET /ws")
+    print(f"Target: fake ComfyUI at {server.url} ({'polling' if args.no_ws else 'WebSocket'}{', shared output dir' if shared_dir else ''})")
+    print(f"Renders: {succeeded}/{args.renders} succeeded")
+    print(f"Wall time: {wall:.2f}s (simulated render time {ideal:.2f}s, overhead {wall - ideal:+.2f}s)")
+    print(f"HTTP calls: {http_calls} ({http_calls / max(1, args.renders):.1f} per render)")
+    for route, count in sorted(server.request_counts.items()):
+        print(f"  {route:<22} {count}")
+
+    client.close()
+    server.stop()
+    shutil.rmtree(output_dir, ignore_errors=True)
+    if shared_dir:
+        shutil.rmtree(shared_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
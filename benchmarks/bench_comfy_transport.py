@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-call latency of bare requests.get vs ComfyClient's pooled session.
+
+Runs against the local fake ComfyUI server (tools/fake_comfy.py) by default,
+or against a real server/tunnel with --url. Example:
+
+    python benchmarks/bench_comfy_transport.py --calls 200
+    python benchmarks/bench_comfy_transport.py --url https://comfy.example.com --calls 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools.comfy import ComfyClient
+from tools.fake_comfy import FakeComfyServer
+
+
+def measure(fn, calls):
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<28} mean {statistics.mean(samples):7.2f} ms   p50 {statistics.median(samples):7.2f} ms   p95 {p95:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ComfyClient transport benchmark")
+    parser.add_argument("--url", type=str, help="ComfyUI URL (default: local stand-in server)")
+    parser.add_argument("--calls", type=int, default=100, help="Calls per variant (default: 100)")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if not url:
+        server = FakeComfyServer().start()
+        url = server.url
+
+    client = ComfyClient(url=url, output_dir=tempfile.mkdtemp(prefix="songbird_bench_"))
+    verify = client.verify
+
+    print(f"Target: {url} ({args.calls} calls each)")
+    before = measure(lambda i: requests.get(f"{url}/history/bench-{i}", timeout=client.timeout, verify=verify).json(), args.calls)
+    after = measure(lambda i: client.get_history(f"bench-{i}"), args.calls)
+
+    report("before: requests.get", before)
+    report("after:  pooled session", after)
+    print(f"Speedup (mean): {statistics.mean(before) / statistics.mean(after):.2f}x")
+
+    client.close()
+    os.rmdir(client.output_dir)
+    if server:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
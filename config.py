@@ -39,3 +39,6 @@ DEFAULT_ARTIST_STYLE = "Adele"
 DEFAULT_NEGATIVE_PROMPT_SUFFIX = ", low quality, glitch, distorted"
 # Negative Prompt Node ID for ComfyUI Workflow
 NEGATIVE_PROMPT_NODE_ID = "7"
+
+# ComfyUI workflow template (API format), relative to the project root unless absolute
+COMFYUI_WORKFLOW = os.getenv("COMFYUI_WORKFLOW", "audio_ace_step_1_5_checkpoint.json")
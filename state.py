@@ -24,3 +24,11 @@ class SongState(TypedDict):
     bpm_override: Optional[int]
     band_profile: Optional[dict]
     suggested_prompt: Optional[dict]
+    defer_audio: Optional[bool]
+    prompt_id: Optional[str]
+    render_key: Optional[str]
+    draft: Optional[bool]
+    render_job: Optional[dict]
+    variants: Optional[int]
+    take_paths: Optional[List[str]]
+    next_model: Optional[str]
@@ -45,15 +45,17 @@ def test_comfy_client():
         logger.error(f"✗ Connection failed: {e}")
         return False
     
-    # Test 2: Check fallback list method
-    logger.info("\n--- Test 2: File Listing Fallback ---")
+    # Test 2: Check prefix-based output resolution
+    logger.info("\n--- Test 2: Output Resolution by Prefix ---")
     try:
-        files = client._list_output_files("audio")
-        logger.info(f"✓ List method works, found {len(files)} files")
-        if files:
-            logger.info(f"  Sample files: {files[:3]}")
+        client._output_prefixes["test123"] = ("audio/songbird_test", "songbird_test")
+        result = client._download_by_prefix("test123")
+        if result:
+            logger.info(f"✓ Prefix resolution downloaded: {result}")
+        else:
+            logger.info("✗ Prefix resolution returned None (expected unless audio/songbird_test_00001_.mp3 exists)")
     except Exception as e:
-        logger.error(f"✗ List method failed: {e}")
+        logger.error(f"✗ Prefix resolution failed: {e}")
     
     # Test 3: Try downloading a test file
     logger.info("\n--- Test 3: Download Test ---")
@@ -3,12 +3,15 @@ from unittest.mock import MagicMock, patch
 import json
 import sys
 import os
+import tempfile
 
 # Add parent directory to path to find app.py
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import SongbirdWorkflow
 from state import SongState
+from tools.render_cache import RenderCache
+from tools.metadata import save_metadata
 
 class TestAlbumConsistency(unittest.TestCase):
     def setUp(self):
@@ -91,5 +94,154 @@ class TestAlbumConsistency(unittest.TestCase):
         _, kwargs = self.workflow.comfy.submit_prompt.call_args
         self.assertEqual(kwargs["seed"], 98765)
 
+    def test_node_generate_audio_deferred_only_queues(self):
+        """Test that deferred mode queues the render without waiting for it."""
+        state = {
+            "genre": "ROCK",
+            "musical_direction": {"tags": "Rock", "bpm": 120, "keyscale": "C major"},
+            "cleaned_lyrics": "Test Lyrics",
+            "artist_name": "Songbird",
+            "seed": 98765,
+            "track_number": 2,
+            "song_title": "Second Song",
+            "defer_audio": True
+        }
+        self.workflow.comfy.output_dir = "album"
+        self.workflow.comfy.submit_when_ready.return_value = {"prompt_id": "456"}
+
+        new_state = self.workflow.node_generate_audio(state)
+
+        self.workflow.comfy.submit_prompt.assert_not_called()
+        self.workflow.comfy.wait_and_download_output.assert_not_called()
+        self.assertEqual(new_state["prompt_id"], "456")
+        self.assertEqual(new_state["audio_path"], os.path.join("album", "02_Second_Song.mp3"))
+
+    def test_failed_deferred_render_leaves_no_metadata(self):
+        """Test that a queued render that fails removes the metadata and render job saved at queue time."""
+        with tempfile.TemporaryDirectory() as tmp:
+            state = {
+                "genre": "ROCK",
+                "musical_direction": {"tags": "Rock"},
+                "cleaned_lyrics": "Test Lyrics",
+                "track_number": 2,
+                "song_title": "Second Song",
+                "draft": True,
+                "render_job": {"steps": 50},
+                "audio_path": os.path.join(tmp, "02_Second_Song_draft.mp3"),
+                "prompt_id": "456",
+            }
+            save_metadata(state)
+            self.assertEqual(len(os.listdir(tmp)), 2)
+            self.workflow.comfy.pop_takes.return_value = []
+
+            self.assertIsNone(self.workflow.collect_render(state, "456", None))
+            self.assertIsNone(state["audio_path"])
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_node_generate_audio_reuses_identical_render(self):
+        """Test that identical inputs with a fixed seed reuse the earlier render instead of submitting."""
+        state = {
+            "genre": "ROCK",
+            "musical_direction": {"tags": "Rock", "bpm": 120, "keyscale": "C major"},
+            "cleaned_lyrics": "Test Lyrics",
+            "artist_name": "Songbird",
+            "seed": 98765,
+            "track_number": 1,
+            "song_title": "First Song",
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            self.workflow.render_cache = RenderCache(os.path.join(tmp, "renders.json"))
+            self.workflow.comfy.build_prompt.side_effect = lambda **job: {"3": {"inputs": job}}
+
+            # First run renders and records the result
+            rendered = os.path.join(tmp, "01_First_Song.mp3")
+            with open(rendered, "wb") as f:
+                f.write(b"rendered audio")
+            self.workflow.comfy.submit_prompt.return_value = {"prompt_id": "123"}
+            self.workflow.comfy.wait_and_download_output.return_value = rendered
+            self.workflow.node_generate_audio(dict(state))
+
+            # Re-run of the same track into another album folder
+            self.workflow.comfy.output_dir = os.path.join(tmp, "rerun")
+            new_state = self.workflow.node_generate_audio(dict(state))
+
+            self.workflow.comfy.submit_prompt.assert_called_once()
+            self.assertEqual(new_state["audio_path"], os.path.join(tmp, "rerun", "01_First_Song.mp3"))
+            self.assertTrue(os.path.samefile(new_state["audio_path"], rendered))
+
+    def test_draft_renders_preview_and_promote_rerenders_full_job(self):
+        """Test that a draft renders short and low-step, and promotion re-renders the recorded full job."""
+        state = {
+            "genre": "ROCK",
+            "musical_direction": {"tags": "Rock", "bpm": 120, "keyscale": "C major"},
+            "cleaned_lyrics": "Test Lyrics",
+            "artist_name": "Songbird",
+            "seed": 98765,
+            "track_number": 3,
+            "song_title": "Third Song",
+            "draft": True,
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            self.workflow.render_cache = RenderCache("")
+            self.workflow.comfy.output_dir = tmp
+            downloaded = os.path.join(tmp, "03_Third_Song_draft_00001_.mp3")
+            with open(downloaded, "wb") as f:
+                f.write(b"draft audio")
+            self.workflow.comfy.submit_prompt.return_value = {"prompt_id": "d1"}
+            self.workflow.comfy.wait_and_download_output.return_value = downloaded
+
+            draft_state = self.workflow.node_generate_audio(dict(state))
+            save_metadata(draft_state)
+
+            draft_job = self.workflow.comfy.submit_prompt.call_args[1]
+            full_job = draft_state["render_job"]
+            self.assertEqual(draft_job["steps"], self.workflow.draft_steps)
+            self.assertLessEqual(draft_job["duration"], self.workflow.draft_seconds)
+            self.assertEqual(draft_job["filename_prefix"], "03_Third_Song_draft")
+            self.assertEqual(draft_state["audio_path"], os.path.join(tmp, "03_Third_Song_draft.mp3"))
+            self.assertGreater(full_job["steps"], draft_job["steps"])
+            self.assertEqual({k: v for k, v in draft_job.items() if k not in ("steps", "duration", "filename_prefix")},
+                             {k: v for k, v in full_job.items() if k not in ("steps", "duration", "filename_prefix")})
+
+            # Promote: the saved full job is submitted unchanged and lands beside the draft
+            rendered = os.path.join(tmp, "03_Third_Song_00001_.mp3")
+            with open(rendered, "wb") as f:
+                f.write(b"full audio")
+            self.workflow.comfy.submit_when_ready.return_value = {"prompt_id": "f1"}
+            self.workflow.comfy.await_all.side_effect = lambda ids: iter([("f1", rendered)])
+
+            results = self.workflow.promote_drafts([draft_state["audio_path"]])
+
+            self.workflow.comfy.submit_when_ready.assert_called_once_with(**full_job)
+            promoted = os.path.join(tmp, "03_Third_Song.mp3")
+            self.assertEqual(results, {draft_state["audio_path"]: promoted})
+            self.assertTrue(os.path.exists(os.path.join(tmp, "03_Third_Song_metadata.txt")))
+
+    def test_variants_batch_one_render_and_name_takes(self):
+        """Test that --variants sets the latent batch size and names the extra takes after the song."""
+        state = {
+            "genre": "ROCK",
+            "musical_direction": {"tags": "Rock", "bpm": 120, "keyscale": "C major"},
+            "cleaned_lyrics": "Test Lyrics",
+            "artist_name": "Songbird",
+            "seed": 98765,
+            "track_number": 1,
+            "song_title": "First Song",
+            "variants": 2,
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            takes = [os.path.join(tmp, f"01_First_Song_0000{i}_.mp3") for i in (1, 2)]
+            for take in takes:
+                open(take, "wb").close()
+            self.workflow.comfy.submit_prompt.return_value = {"prompt_id": "v1"}
+            self.workflow.comfy.wait_and_download_output.return_value = takes[0]
+            self.workflow.comfy.pop_takes.return_value = list(takes)
+
+            new_state = self.workflow.node_generate_audio(dict(state))
+
+            self.assertEqual(self.workflow.comfy.submit_prompt.call_args[1]["batch_size"], 2)
+            self.assertEqual(new_state["take_paths"], [os.path.join(tmp, "01_First_Song.mp3"), os.path.join(tmp, "01_First_Song_take2.mp3")])
+            self.assertTrue(all(os.path.exists(p) for p in new_state["take_paths"]))
+
 if __name__ == "__main__":
     unittest.main()
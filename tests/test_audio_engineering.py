@@ -31,6 +31,11 @@ class TestAudioEngineering(unittest.TestCase):
         self.assertEqual(params["cfg"], 1.3)
         self.assertEqual(params["sampler_name"], "dpmpp_2m")
 
+    def test_seeded_parameters_are_reproducible(self):
+        first = calculate_song_parameters("Rock", "same lyrics", seed=42)
+        for _ in range(5):
+            self.assertEqual(calculate_song_parameters("Rock", "same lyrics", seed=42), first)
+
     def test_calculate_song_parameters_sampler(self):
         # Electronic
         params = calculate_song_parameters("Dubstep", "lyrics")
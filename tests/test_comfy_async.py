@@ -0,0 +1,159 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+import sys
+import os
+import asyncio
+import json
+import tempfile
+import threading
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+
+from tools.comfy import ComfyClient
+from tools.comfy_async import AsyncComfyClient
+from tools.comfy_events import ComfyEventListener, ComfyExecutionError
+
+
+class DroppingStream(httpx.AsyncByteStream):
+    """Yields some chunks, then fails like a dropped connection."""
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+        raise httpx.ReadError("connection dropped")
+
+
+class TestAsyncComfyClient(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = AsyncComfyClient(ComfyClient(url="http://mock-url", output_dir=self.tmp.name))
+        listener = ComfyEventListener(self.client.client.ws_url)
+        listener.start = MagicMock()
+        listener.connected.set()
+        listener._attempted.set()
+        self.client.client._events = listener
+        self.listener = listener
+        self.requests = []
+
+    async def asyncTearDown(self):
+        await self.client.http.aclose()
+        self.tmp.cleanup()
+
+    def use_handler(self, handler):
+        def record(request):
+            self.requests.append(request)
+            return handler(request)
+        self.client.http = httpx.AsyncClient(base_url="http://mock-url", transport=httpx.MockTransport(record))
+
+    async def test_concurrent_renders_on_one_event_loop(self):
+        counter = iter(range(100))
+
+        def handler(request):
+            if request.url.path == "/prompt":
+                return httpx.Response(200, json={"prompt_id": f"p{next(counter)}"})
+            if request.url.path == "/view":
+                return httpx.Response(200, content=b"audio-" + request.url.params["filename"].encode())
+            return httpx.Response(404)
+        self.use_handler(handler)
+
+        results = await asyncio.gather(*[
+            self.client.submit_prompt("la", "pop", filename_prefix=f"track{i}") for i in range(20)
+        ])
+        prompt_ids = [r["prompt_id"] for r in results]
+
+        def finish_all():
+            # Completion events arrive on the listener thread in reverse order
+            for pid in reversed(prompt_ids):
+                prefix = self.client.client._output_prefixes[pid][0]
+                filename = prefix.split("/")[1] + "_00001_.mp3"
+                self.listener.complete(pid, {"104": {"audio": [{"filename": filename, "subfolder": "audio", "type": "output"}]}})
+
+        waits = [self.client.wait_and_download_output(pid, timeout=5) for pid in prompt_ids]
+        threading.Timer(0.05, finish_all).start()
+        paths = await asyncio.gather(*waits)
+
+        self.assertEqual([os.path.basename(p) for p in paths], [f"track{i}_00001_.mp3" for i in range(20)])
+        with open(paths[3], "rb") as f:
+            self.assertTrue(f.read().startswith(b"audio-track3_"))
+
+    async def test_execution_error_raises(self):
+        self.use_handler(lambda request: httpx.Response(404))
+        self.listener.fail("bad", {"exception_message": "OOM"})
+        with self.assertRaises(ComfyExecutionError):
+            await self.client.wait_for("bad", timeout=1)
+
+    @patch('tools.comfy_async.asyncio.sleep', new_callable=AsyncMock)
+    async def test_download_resumes_with_range(self, _sleep):
+        data = b"0123456789" * 10
+
+        def handler(request):
+            start = int(request.headers["Range"].split("=")[1].rstrip("-")) if "Range" in request.headers else 0
+            if start == 0:
+                return httpx.Response(200, headers={"Content-Length": str(len(data))}, stream=DroppingStream([data[:40]]))
+            return httpx.Response(206, headers={"Content-Range": f"bytes {start}-{len(data) - 1}/{len(data)}"}, content=data[start:])
+        self.use_handler(handler)
+
+        path = await self.client.download_file("song.mp3", "audio", "output")
+
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(self.requests[1].headers["Range"], "bytes=40-")
+        self.assertFalse(os.path.exists(path + ".part"))
+
+    @patch('tools.comfy_async.asyncio.sleep', new_callable=AsyncMock)
+    async def test_unanswered_submission_is_confirmed_before_retrying(self, _sleep):
+        def handler(request):
+            if request.url.path == "/prompt":
+                raise httpx.ReadTimeout("no answer", request=request)
+            if request.url.path == "/queue":
+                prompt_id = json.loads(self.requests[0].content)["prompt_id"]
+                return httpx.Response(200, json={"queue_running": [], "queue_pending": [[1, prompt_id, {}, {}, []]]})
+            return httpx.Response(404)
+        self.use_handler(handler)
+
+        result = await self.client.submit_prompt("la", "pop", seed=1, filename_prefix="song")
+
+        self.assertEqual([r.url.path for r in self.requests], ["/prompt", "/queue"])
+        self.assertIsNotNone(result)
+        self.assertFalse(self.client.client.needs_confirmation(result["prompt_id"]))
+
+    async def test_large_download_fetches_segments_concurrently(self):
+        data = bytes(range(256)) * 4
+        self.client.client.download_segments = 4
+        self.client.client.parallel_download_min_bytes = 100
+
+        def handler(request):
+            if "Range" not in request.headers:
+                return httpx.Response(200, headers={"Content-Length": str(len(data)), "Accept-Ranges": "bytes"}, content=data)
+            start, end = (int(v) for v in request.headers["Range"].split("=")[1].split("-"))
+            return httpx.Response(206, headers={"Content-Range": f"bytes {start}-{end}/{len(data)}"}, content=data[start:end + 1])
+        self.use_handler(handler)
+
+        path = await self.client.download_file("song.mp3", "audio", "output")
+
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(sorted(r.headers.get("Range") for r in self.requests[1:]),
+                         ["bytes=0-255", "bytes=256-511", "bytes=512-767", "bytes=768-1023"])
+
+    async def test_polling_fallback_without_websocket(self):
+        self.listener.connected.clear()
+        self.client.client.poll_initial = 0.01
+
+        def handler(request):
+            if request.url.path == "/queue":
+                return httpx.Response(200, json={"queue_running": [], "queue_pending": []})
+            return httpx.Response(200, json={"p": {"outputs": {"104": {"audio": []}}}})
+        self.use_handler(handler)
+
+        self.assertEqual(await self.client.wait_for("p", timeout=5), {"104": {"audio": []}})
+        self.assertEqual([r.url.path for r in self.requests], ["/queue", "/history/p"])
+
+
+if __name__ == '__main__':
+    unittest.main()
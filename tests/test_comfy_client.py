@@ -2,32 +2,62 @@ import unittest
 from unittest.mock import MagicMock, patch
 import sys
 import os
+import tempfile
+import time
 
 # Add root to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from tools import comfy
 from tools.comfy import ComfyClient
 
+# Patch the requests module ComfyClient actually uses; other test modules swap sys.modules['requests']
+requests = comfy.requests
+
+
+class FakeResponse:
+    """Minimal streamed requests.Response stand-in."""
+    def __init__(self, status_code, headers, chunks, drop_after=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.chunks = chunks
+        self.drop_after = drop_after
+
+    def iter_content(self, chunk_size=1):
+        for i, chunk in enumerate(self.chunks):
+            yield chunk
+            if self.drop_after is not None and i + 1 >= self.drop_after:
+                raise requests.exceptions.ChunkedEncodingError("connection dropped")
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(str(self.status_code))
+
+    def close(self):
+        pass
+
+
 class TestComfyClient(unittest.TestCase):
     def setUp(self):
         self.client = ComfyClient(url="http://mock-url")
+        patcher = patch('tools.comfy.ComfyClient.delete_history', return_value=True)
+        self.delete_history = patcher.start()
+        self.addCleanup(patcher.stop)
 
-    @patch('requests.post')
+    @patch.object(requests.Session, 'post')
     def test_submit_prompt_timeout(self, mock_post):
         mock_response = MagicMock()
         mock_response.json.return_value = {"prompt_id": "123"}
         mock_post.return_value = mock_response
 
-        # Mock opening the template file
-        with patch('builtins.open', unittest.mock.mock_open(read_data='{"3": {"inputs": {}}}')):
-            self.client.submit_prompt("lyrics", "tags")
+        self.client.submit_prompt("lyrics", "tags")
 
         # Verify timeout is present in kwargs
         args, kwargs = mock_post.call_args
-        self.assertIn('timeout', kwargs, "Timeout missing in requests.post")
-        self.assertEqual(kwargs['timeout'], 120, "Timeout should be set to 120 seconds")
+        self.assertIn('timeout', kwargs, "Timeout missing in session.post")
+        self.assertEqual(kwargs['timeout'][1], 120, "Read timeout should be set to 120 seconds")
 
-    @patch('requests.get')
+    @patch.object(requests.Session, 'get')
     def test_get_history_timeout(self, mock_get):
         mock_response = MagicMock()
         mock_response.json.return_value = {}
@@ -37,27 +67,81 @@ class TestComfyClient(unittest.TestCase):
 
         # Verify timeout is present in kwargs
         args, kwargs = mock_get.call_args
-        self.assertIn('timeout', kwargs, "Timeout missing in requests.get")
-        self.assertEqual(kwargs['timeout'], 120, "Timeout should be set to 120 seconds")
+        self.assertIn('timeout', kwargs, "Timeout missing in session.get")
+        self.assertEqual(kwargs['timeout'][1], 120, "Read timeout should be set to 120 seconds")
 
-    @patch('requests.get')
+    @patch.object(requests.Session, 'get')
     def test_download_file_timeout(self, mock_get):
-        mock_response = MagicMock()
-        mock_response.content = b"data"
-        mock_get.return_value = mock_response
+        mock_get.return_value = FakeResponse(200, {"Content-Length": "4"}, [b"data"])
 
-        # Mock open to avoid writing files
-        with patch('builtins.open', unittest.mock.mock_open()):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.client.output_dir = tmp
             self.client.download_file("test.mp3", "", "output")
 
         # Verify timeout is present in kwargs
         args, kwargs = mock_get.call_args
-        self.assertIn('timeout', kwargs, "Timeout missing in requests.get")
-        self.assertEqual(kwargs['timeout'], 120, "Timeout should be set to 120 seconds")
+        self.assertIn('timeout', kwargs, "Timeout missing in session.get")
+        self.assertEqual(kwargs['timeout'][1], 120, "Read timeout should be set to 120 seconds")
+
+    @patch('time.sleep')
+    @patch.object(requests.Session, 'get')
+    def test_download_resumes_after_dropped_connection(self, mock_get, _sleep):
+        responses = [
+            FakeResponse(200, {"Content-Length": "8"}, [b"abcd"], drop_after=1),
+            FakeResponse(206, {"Content-Range": "bytes 4-7/8"}, [b"efgh"]),
+        ]
+        mock_get.side_effect = lambda *a, **kw: responses.pop(0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            self.client.output_dir = tmp
+            path = self.client.download_file("song.mp3", "audio", "output")
+
+            self.assertEqual(path, os.path.join(tmp, "song.mp3"))
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"abcdefgh")
+            self.assertFalse(os.path.exists(path + ".part"))
+
+        self.assertEqual(mock_get.call_args_list[1][1]["headers"], {"Range": "bytes=4-"})
+        self.assertTrue(mock_get.call_args_list[0][1]["stream"])
+
+    @patch('time.sleep')
+    @patch.object(requests.Session, 'get')
+    def test_download_rejects_short_body(self, mock_get, _sleep):
+        mock_get.side_effect = lambda *a, **kw: FakeResponse(200, {"Content-Length": "10"}, [b"abc"])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            self.client.output_dir = tmp
+            self.assertIsNone(self.client.download_file("song.mp3", "audio", "output", retries=1))
+            self.assertEqual(os.listdir(tmp), [])
+
+    @patch.object(requests.Session, 'get')
+    def test_download_large_file_in_parallel_segments(self, mock_get):
+        data = bytes(range(256)) * 40
 
+        def fake_get(url, params=None, headers=None, **kwargs):
+            range_header = (headers or {}).get("Range")
+            if not range_header:
+                return FakeResponse(200, {"Content-Length": str(len(data)), "Accept-Ranges": "bytes"}, [data])
+            start, end = (int(x) for x in range_header.split("=")[1].split("-"))
+            return FakeResponse(206, {"Content-Range": f"bytes {start}-{end}/{len(data)}"}, [data[start:end + 1]])
+
+        mock_get.side_effect = fake_get
+        self.client.download_segments = 3
+        self.client.parallel_download_min_bytes = 1024
+
+        with tempfile.TemporaryDirectory() as tmp:
+            self.client.output_dir = tmp
+            path = self.client.download_file("big.mp3", "audio", "output")
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), data)
+
+        ranges = [c[1]["headers"].get("Range") for c in mock_get.call_args_list if c[1].get("headers")]
+        self.assertEqual(len(ranges), 3)
+
+    @patch('tools.comfy.ComfyClient.queued_prompt_ids', return_value=set())
     @patch('tools.comfy.ComfyClient.get_history')
     @patch('tools.comfy.ComfyClient.download_file')
-    def test_wait_and_download_output_robust(self, mock_download, mock_get_history):
+    def test_wait_and_download_output_robust(self, mock_download, mock_get_history, _queued):
         # Scenario: Node 104 is missing, but Node 200 has audio files
         prompt_id = "abc"
         mock_get_history.return_value = {
@@ -74,7 +158,249 @@ class TestComfyClient(unittest.TestCase):
         result = self.client.wait_and_download_output(prompt_id)
 
         self.assertEqual(result, "output/robust_output.mp3")
-        mock_download.assert_called_once_with("robust_output.mp3", "", "output")
+        mock_download.assert_called_once_with("robust_output.mp3", "", "output", local_name=None)
+        self.delete_history.assert_called_once_with(["abc"])
+
+    @patch('time.sleep')
+    @patch('tools.comfy.ComfyClient.submit_prompt')
+    @patch('tools.comfy.ComfyClient.queue_depth')
+    def test_submit_batch_respects_max_pending(self, mock_depth, mock_submit, _sleep):
+        # Queue is full twice before the second job may be submitted
+        mock_depth.side_effect = [0, 2, 2, 1]
+        mock_submit.side_effect = [{"prompt_id": "p1"}, {"prompt_id": "p2"}]
+        self.client._events = MagicMock()
+
+        ids = self.client.submit_batch([{"lyrics": "a", "tags": "x"}, {"lyrics": "b", "tags": "y"}], max_pending=2)
+
+        self.assertEqual(ids, ["p1", "p2"])
+        self.assertEqual(mock_depth.call_count, 4)
+        self.client._events.watch.assert_any_call("p1")
+
+    @patch('tools.comfy.ComfyClient.download_outputs')
+    def test_await_all_yields_in_completion_order(self, mock_download):
+        from tools.comfy_events import ComfyEventListener
+        listener = ComfyEventListener(self.client.ws_url)
+        listener.start = MagicMock()
+        listener.wait_connected = MagicMock(return_value=True)
+        self.client._events = listener
+        mock_download.side_effect = lambda pid, outputs: f"{pid}.mp3"
+
+        listener.complete("second")
+        results = self.client.await_all(["first", "second", "third"], timeout=1)
+        self.assertEqual(next(results), ("second", "second.mp3"))
+        listener.fail("third", {"exception_message": "boom"})
+        listener.complete("first")
+        remaining = dict(results)
+        self.assertEqual(remaining, {"first": "first.mp3", "third": None})
+
+    @patch('tools.comfy.ComfyClient._abandon')
+    @patch('tools.comfy.ComfyClient.download_outputs')
+    def test_await_all_timeout_only_covers_rendering(self, mock_download, mock_abandon):
+        from tools.comfy_events import ComfyEventListener
+        listener = ComfyEventListener(self.client.ws_url)
+        listener.start = MagicMock()
+        listener.wait_connected = MagicMock(return_value=True)
+        self.client._events = listener
+
+        def slow_download(pid, outputs):
+            # "b" finishes in time while "a" is still downloading past the deadline
+            if pid == "a":
+                listener.complete("b")
+                time.sleep(0.3)
+            return f"{pid}.mp3"
+        mock_download.side_effect = slow_download
+
+        listener.complete("a")
+        results = dict(self.client.await_all(["a", "b", "c"], timeout=0.2))
+
+        self.assertEqual(results, {"a": "a.mp3", "b": "b.mp3", "c": None})
+        mock_abandon.assert_called_once_with("c")
+
+    @patch('time.sleep')
+    @patch('tools.comfy.ComfyClient.get_history')
+    @patch('tools.comfy.ComfyClient.get_queue')
+    def test_polling_fallback_batches_queue_checks(self, mock_queue, mock_get_history, _sleep):
+        from tools.comfy_events import ComfyEventListener
+        listener = ComfyEventListener(self.client.ws_url)
+        listener.start = MagicMock()
+        listener.wait_connected = MagicMock(return_value=False)
+        self.client._events = listener
+
+        # Round 1: both still queued. Round 2: "a" has left the queue. Round 3: "b" too.
+        mock_queue.side_effect = [
+            {"queue_running": [[0, "a", {}, {}, []]], "queue_pending": [[1, "b", {}, {}, []]]},
+            {"queue_running": [[1, "b", {}, {}, []]], "queue_pending": []},
+            {"queue_running": [], "queue_pending": []},
+        ]
+        mock_get_history.side_effect = lambda pid: {pid: {"outputs": {"104": {"audio": [{"filename": f"{pid}.mp3"}]}}}}
+
+        with patch.object(ComfyClient, 'download_file', side_effect=lambda name, sub, kind, local_name=None: name):
+            results = dict(self.client.await_all(["a", "b"], timeout=5))
+
+        self.assertEqual(results, {"a": "a.mp3", "b": "b.mp3"})
+        self.assertEqual(mock_queue.call_count, 3)
+        # History is only fetched once a prompt has left the queue
+        self.assertEqual([c[0][0] for c in mock_get_history.call_args_list], ["a", "b"])
+
+    @patch('tools.comfy.ComfyClient.get_history')
+    @patch('tools.comfy.ComfyClient.queued_prompt_ids', return_value=set())
+    def test_polling_fallback_surfaces_history_errors(self, _queued, mock_get_history):
+        from tools.comfy_events import ComfyEventListener, ComfyExecutionError
+        listener = ComfyEventListener(self.client.ws_url)
+        listener.start = MagicMock()
+        listener.wait_connected = MagicMock(return_value=False)
+        self.client._events = listener
+        mock_get_history.return_value = {"e": {"outputs": {}, "status": {
+            "status_str": "error",
+            "messages": [["execution_error", {"exception_message": "CUDA out of memory"}]],
+        }}}
+
+        with self.assertRaisesRegex(ComfyExecutionError, "CUDA out of memory"):
+            self.client.wait_for("e", timeout=5)
+
+    def test_poll_delay_follows_expected_render_time(self):
+        self.client.poll_initial, self.client.poll_max = 0.5, 30
+        # Unknown render time: fast start, exponential backoff, capped
+        self.assertLessEqual(self.client.poll_delay(0, 0), 0.5)
+        self.assertGreaterEqual(self.client.poll_delay(3, 0), 2.0)
+        self.assertLessEqual(self.client.poll_delay(20, 0), 30)
+        # Known render time: sleep through most of it, then poll quickly near the end
+        self.client.avg_render_seconds = 60
+        self.assertGreaterEqual(self.client.poll_delay(0, 0), 15)
+        self.assertLessEqual(self.client.poll_delay(0, 59), 0.5)
+
+    @patch('tools.comfy.ComfyClient.download_file')
+    def test_output_resolved_by_unique_job_prefix(self, mock_download):
+        with patch.object(requests.Session, 'post') as mock_post:
+            mock_post.return_value.json.return_value = {"prompt_id": "p1"}
+            self.client.submit_prompt("la", "pop", filename_prefix="01_Song")
+            saved_prefix = mock_post.call_args[1]["json"]["prompt"]["104"]["inputs"]["filename_prefix"]
+
+        self.assertRegex(saved_prefix, r"^audio/01_Song_[0-9a-f]{12}$")
+        job_file = f"{saved_prefix.split('/')[1]}_00001_.mp3"
+        outputs = {
+            "104": {"audio": [{"filename": "someone_else_00001_.mp3", "subfolder": "audio", "type": "output"},
+                              {"filename": job_file, "subfolder": "audio", "type": "output"}]}
+        }
+        self.client.download_outputs("p1", outputs)
+        mock_download.assert_called_once_with(job_file, "audio", "output", local_name="01_Song_00001_.mp3")
+
+    @patch('tools.comfy.ComfyClient.get_history', return_value=None)
+    @patch('tools.comfy.ComfyClient.download_file')
+    def test_missing_history_downloads_exactly_the_prefixed_file(self, mock_download, _history):
+        self.client._output_prefixes["p2"] = ("audio/Artist_song_0123456789ab", "Artist_song")
+        mock_download.return_value = "output/Artist_song_00001_.mp3"
+
+        self.assertEqual(self.client.download_outputs("p2", {}), "output/Artist_song_00001_.mp3")
+        mock_download.assert_called_once_with(
+            "Artist_song_0123456789ab_00001_.mp3", "audio", "output", local_name="Artist_song_00001_.mp3"
+        )
+
+    @patch('tools.comfy.ComfyClient.get_history', return_value=None)
+    @patch('tools.comfy.ComfyClient.download_file')
+    def test_batched_prompt_downloads_every_take(self, mock_download, _history):
+        mock_download.side_effect = lambda filename, *a, local_name=None: f"output/{local_name}"
+        self.client._remember_prefix({"prompt_id": "p3"}, "Song_0123456789ab", "Song", batch_size=3)
+
+        self.assertEqual(self.client.download_outputs("p3", {}), "output/Song_00001_.mp3")
+        self.assertEqual(self.client.pop_takes("p3"), [f"output/Song_0000{i}_.mp3" for i in (1, 2, 3)])
+        self.assertEqual(sorted(c[0][0] for c in mock_download.call_args_list),
+                         [f"Song_0123456789ab_0000{i}_.mp3" for i in (1, 2, 3)])
+        self.delete_history.assert_called_once_with(["p3"])
+        self.assertEqual(self.client.pop_takes("p3"), [])
+
+    @patch('tools.comfy.ComfyClient.get_history', return_value=None)
+    @patch('tools.comfy.ComfyClient.download_file')
+    def test_unknown_prompt_is_not_guessed(self, mock_download, _history):
+        self.assertIsNone(self.client.download_outputs("unknown", {}))
+        mock_download.assert_not_called()
+
+    @patch.object(requests.Session, 'get')
+    def test_shared_output_dir_links_instead_of_downloading(self, mock_get):
+        with tempfile.TemporaryDirectory() as shared, tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(shared, "audio"))
+            source = os.path.join(shared, "audio", "song_00001_.mp3")
+            with open(source, "wb") as f:
+                f.write(b"mp3 bytes")
+            self.client.shared_output_dirs = [shared]
+            self.client.output_dir = tmp
+
+            before = comfy.metrics.snapshot()["counters"].get("comfy.shared_output.hardlink", 0)
+            path = self.client.download_file("song_00001_.mp3", "audio", "output", local_name="song.mp3")
+
+            self.assertEqual(path, os.path.join(tmp, "song.mp3"))
+            self.assertTrue(os.path.samefile(path, source))
+            mock_get.assert_not_called()
+            self.assertEqual(comfy.metrics.snapshot()["counters"]["comfy.shared_output.hardlink"], before + 1)
+
+            # move mode takes the file out of ComfyUI's output directory
+            self.client.shared_output_move = True
+            path = self.client.download_file("song_00001_.mp3", "audio", "output", local_name="moved.mp3")
+            self.assertFalse(os.path.exists(source))
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"mp3 bytes")
+
+    @patch.object(requests.Session, 'get')
+    def test_shared_output_dir_falls_back_to_http(self, mock_get):
+        mock_get.side_effect = lambda *a, **kw: FakeResponse(200, {"Content-Length": "4"}, [b"http"])
+        with tempfile.TemporaryDirectory() as shared, tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "secret.mp3"), "wb") as f:
+                f.write(b"not comfy output")
+            self.client.shared_output_dirs = [shared]
+            self.client.output_dir = tmp
+
+            # Not visible locally, and names escaping the mapped directory are ignored
+            self.assertIsNone(self.client._shared_output_path("missing.mp3", "audio"))
+            self.assertIsNone(self.client._shared_output_path("secret.mp3", os.path.relpath(tmp, shared)))
+            path = self.client.download_file("missing.mp3", "audio", "output")
+
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"http")
+            self.assertEqual(mock_get.call_count, 1)
+
+    @patch('tools.comfy.ComfyClient.download_file', return_value=None)
+    @patch('tools.comfy.ComfyClient.wait_for', return_value=None)
+    @patch('tools.comfy.ComfyClient.get_queue')
+    def test_timeout_cancels_abandoned_prompt(self, mock_queue, _wait, mock_download):
+        mock_queue.return_value = {"queue_running": [[1, "run", {}, {}, []]], "queue_pending": [[2, "wait", {}, {}, []]]}
+        before = comfy.metrics.snapshot()["counters"].get("comfy.cancelled", 0)
+        with patch.object(requests.Session, 'post') as mock_post:
+            self.assertIsNone(self.client.wait_and_download_output("run", timeout=1))
+            self.assertIsNone(self.client.wait_and_download_output("wait", timeout=1))
+        self.assertEqual(comfy.metrics.snapshot()["counters"]["comfy.cancelled"], before + 2)
+
+        calls = [(c[0][0].rsplit("/", 1)[1], c[1]["json"]) for c in mock_post.call_args_list]
+        self.assertEqual(calls, [("interrupt", {"prompt_id": "run"}), ("queue", {"delete": ["wait"]})])
+        # Nothing to download for a prompt that never finished
+        mock_download.assert_not_called()
+        self.delete_history.assert_not_called()
+
+    @patch('tools.comfy.ComfyClient.get_all_history')
+    @patch('tools.comfy.ComfyClient.get_queue')
+    def test_cleanup_orphans_only_touches_songbird_jobs(self, mock_queue, mock_history):
+        ours, theirs = {"songbird_job": "x_0123456789ab", "client_id": "a"}, {"client_id": "b"}
+        mock_queue.return_value = {
+            "queue_running": [[1, "r1", {}, ours, []]],
+            "queue_pending": [[2, "p1", {}, ours, []], [3, "p2", {}, theirs, []]],
+        }
+        mock_history.return_value = {"h1": {"prompt": [0, "h1", {}, ours, []]}, "h2": {"prompt": [0, "h2", {}, theirs, []]}}
+        with patch.object(requests.Session, 'post') as mock_post:
+            self.assertEqual(self.client.cleanup_orphans(), {"cancelled": 2, "pruned": 1})
+
+        self.assertEqual([c[1]["json"] for c in mock_post.call_args_list], [{"delete": ["p1"]}, {"prompt_id": "r1"}])
+        self.delete_history.assert_called_once_with(["h1"])
+
+    def test_session_is_pooled_and_reused(self):
+        adapter = self.client.session.get_adapter("http://mock-url/prompt")
+        self.assertEqual(adapter._pool_maxsize, self.client.pool_size)
+        self.assertEqual(adapter.max_retries.total, self.client.max_retries)
+        self.assertNotIn("POST", adapter.max_retries.allowed_methods)
+
+        with patch.object(requests.Session, 'get') as mock_get:
+            mock_get.return_value.json.return_value = {}
+            self.client.get_history("1")
+            self.client.get_history("2")
+        self.assertEqual(mock_get.call_count, 2)
 
 if __name__ == '__main__':
     unittest.main()
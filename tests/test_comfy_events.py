@@ -0,0 +1,144 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+import json
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools.comfy_events import ComfyEventListener, ComfyExecutionError, format_progress
+from tools.comfy import ComfyClient
+
+
+def event(msg_type, **data):
+    return json.dumps({"type": msg_type, "data": data})
+
+
+class TestComfyEventListener(unittest.TestCase):
+    def setUp(self):
+        self.listener = ComfyEventListener("ws://mock-url/ws?clientId=test")
+        # Never open a real socket
+        self.listener.start = MagicMock()
+
+    def test_routes_events_to_many_prompts(self):
+        futures = {pid: self.listener.watch(pid) for pid in ("a", "b", "c")}
+
+        self.listener._dispatch(event("executing", node="3", prompt_id="b"))
+        self.listener._dispatch(event("executed", node="104", prompt_id="b", output={"audio": [{"filename": "b.mp3"}]}))
+        self.listener._dispatch(event("executing", node=None, prompt_id="b"))
+        self.listener._dispatch(event("execution_error", prompt_id="c", exception_message="OOM"))
+
+        self.assertEqual(futures["b"].result(timeout=1), {"104": {"audio": [{"filename": "b.mp3"}]}})
+        with self.assertRaises(ComfyExecutionError):
+            futures["c"].result(timeout=1)
+        self.assertFalse(futures["a"].done())
+        self.assertEqual(self.listener.pending(), ["a"])
+
+    def test_watch_after_completion_resolves_immediately(self):
+        self.listener._dispatch(event("execution_success", prompt_id="done"))
+        self.assertEqual(self.listener.watch("done").result(timeout=1), {})
+
+    def test_ignores_status_broadcasts(self):
+        self.listener._dispatch(json.dumps({"type": "status", "data": {"status": {"exec_info": {"queue_remaining": 2}}}}))
+        self.listener._dispatch("not json")
+        self.assertEqual(self.listener.pending(), [])
+
+
+class TestProgressEvents(unittest.TestCase):
+    def setUp(self):
+        self.listener = ComfyEventListener("ws://mock-url/ws?clientId=test")
+        self.listener.start = MagicMock()
+        self.events = []
+        self.listener.add_progress_callback(self.events.append)
+
+    @patch('tools.comfy_events.time.time')
+    def test_step_rate_and_eta(self, mock_time):
+        mock_time.return_value = 100.0
+        self.listener._dispatch(event("execution_start", prompt_id="p"))
+        self.listener._dispatch(event("execution_cached", prompt_id="p", nodes=["94", "97"]))
+        self.listener._dispatch(event("executing", node="3", prompt_id="p"))
+        self.listener._dispatch(event("progress", node="3", prompt_id="p", value=1, max=50))
+        mock_time.return_value = 110.0
+        self.listener._dispatch(event("progress", node="3", prompt_id="p", value=21, max=50))
+
+        latest = self.listener.progress("p")
+        self.assertEqual(latest["steps_per_second"], 2.0)
+        self.assertEqual(latest["eta_seconds"], 14.5)
+        self.assertEqual(latest["cached_nodes"], ["94", "97"])
+        self.assertEqual([e["type"] for e in self.events],
+                         ["execution_start", "execution_cached", "executing", "progress", "progress"])
+        self.assertIn("21/50 (2.0 it/s, ETA 14s) [2 cached]", format_progress(latest))
+
+    def test_progress_without_prompt_id_uses_executing_prompt(self):
+        self.listener._dispatch(event("executing", node="3", prompt_id="p"))
+        self.listener._dispatch(event("progress", node="3", value=5, max=50))
+        self.listener._dispatch(event("executing", node=None, prompt_id="p"))
+
+        self.assertEqual(self.events[1]["value"], 5)
+        self.assertEqual(self.events[-1]["type"], "completed")
+
+    def test_callback_errors_do_not_break_dispatch(self):
+        self.listener.add_progress_callback(MagicMock(side_effect=RuntimeError("boom")))
+        future = self.listener.watch("p")
+        self.listener._dispatch(event("executing", node="3", prompt_id="p"))
+        self.listener._dispatch(event("execution_success", prompt_id="p"))
+        self.assertEqual(future.result(timeout=1), {})
+
+
+class TestComfyClientWaitFor(unittest.TestCase):
+    def setUp(self):
+        self.client = ComfyClient(url="http://mock-url")
+        self.listener = ComfyEventListener(self.client.ws_url)
+        self.listener.start = MagicMock()
+        self.listener.wait_connected = MagicMock(return_value=True)
+        self.client._events = self.listener
+        patcher = patch('tools.comfy.ComfyClient.delete_history', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('tools.comfy.ComfyClient.download_file')
+    @patch('tools.comfy.ComfyClient.get_history')
+    def test_outputs_from_websocket_skip_history(self, mock_get_history, mock_download):
+        self.listener._dispatch(event("executed", node="104", prompt_id="p1", output={"audio": [{"filename": "p1.mp3", "subfolder": "audio", "type": "output"}]}))
+        self.listener._dispatch(event("executing", node=None, prompt_id="p1"))
+        mock_download.return_value = "output/p1.mp3"
+
+        self.assertEqual(self.client.wait_and_download_output("p1"), "output/p1.mp3")
+        mock_get_history.assert_not_called()
+        mock_download.assert_called_once_with("p1.mp3", "audio", "output", local_name=None)
+
+    @patch('tools.comfy.ComfyClient._download_by_prefix')
+    def test_execution_error_does_not_fall_back(self, mock_fallback):
+        self.listener._dispatch(event("execution_error", prompt_id="p2", exception_message="boom"))
+        self.assertIsNone(self.client.wait_and_download_output("p2"))
+        mock_fallback.assert_not_called()
+
+    @patch('tools.comfy.ComfyClient.queued_prompt_ids', return_value=set())
+    @patch('tools.comfy.ComfyClient.get_history')
+    def test_reconnect_recovers_missed_completion(self, mock_get_history, _queued):
+        future = self.listener.watch("p3")
+        mock_get_history.return_value = {"p3": {"outputs": {"104": {"audio": []}}}}
+        self.client._recover_missed_events(self.listener.pending())
+        self.assertEqual(future.result(timeout=1), {"104": {"audio": []}})
+
+    @patch('tools.comfy.metrics')
+    def test_completed_render_updates_step_rate_and_metrics(self, mock_metrics):
+        self.client._record_progress({"type": "completed", "prompt_id": "p", "elapsed_seconds": 30,
+                                      "max": 50, "steps_per_second": 2.5, "cached_nodes": ["94"]})
+        self.assertEqual(self.client.steps_per_second, 2.5)
+        mock_metrics.record.assert_called_once()
+        self.assertEqual(mock_metrics.record.call_args[0][0], "comfy.render_complete")
+
+    @patch('tools.comfy.ComfyClient.queued_prompt_ids', return_value={"stuck"})
+    def test_warns_when_render_stalls(self, _queued):
+        self.client.stall_warning = 4
+        self.listener._dispatch(event("progress", node="3", prompt_id="stuck", value=3, max=50))
+        self.listener._progress["stuck"]["updated_at"] -= 60
+        with self.assertLogs(level="WARNING") as logs:
+            self.assertIsNone(self.client.wait_for("stuck", timeout=1.5))
+        self.assertTrue(any("no progress for" in line for line in logs.output))
+
+
+if __name__ == '__main__':
+    unittest.main()
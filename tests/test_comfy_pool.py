@@ -0,0 +1,106 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools import comfy_events
+from tools.comfy_pool import ComfyPool, comfy_urls_from_env
+
+
+class TestComfyPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = ComfyPool(["http://gpu-a", "http://gpu-b", "http://gpu-c"], output_dir="output")
+        for node in self.pool.nodes:
+            node.queue_depth = MagicMock(return_value=0)
+            node.submit_prompt = MagicMock(return_value={"prompt_id": f"{node.url[-1]}-1"})
+            node._events = MagicMock()
+        self.a, self.b, self.c = self.pool.nodes
+
+    def test_routes_to_shortest_queue(self):
+        self.a.queue_depth.return_value = 2
+        self.b.queue_depth.return_value = 0
+        self.c.queue_depth.return_value = 1
+
+        result = self.pool.submit_when_ready(lyrics="la", tags="pop", max_pending=5)
+
+        self.assertEqual(result["prompt_id"], "b-1")
+        self.a.submit_prompt.assert_not_called()
+        self.assertIs(self.pool.node_for("b-1"), self.b)
+
+    def test_prefers_faster_node_by_predicted_finish(self):
+        self.pool._avg_render[self.a.url] = 100.0
+        self.pool._avg_render[self.b.url] = 300.0
+        self.pool._avg_render[self.c.url] = 300.0
+        self.a.queue_depth.return_value = 1  # (1+1) * 100 = 200 < (0+1) * 300
+
+        self.assertEqual(self.pool.submit_when_ready(lyrics="la", tags="pop", max_pending=5)["prompt_id"], "a-1")
+
+    def test_render_time_is_measured_from_execution_start(self):
+        pool = ComfyPool(["http://gpu-a"], output_dir="output")
+        node = pool.nodes[0]
+        pool._owners["p-1"] = node
+        clock = MagicMock()
+        # Queued at t=0 behind other work; execution starts at t=500 and finishes at t=530
+        clock.time.side_effect = [500.0, 500.0, 530.0]
+        with patch.object(comfy_events, "time", clock):
+            node.events._dispatch('{"type": "execution_start", "data": {"prompt_id": "p-1"}}')
+            node.events._dispatch('{"type": "execution_success", "data": {"prompt_id": "p-1"}}')
+
+        pool._record_completion("p-1")
+        self.assertEqual(pool.predicted_render_seconds(node), 30.0)
+
+    def test_completion_without_events_leaves_average_alone(self):
+        self.pool._owners["a-1"] = self.a
+        self.pool._record_completion("a-1")
+        self.assertIsNone(self.pool._avg_render[self.a.url])
+
+    def test_unreachable_node_leaves_rotation(self):
+        self.a.queue_depth.return_value = None
+        self.pool.submit_when_ready(lyrics="la", tags="pop")
+        self.pool.submit_when_ready(lyrics="la", tags="pop")
+
+        # Only probed once, then skipped during the cooldown
+        self.assertEqual(self.a.queue_depth.call_count, 1)
+        self.a.submit_prompt.assert_not_called()
+
+    def test_failed_submit_falls_through_to_next_node(self):
+        self.b.queue_depth.return_value = 1
+        self.c.queue_depth.return_value = 1
+        self.a.submit_prompt.return_value = None
+
+        result = self.pool.submit_when_ready(lyrics="la", tags="pop", max_pending=5)
+
+        self.assertIn(result["prompt_id"], ("b-1", "c-1"))
+        self.assertNotIn(self.a, self.pool.healthy_nodes())
+
+    def test_download_pinned_to_rendering_node(self):
+        self.c.queue_depth.return_value = 0
+        self.a.queue_depth.return_value = 3
+        self.b.queue_depth.return_value = 3
+        self.pool.submit_when_ready(lyrics="la", tags="pop", max_pending=5)
+        self.c.wait_and_download_output = MagicMock(return_value="output/c.mp3")
+
+        self.assertEqual(self.pool.wait_and_download_output("c-1"), "output/c.mp3")
+        self.c.wait_and_download_output.assert_called_once_with("c-1", 1200)
+
+    def test_await_all_merges_nodes(self):
+        self.pool._owners = {"a-1": self.a, "b-1": self.b}
+        self.a.await_all = MagicMock(return_value=iter([("a-1", "a.mp3")]))
+        self.b.await_all = MagicMock(return_value=iter([("b-1", None)]))
+
+        self.assertEqual(dict(self.pool.await_all(["a-1", "b-1"])), {"a-1": "a.mp3", "b-1": None})
+
+    def test_output_dir_propagates(self):
+        self.pool.output_dir = "album"
+        self.assertTrue(all(node.output_dir == "album" for node in self.pool.nodes))
+
+    @patch.dict(os.environ, {"COMFYUI_URLS": "http://a:8188, http://b:8188"})
+    def test_urls_from_env(self):
+        self.assertEqual(comfy_urls_from_env(), ["http://a:8188", "http://b:8188"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,255 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+import time
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import requests
+
+from tools.comfy import ComfyClient
+from tools.fake_comfy import FakeComfyServer, synthetic_mp3
+from tools.render_journal import RenderJournal
+from tools.metrics import metrics
+
+
+class TestFakeComfyServer(unittest.TestCase):
+    """Runs the real ComfyClient end to end against the local stand-in server."""
+
+    def start_server(self, **kwargs):
+        server = FakeComfyServer(render_seconds=0.2, audio_bytes=64 * 1024, seed=1, **kwargs).start()
+        self.addCleanup(server.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        client = ComfyClient(url=server.url, output_dir=tmp.name)
+        client.poll_initial = 0.05
+        self.addCleanup(client.close)
+        return server, client
+
+    def submit(self, client, name="song"):
+        result = client.submit_prompt("la la", "pop", duration=10, steps=4, filename_prefix=name)
+        self.assertIsNotNone(result)
+        return result["prompt_id"]
+
+    def test_render_and_download_over_websocket(self):
+        server, client = self.start_server()
+        events = []
+        client.add_progress_callback(events.append)
+        # Connect before submitting, as ComfyUI only streams events to connected clients
+        self.assertTrue(client.events.wait_connected(5))
+
+        path = client.wait_and_download_output(self.submit(client), timeout=10)
+
+        self.assertEqual(os.path.basename(path), "song_00001_.mp3")
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), synthetic_mp3(64 * 1024))
+        self.assertIn("progress", [e["type"] for e in events])
+        self.assertEqual(server.request_counts["GET /history/{id}"], 0)
+
+    def test_variants_render_in_one_batch(self):
+        server, client = self.start_server()
+        result = client.submit_prompt("la la", "pop", duration=10, steps=4, filename_prefix="song", batch_size=3)
+
+        path = client.wait_and_download_output(result["prompt_id"], timeout=10)
+
+        takes = client.pop_takes(result["prompt_id"])
+        self.assertEqual(takes[0], path)
+        self.assertEqual([os.path.basename(p) for p in takes], [f"song_0000{i}_.mp3" for i in (1, 2, 3)])
+        self.assertEqual(server.request_counts["POST /prompt"], 1)
+
+    def test_renders_sharing_a_prefix_keep_their_own_files(self):
+        _, client = self.start_server()
+        paths = []
+        for seed in (1, 2):
+            result = client.submit_prompt("la la", "pop", duration=10, steps=4, filename_prefix="Songbird_song", seed=seed)
+            paths.append(client.wait_and_download_output(result["prompt_id"], timeout=10))
+
+        self.assertEqual([os.path.basename(p) for p in paths], ["Songbird_song_00001_.mp3", "Songbird_song_00002_.mp3"])
+        self.assertTrue(all(os.path.exists(p) for p in paths))
+        self.assertEqual(sorted(os.listdir(client.output_dir)), ["Songbird_song_00001_.mp3", "Songbird_song_00002_.mp3"])
+
+    def test_shared_conditioning_is_reported_cached(self):
+        _, client = self.start_server()
+        common = dict(tags="synthwave, dreamy", negative_prompt="male vocals", duration=10, steps=4)
+        first = client.submit_prompt("track one", seed=1, **common)["prompt_id"]
+        client.wait_for(first, timeout=10)
+
+        before = metrics.snapshot()["counters"].get("comfy.cached_nodes", 0)
+        with self.assertLogs(level="INFO") as logs:
+            second = client.submit_prompt("track two", seed=2, **common)["prompt_id"]
+            client.wait_for(second, timeout=10)
+
+        cached = set(client.events.progress(second)["cached_nodes"])
+        self.assertEqual(metrics.snapshot()["counters"]["comfy.cached_nodes"], before + len(cached))
+        self.assertTrue({"7", "78", "97"} <= cached)
+        self.assertFalse({"3", "94"} & cached)
+        self.assertTrue(any("reused cached nodes" in line for line in logs.output))
+
+    def test_content_encoder_seed_reuses_text_encoding(self):
+        _, client = self.start_server(ws_enabled=False)
+        client.encoder_seed_mode = "content"
+        first = client.submit_prompt("same lyrics", "pop", duration=10, steps=4, seed=1)["prompt_id"]
+        client.wait_for(first, timeout=10)
+
+        with self.assertLogs(level="INFO") as logs:
+            second = client.submit_prompt("same lyrics ", "pop", duration=10, steps=4, seed=2)["prompt_id"]
+            client.wait_for(second, timeout=10)
+
+        reused = [line for line in logs.output if "reused cached nodes" in line]
+        self.assertEqual(len(reused), 1)
+        cached = reused[0].split("cached nodes ")[1].split(", ")
+        self.assertIn("94", cached)
+        self.assertNotIn("3", cached)
+
+    def test_warm_up_is_invisible_and_skipped_when_busy(self):
+        server, client = self.start_server()
+        events = []
+        client.add_progress_callback(events.append)
+
+        self.assertTrue(client.warm_up(timeout=10))
+        self.assertEqual(events, [])
+        self.assertIsNone(client.avg_render_seconds)
+        self.assertEqual(server.history, {})
+
+        busy, busy_client = self.start_server(backlog=1)
+        self.assertFalse(busy_client.warm_up(timeout=10))
+        self.assertEqual(busy.request_counts["POST /prompt"], 0)
+
+    def test_warm_up_output_is_removed_from_a_mounted_output_dir(self):
+        with tempfile.TemporaryDirectory() as mount:
+            _, client = self.start_server(output_dir=mount)
+            client.shared_output_dirs = [mount]
+            self.assertTrue(client.warm_up(timeout=10))
+            leftovers = [name for _, _, names in os.walk(mount) for name in names]
+            self.assertEqual(leftovers, [])
+
+    def test_lost_submit_response_is_not_rendered_twice(self):
+        server, client = self.start_server(lost_response_rate=1.0)
+        client.backoff_factor = 0
+
+        with self.assertLogs(level="INFO") as logs:
+            result = client.submit_prompt("la la", "pop", duration=10, steps=4, seed=3, filename_prefix="song")
+        self.assertIsNotNone(result)
+        self.assertTrue(any("already queued" in line for line in logs.output))
+        self.assertEqual(server.request_counts["POST /prompt"], 1)
+
+        path = client.wait_and_download_output(result["prompt_id"], timeout=10)
+        self.assertEqual(os.path.basename(path), "song_00001_.mp3")
+
+        # The same job submitted again keeps its key
+        again = client.prepare_submission("la la", "pop", duration=10, steps=4, seed=3, filename_prefix="song")
+        self.assertEqual(again[1], result["prompt_id"])
+
+    def test_restart_reattaches_to_journaled_renders(self):
+        server, client = self.start_server()
+        server.render_seconds = 1
+        journal = RenderJournal(os.path.join(client.output_dir, "journal.json"))
+        client.journal = journal
+        running = self.submit(client, "track1")
+        queued = self.submit(client, "track2")
+        journal.annotate(running, track_number=1)
+        journal.add("gone", url=server.url, job_prefix="x", filename_prefix="x", output_dir=client.output_dir)
+        client.close()
+
+        # While the submitting process is alive, another run leaves its renders alone
+        concurrent = ComfyClient(url=server.url, output_dir=client.output_dir, journal=RenderJournal(journal.journal_file))
+        self.addCleanup(concurrent.close)
+        self.assertEqual(concurrent.reattach(), {})
+
+        # Once it has died without collecting anything, a restart picks them up
+        restarted = ComfyClient(url=server.url, output_dir=client.output_dir, journal=RenderJournal(journal.journal_file))
+        self.addCleanup(restarted.close)
+        with patch("tools.render_journal._process_alive", return_value=False):
+            reattached = restarted.reattach()
+
+        self.assertEqual(set(reattached), {running, queued})
+        self.assertEqual(reattached[running]["context"], {"track_number": 1})
+        results = dict(restarted.await_all(list(reattached), timeout=10))
+        self.assertEqual(sorted(os.path.basename(p) for p in results.values()), ["track1_00001_.mp3", "track2_00001_.mp3"])
+        self.assertEqual(server.request_counts["POST /prompt"], 2)
+        self.assertEqual(RenderJournal(journal.journal_file).pending(), {})
+
+    def test_failed_render_returns_none(self):
+        _, client = self.start_server(fail_rate=1.0)
+        self.assertIsNone(client.wait_and_download_output(self.submit(client), timeout=10))
+
+    def test_retry_after_a_failed_render_waits_for_the_new_run(self):
+        server, client = self.start_server(fail_rate=1.0)
+        job = dict(lyrics="la la", tags="pop", duration=10, steps=4, filename_prefix="song", seed=7)
+        first = client.submit_prompt(**job)["prompt_id"]
+        self.assertIsNone(client.wait_and_download_output(first, timeout=10))
+
+        server.fail_rate = 0.0
+        retry = client.submit_prompt(**job)["prompt_id"]
+
+        self.assertEqual(retry, first)
+        path = client.wait_and_download_output(retry, timeout=10)
+        self.assertIsNotNone(path)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(server.request_counts["POST /prompt"], 2)
+
+    def test_polling_fallback_without_websocket(self):
+        server, client = self.start_server(ws_enabled=False)
+        prompt_ids = [self.submit(client, f"track{i}") for i in range(3)]
+
+        results = dict(client.await_all(prompt_ids, timeout=10))
+
+        self.assertEqual(sorted(os.path.basename(p) for p in results.values()),
+                         [f"track{i}_00001_.mp3" for i in range(3)])
+        self.assertGreater(server.request_counts["GET /queue"], 0)
+
+    def test_dropped_websocket_recovers(self):
+        server, client = self.start_server(ws_drop_rate=0.3)
+        prompt_ids = [self.submit(client, f"track{i}") for i in range(3)]
+
+        results = dict(client.await_all(prompt_ids, timeout=20))
+
+        self.assertEqual(len([p for p in results.values() if p]), 3)
+
+    def test_backlog_and_interrupt(self):
+        server, _ = self.start_server(backlog=2)
+        queue = requests.get(f"{server.url}/queue").json()
+        self.assertEqual(len(queue["queue_running"]) + len(queue["queue_pending"]), 2)
+
+        requests.post(f"{server.url}/queue", json={"clear": True})
+        requests.post(f"{server.url}/interrupt", json={})
+        deadline = time.time() + 5
+        while server.queue_snapshot()["queue_running"] and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(server.queue_snapshot(), {"queue_running": [], "queue_pending": []})
+        statuses = [entry["status"]["messages"][-1][0] for entry in server.history.values()]
+        self.assertEqual(statuses, ["execution_interrupted"])
+
+    def test_timeout_cancels_and_success_prunes_history(self):
+        server, client = self.start_server()
+        server.render_seconds = 5
+        slow = self.submit(client, "slow")
+        queued = self.submit(client, "queued")
+
+        self.assertIsNone(client.wait_and_download_output(queued, timeout=0.3))
+        self.assertIsNone(client.wait_and_download_output(slow, timeout=0.3))
+        self.assertEqual(server.queue_snapshot(), {"queue_running": [], "queue_pending": []})
+
+        server.render_seconds = 0.1
+        self.assertIsNotNone(client.wait_and_download_output(self.submit(client, "fast"), timeout=10))
+        # Only the interrupted render's entry is left behind
+        self.assertEqual([entry["prompt"][1] for entry in server.history.values()], [slow])
+        self.assertEqual(client.cleanup_orphans(), {"cancelled": 0, "pruned": 1})
+        self.assertEqual(len(server.history), 0)
+
+    def test_view_supports_range(self):
+        server, client = self.start_server()
+        prompt_id = self.submit(client)
+        client.wait_for(prompt_id, timeout=10)
+        file_info = server.history[prompt_id]["outputs"]["104"]["audio"][0]
+        response = requests.get(f"{server.url}/view", params=file_info,
+                                headers={"Range": "bytes=10-19"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, synthetic_mp3(64 * 1024)[10:20])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+import tempfile
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools import ollama
+from tools.llm_cache import LLMCache
+from tools.ollama import OllamaClient
+
+
+def payload(prompt="Write a verse", seed=7, temperature=0.7, model="qwen3"):
+    options = {"temperature": temperature}
+    if seed is not None:
+        options["seed"] = seed
+    return {"model": model, "prompt": prompt, "stream": False, "options": options}
+
+
+class TestLLMCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "llm.json")
+        # Exit-time flushes would target the deleted temporary directory
+        register = patch("tools.llm_cache.atexit.register")
+        self.register = register.start()
+        self.addCleanup(register.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_covers_model_prompt_options_and_seed(self):
+        self.assertEqual(LLMCache.key(payload()), LLMCache.key(dict(payload(), stream=True, keep_alive="10m")))
+        self.assertNotEqual(LLMCache.key(payload()), LLMCache.key(payload(prompt="Write a chorus")))
+        self.assertNotEqual(LLMCache.key(payload()), LLMCache.key(payload(model="llama3")))
+        self.assertNotEqual(LLMCache.key(payload()), LLMCache.key(payload(temperature=0.2)))
+        self.assertNotEqual(LLMCache.key(payload()), LLMCache.key(payload(seed=8)))
+
+    def test_put_get_persists_and_skips_unseeded_calls_outside_replay(self):
+        cache = LLMCache(self.path)
+        cache.put(payload(), "Seeded verse")
+        cache.put(payload(seed=None), "Unseeded verse")
+
+        reloaded = LLMCache(self.path)
+        self.assertEqual(reloaded.get(payload()), "Seeded verse")
+        self.assertIsNone(reloaded.get(payload(seed=None)))
+
+        reloaded.replay = True
+        self.assertEqual(reloaded.get(payload(seed=None)), "Unseeded verse")
+
+    def test_expired_entries_are_dropped(self):
+        cache = LLMCache(self.path, ttl=60)
+        cache.put(payload(), "Old verse")
+        cache.entries[LLMCache.key(payload())]["timestamp"] -= 120
+
+        self.assertIsNone(cache.get(payload()))
+        self.assertEqual(LLMCache(self.path).entries, {})
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = LLMCache(self.path, max_entries=2)
+        cache.put(payload(prompt="a"), "A")
+        cache.put(payload(prompt="b"), "B")
+        cache.entries[LLMCache.key(payload(prompt="a"))]["last_used"] += 10
+        cache.put(payload(prompt="c"), "C")
+
+        self.assertEqual(cache.get(payload(prompt="a")), "A")
+        self.assertIsNone(cache.get(payload(prompt="b")))
+        self.assertEqual(cache.get(payload(prompt="c")), "C")
+
+    def test_last_used_survives_a_restart(self):
+        cache = LLMCache(self.path, max_entries=2)
+        cache.put(payload(prompt="a"), "A")
+        cache.put(payload(prompt="b"), "B")
+        cache.entries[LLMCache.key(payload(prompt="a"))]["last_used"] -= 10
+        cache.entries[LLMCache.key(payload(prompt="b"))]["last_used"] -= 5
+        cache.get(payload(prompt="a"))
+        cache.flush()
+
+        reloaded = LLMCache(self.path, max_entries=2)
+        reloaded.put(payload(prompt="c"), "C")
+        self.assertEqual(reloaded.get(payload(prompt="a")), "A")
+        self.assertIsNone(reloaded.get(payload(prompt="b")))
+
+    def test_hits_do_not_rewrite_the_file(self):
+        cache = LLMCache(self.path)
+        cache.put(payload(), "Verse")
+        with patch.object(LLMCache, "_save") as mock_save:
+            for _ in range(3):
+                self.assertEqual(cache.get(payload()), "Verse")
+            mock_save.assert_not_called()
+            cache.flush()
+            mock_save.assert_called_once()
+        self.register.assert_called_once_with(cache.flush)
+
+    def test_empty_path_disables_cache(self):
+        cache = LLMCache("", replay=True)
+        cache.put(payload(), "Verse")
+        self.assertIsNone(cache.get(payload()))
+
+    def test_client_replays_cached_answers(self):
+        response = MagicMock()
+        response.json.return_value = {"response": " Fresh verse "}
+        client = OllamaClient(base_url="http://ollama:11434", cache=LLMCache(self.path))
+        try:
+            with patch.object(ollama.requests.Session, "post", return_value=response) as post:
+                self.assertEqual(client.generate("qwen3", "Write a verse"), "Fresh verse")
+                self.assertEqual(client.generate("qwen3", "Write a verse"), "Fresh verse")
+                self.assertEqual(post.call_count, 2)
+
+                client.cache.replay = True
+                self.assertEqual(client.generate("qwen3", "Write a verse"), "Fresh verse")
+                self.assertEqual(post.call_count, 2)
+        finally:
+            client.close()
+
+    def test_stopped_stream_is_only_cached_under_its_stop_condition(self):
+        lines = [b'{"response": "[Verse]\\n"}', b'{"response": "Line one,\\n"}', b'{"response": "", "done": true}']
+        client = OllamaClient(base_url="http://ollama:11434", seed=42, cache=LLMCache(self.path))
+        try:
+            response = MagicMock()
+            response.iter_lines.return_value = iter(lines)
+            with patch.object(ollama.requests.Session, "post", return_value=response):
+                stream = client.generate_stream("qwen3", "Write")
+                next(stream)
+                stream.close()
+            self.assertEqual(client.cache.entries, {})
+
+            response.iter_lines.return_value = iter(lines)
+            with patch.object(ollama.requests.Session, "post", return_value=response):
+                stream = client.generate_stream("qwen3", "Write", stop_condition="guard-v1")
+                next(stream)
+                stream.close()
+
+            with patch.object(ollama.requests.Session, "post", return_value=response) as post:
+                self.assertEqual("".join(client.generate_stream("qwen3", "Write", stop_condition="guard-v1")), "[Verse]")
+                post.assert_not_called()
+                response.json.return_value = {"response": "[Verse]\nLine one,"}
+                self.assertEqual(client.generate("qwen3", "Write"), "[Verse]\nLine one,")
+                post.assert_called_once()
+        finally:
+            client.close()
+
+    def test_client_seed_makes_calls_cacheable(self):
+        response = MagicMock()
+        response.json.return_value = {"response": "Verse"}
+        client = OllamaClient(base_url="http://ollama:11434", seed=42, cache=LLMCache(self.path))
+        try:
+            with patch.object(ollama.requests.Session, "post", return_value=response) as post:
+                client.generate("qwen3", "Write a verse", options={"temperature": 0.7})
+                client.generate("qwen3", "Write a verse", options={"temperature": 0.7})
+            self.assertEqual(post.call_count, 1)
+            self.assertEqual(post.call_args[1]["json"]["options"], {"temperature": 0.7, "seed": 42})
+        finally:
+            client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -175,6 +175,81 @@ Fade out
         # Valid marker with musical keyword
         self.assertEqual(self.agent.strip_musical_directions("[Instrumental Break]").strip(), "[Instrumental Break]")
 
+    def stream(self, text, chunk_size=7):
+        """Fake Ollama stream yielding text in small chunks; records whether it was closed early."""
+        self.stream_closed_after = None
+        def generate_stream(*args, **kwargs):
+            sent = 0
+            try:
+                for i in range(0, len(text), chunk_size):
+                    sent = i + chunk_size
+                    yield text[i:i + chunk_size]
+            finally:
+                self.stream_closed_after = sent
+        return generate_stream
+
+    def test_stream_stops_after_outro(self):
+        text = textwrap.dedent("""\
+            [Verse 1]
+            Walking down the road,
+            [Outro]
+            Ooh, yeah...
+            Mm...
+
+            Note: I tried to keep the imagery concrete.
+            This explanation goes on for a long time and wastes tokens.
+            """)
+        with patch.object(self.agent.ollama, "chat_stream", side_effect=self.stream(text)):
+            lyrics = self.agent.stream_lyrics("system", "prompt", {}, total_bars=64)
+
+        self.assertEqual(lyrics, "[Verse 1]\nWalking down the road,\n[Outro]\nOoh, yeah...\nMm...")
+        self.assertLess(self.stream_closed_after, text.index("This explanation"))
+
+    def test_stream_stops_at_meta_commentary(self):
+        text = "<think>\nNote: plan\n</think>\n[Verse]\nLine one,\nI wanted to evoke loss.\nMore notes\n" + "x" * 200
+        with patch.object(self.agent.ollama, "chat_stream", side_effect=self.stream(text)):
+            lyrics = self.agent.stream_lyrics("system", "prompt", {}, total_bars=64)
+
+        self.assertEqual(self.agent.normalize_lyrics(lyrics), "[Verse]\nLine one,")
+        self.assertLess(self.stream_closed_after, len(text))
+
+    def test_stream_stops_when_bar_budget_exceeded(self):
+        text = "[Verse]\n" + "".join(f"Line {i},\n" for i in range(100))
+        with patch.object(self.agent.ollama, "chat_stream", side_effect=self.stream(text)):
+            lyrics = self.agent.stream_lyrics("system", "prompt", {}, total_bars=16)
+
+        # 16 bars at two bars per line, with 25% tolerance
+        self.assertEqual(len(lyrics.split("\n")), 1 + 10)
+        self.assertLess(self.stream_closed_after, len(text))
+
+    def test_album_tracks_share_the_system_prompt(self):
+        calls = []
+        def chat_stream(model, system, prompt, **kwargs):
+            calls.append((system, prompt))
+            yield "[Verse]\nLine one,"
+        self.agent.perplexity.search.return_value = "themes"
+        self.agent.rag.query_lightrag.return_value = "lyrics"
+        state = {
+            "genre": "POP", "artist_name": "Nova", "artist_background": "A singer.",
+            "artist_style": "Robyn", "musical_direction": {"tags": "synth"},
+        }
+        with patch.object(self.agent.ollama, "chat_stream", side_effect=chat_stream), \
+             patch.object(self.agent.ollama, "preload_async"):
+            self.agent.write_lyrics_node(dict(state, song_title="First", user_direction="Leaving home"))
+            self.agent.write_lyrics_node(dict(state, song_title="Second", user_direction="Coming back"))
+
+        (first_system, first_prompt), (second_system, second_prompt) = calls
+        self.assertEqual(first_system, second_system)
+        self.assertNotIn("Nova", first_system)
+        self.assertTrue(first_prompt.startswith("Artist: Nova"))
+        shared = first_prompt[:first_prompt.index("Song Title:")]
+        self.assertTrue(second_prompt.startswith(shared))
+
+    def test_stream_without_stop_returns_everything(self):
+        text = "[Verse]\nLine one,\n[Chorus]\nLine two."
+        with patch.object(self.agent.ollama, "chat_stream", side_effect=self.stream(text)):
+            self.assertEqual(self.agent.stream_lyrics("system", "prompt", {}, total_bars=64), text)
+
 if __name__ == '__main__':
     unittest.main()
 
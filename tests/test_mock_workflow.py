@@ -3,14 +3,24 @@ from unittest.mock import MagicMock, patch
 import sys
 import os
 import json
+import tempfile
 
 # Add root to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app import SongbirdWorkflow
+from tools import comfy
 
 class TestSongbirdWorkflow(unittest.TestCase):
 
+    def setUp(self):
+        # Keep the render journal and the rendered files out of the repository
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        env = patch.dict(os.environ, {"SONGBIRD_RENDER_JOURNAL": os.path.join(self.tmp.name, "journal.json")})
+        env.start()
+        self.addCleanup(env.stop)
+
     @patch('requests.post')
     @patch('requests.get')
     def test_full_workflow(self, mock_get, mock_post):
@@ -74,7 +84,9 @@ class TestSongbirdWorkflow(unittest.TestCase):
             # ComfyUI View (Download)
             if "/view" in url:
                 mock_resp = MagicMock()
-                mock_resp.content = b"fake audio content"
+                mock_resp.status_code = 200
+                mock_resp.headers = {"Content-Length": str(len(b"fake audio content"))}
+                mock_resp.iter_content.return_value = [b"fake audio content"]
                 return mock_resp
 
             return MagicMock()
@@ -82,14 +94,17 @@ class TestSongbirdWorkflow(unittest.TestCase):
         mock_post.side_effect = side_effect_post
         mock_get.side_effect = side_effect_get
 
-        workflow = SongbirdWorkflow()
+        # ComfyClient talks through its pooled session
+        with patch.object(comfy.requests.Session, 'post', side_effect=side_effect_post), \
+             patch.object(comfy.requests.Session, 'get', side_effect=side_effect_get):
+            workflow = SongbirdWorkflow(output_dir=self.tmp.name)
 
-        # Mocking internal tools of agents
-        workflow.lyrics_agent.perplexity.search = MagicMock(return_value="Mock search results")
-        workflow.lyrics_agent.rag.query_lightrag = MagicMock(return_value="Mock RAG results")
+            # Mocking internal tools of agents
+            workflow.lyrics_agent.perplexity.search = MagicMock(return_value="Mock search results")
+            workflow.lyrics_agent.rag.query_lightrag = MagicMock(return_value="Mock RAG results")
 
-        # Run workflow
-        final_state = workflow.run("POP", "Make a hit")
+            # Run workflow
+            final_state = workflow.run("POP", "Make a hit")
 
         # Assertions
         print("Final State Keys:", final_state.keys())
@@ -102,10 +117,7 @@ class TestSongbirdWorkflow(unittest.TestCase):
         self.assertIn("[Verse]", final_state["cleaned_lyrics"])
         self.assertIn("test_song.mp3", final_state["audio_path"])
         self.assertTrue(os.path.exists(final_state["audio_path"]))
-
-        # Cleanup
-        if os.path.exists(final_state["audio_path"]):
-            os.remove(final_state["audio_path"])
+        self.assertEqual(os.path.dirname(final_state["audio_path"]), self.tmp.name)
 
 if __name__ == '__main__':
     unittest.main()
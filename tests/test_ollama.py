@@ -0,0 +1,152 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools import ollama
+from tools.ollama import OllamaClient, get_ollama_client
+from tools.metrics import metrics
+
+
+def ollama_response(text, **fields):
+    response = MagicMock()
+    response.json.return_value = dict(fields, response=text)
+    response.raise_for_status.return_value = None
+    return response
+
+
+class TestOllamaClient(unittest.TestCase):
+    def setUp(self):
+        self.client = OllamaClient(base_url="http://ollama:11434/", timeout=50, connect_timeout=5)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_generate_sends_one_payload_shape(self):
+        with patch.object(ollama.requests.Session, "post", return_value=ollama_response("  hello  ")) as post:
+            text = self.client.generate("qwen3", "Say hi", options={"temperature": 0.7}, format="json", timeout=30)
+
+        self.assertEqual(text, "hello")
+        url = post.call_args[0][0]
+        kwargs = post.call_args[1]
+        self.assertEqual(url, "http://ollama:11434/api/generate")
+        self.assertEqual(kwargs["json"], {
+            "model": "qwen3", "prompt": "Say hi", "stream": False,
+            "options": {"temperature": 0.7}, "format": "json",
+        })
+        self.assertEqual(kwargs["timeout"], (5, 30))
+
+    def test_chat_sends_system_prefix_then_prompt(self):
+        response = MagicMock()
+        response.json.return_value = {"message": {"role": "assistant", "content": " Neon Rain "}}
+        with patch.object(ollama.requests.Session, "post", return_value=response) as post:
+            text = self.client.chat("qwen3", "Static rules", "Track: #3", options={"temperature": 0.7})
+
+        self.assertEqual(text, "Neon Rain")
+        self.assertEqual(post.call_args[0][0], "http://ollama:11434/api/chat")
+        self.assertEqual(post.call_args[1]["json"], {
+            "model": "qwen3", "stream": False, "options": {"temperature": 0.7},
+            "messages": [
+                {"role": "system", "content": "Static rules"},
+                {"role": "user", "content": "Track: #3"},
+            ],
+        })
+
+    def test_generate_uses_default_timeout_and_records_metrics(self):
+        before = metrics.snapshot()["counters"].get("ollama.generate", 0)
+        response = ollama_response("ok", eval_count=100, eval_duration=2_000_000_000)
+        with patch.object(ollama.requests.Session, "post", return_value=response) as post:
+            self.client.generate("qwen3", "prompt")
+
+        self.assertEqual(post.call_args[1]["timeout"], (5, 50))
+        self.assertNotIn("options", post.call_args[1]["json"])
+        self.assertEqual(metrics.snapshot()["counters"]["ollama.generate"], before + 1)
+        self.assertEqual(metrics.snapshot()["gauges"]["ollama.tokens_per_second.qwen3"], 50)
+
+    def test_generate_raises_on_http_error(self):
+        response = ollama_response("")
+        response.raise_for_status.side_effect = ollama.requests.HTTPError("500 Server Error")
+        with patch.object(ollama.requests.Session, "post", return_value=response):
+            with self.assertRaises(ollama.requests.HTTPError):
+                self.client.generate("qwen3", "prompt")
+
+    def test_generate_stream_yields_chunks_and_closes_on_early_stop(self):
+        lines = [
+            b'{"response": "[Verse]\\n"}',
+            b'{"response": "Line one,\\n"}',
+            b'{"response": "Line two,\\n"}',
+            b'{"response": "", "done": true, "eval_count": 3, "eval_duration": 1000000000}',
+        ]
+        response = MagicMock()
+        response.iter_lines.return_value = iter(lines)
+        with patch.object(ollama.requests.Session, "post", return_value=response) as post:
+            stream = self.client.generate_stream("qwen3", "Write", options={"temperature": 0.8})
+            self.assertEqual(next(stream), "[Verse]\n")
+            stream.close()
+
+        self.assertTrue(post.call_args[1]["stream"])
+        self.assertTrue(post.call_args[1]["json"]["stream"])
+        response.close.assert_called_once()
+
+        response = MagicMock()
+        response.iter_lines.return_value = iter(lines)
+        with patch.object(ollama.requests.Session, "post", return_value=response):
+            self.assertEqual("".join(self.client.generate_stream("qwen3", "Write")), "[Verse]\nLine one,\nLine two,\n")
+        self.assertEqual(metrics.snapshot()["gauges"]["ollama.tokens_per_second.qwen3"], 3)
+
+    def test_pinned_models_stay_loaded_and_switches_are_counted(self):
+        counters = metrics.snapshot()["counters"]
+        switches = counters.get("ollama.model_switches", 0)
+        loads = counters.get("ollama.model_loads", 0)
+        self.client.keep_alive = "30m"
+        self.client.pin("album-model")
+        cold = ollama_response("ok", load_duration=4_000_000_000)
+        with patch.object(ollama.requests.Session, "post", return_value=cold) as post:
+            self.client.generate("album-model", "a")
+            self.assertEqual(post.call_args[1]["json"]["keep_alive"], -1)
+            self.client.generate("album-model", "b")
+            self.client.generate("lyric-model", "c")
+            self.assertEqual(post.call_args[1]["json"]["keep_alive"], "30m")
+
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual(counters["ollama.model_switches"], switches + 1)
+        self.assertEqual(counters["ollama.model_loads"], loads + 3)
+
+    def test_preload_skips_the_resident_model(self):
+        with patch.object(ollama.requests.Session, "post", return_value=ollama_response("")) as post:
+            self.assertTrue(self.client.preload("lyric-model"))
+            self.assertEqual(post.call_args[1]["json"], {"model": "lyric-model"})
+            self.assertTrue(self.client.preload("lyric-model"))
+            self.assertIsNone(self.client.preload_async("lyric-model"))
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(self.client.last_model, "lyric-model")
+
+    def test_unpin_restores_keep_alive_of_loaded_models(self):
+        self.client.pin("qwen3:14b", "llama3")
+        ps = MagicMock()
+        ps.json.return_value = {"models": [{"name": "llama3:latest"}]}
+        with patch.object(ollama.requests.Session, "get", return_value=ps), \
+             patch.object(ollama.requests.Session, "post", return_value=ollama_response("")) as post:
+            self.client.unpin()
+
+        self.assertEqual(self.client.pinned_models, set())
+        post.assert_called_once()
+        self.assertEqual(post.call_args[1]["json"], {"model": "llama3", "keep_alive": ollama.DEFAULT_KEEP_ALIVE})
+
+    def test_shared_client_is_reused(self):
+        self.assertIs(get_ollama_client(), get_ollama_client())
+
+    def test_agents_route_through_shared_client(self):
+        from agents.artist import ArtistAgent
+        agent = ArtistAgent()
+        self.assertIs(agent.ollama, get_ollama_client())
+        with patch.object(agent.ollama, "generate", return_value="<think>hmm</think>A singer from Lagos.") as generate:
+            self.assertEqual(agent.generate_persona("AFROBEATS"), "A singer from Lagos.")
+        self.assertEqual(generate.call_args[0][0], agent.model)
+
+
+if __name__ == '__main__':
+    unittest.main()
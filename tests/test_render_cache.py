@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+import tempfile
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools.render_cache import RenderCache
+
+
+def prompt(seed=1, prefix="audio/a"):
+    return {
+        "3": {"class_type": "KSampler", "inputs": {"seed": seed, "steps": 50}},
+        "104": {"class_type": "SaveAudioMP3", "inputs": {"filename_prefix": prefix}},
+    }
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index = os.path.join(self.tmp.name, "renders.json")
+        self.cache = RenderCache(self.index)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_disabled_unless_configured(self):
+        cache = RenderCache()
+        self.assertFalse(cache.enabled)
+        cache.put(RenderCache.key(prompt()), self.write("song.mp3"))
+        self.assertIsNone(cache.get(RenderCache.key(prompt())))
+
+    def write(self, name, data=b"audio"):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_key_ignores_output_naming_only(self):
+        self.assertEqual(RenderCache.key(prompt(prefix="audio/a_1")), RenderCache.key(prompt(prefix="audio/b_2")))
+        self.assertNotEqual(RenderCache.key(prompt(seed=1)), RenderCache.key(prompt(seed=2)))
+        self.assertIsNone(RenderCache.key(object()))
+
+    def test_put_get_persists_and_drops_stale_entries(self):
+        path = self.write("01_Song.mp3")
+        key = RenderCache.key(prompt())
+        self.cache.put(key, path)
+
+        reloaded = RenderCache(self.index)
+        self.assertEqual(reloaded.get(key), os.path.abspath(path))
+
+        self.write("01_Song.mp3", b"re-encoded by hand")
+        self.assertIsNone(reloaded.get(key))
+        with open(self.index) as f:
+            self.assertEqual(json.load(f), {})
+
+    def test_materialize_links_without_overwriting(self):
+        source = self.write("cached.mp3")
+        other = self.write("taken.mp3", b"different song")
+
+        self.assertEqual(RenderCache.materialize(source, source), source)
+        target = RenderCache.materialize(source, other)
+        self.assertEqual(target, os.path.join(self.tmp.name, "taken_2.mp3"))
+        self.assertTrue(os.path.samefile(source, target))
+        with open(other, "rb") as f:
+            self.assertEqual(f.read(), b"different song")
+
+    def test_empty_index_path_disables_cache(self):
+        cache = RenderCache("")
+        cache.put("k", self.write("x.mp3"))
+        self.assertIsNone(cache.get("k"))
+
+
+if __name__ == '__main__':
+    unittest.main()
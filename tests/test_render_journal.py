@@ -0,0 +1,56 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools.render_journal import RenderJournal
+
+
+class TestRenderJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "journal.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_defaults_to_the_output_dir(self):
+        journal = RenderJournal(output_dir=os.path.join(self.tmp.name, "album"))
+        journal.add("p1", url="http://comfy")
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, "album", ".render_journal.json")))
+
+    def test_concurrent_runs_keep_each_others_entries(self):
+        first, second = RenderJournal(self.path), RenderJournal(self.path)
+        first.add("p1", url="http://comfy")
+        second.add("p2", url="http://comfy")
+        first.annotate("p1", track_number=1)
+        second.remove("p2")
+
+        entries = RenderJournal(self.path).pending()
+        self.assertEqual(set(entries), {"p1"})
+        self.assertEqual(entries["p1"]["context"], {"track_number": 1})
+        self.assertEqual(entries["p1"]["owner"], first.owner)
+
+    def test_only_entries_of_exited_runs_are_orphaned(self):
+        running = RenderJournal(self.path)
+        running.add("p1", url="http://comfy")
+        later = RenderJournal(self.path)
+
+        self.assertEqual(running.orphaned(), {})
+        self.assertEqual(later.orphaned(), {})
+        with patch("tools.render_journal._process_alive", return_value=False):
+            self.assertEqual(set(later.orphaned("http://comfy")), {"p1"})
+            self.assertEqual(later.orphaned("http://other"), {})
+            later.claim("p1")
+            # Claimed entries belong to the collecting run now
+            self.assertEqual(later.orphaned(), {})
+        self.assertEqual(RenderJournal(self.path).pending()["p1"]["owner"], later.owner)
+
+
+if __name__ == '__main__':
+    unittest.main()
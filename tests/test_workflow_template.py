@@ -0,0 +1,93 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+import tempfile
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools.workflow import WorkflowTemplate, get_workflow_template, clear_workflow_cache, canonical_tags, canonical_text
+
+
+class TestWorkflowTemplate(unittest.TestCase):
+    def setUp(self):
+        clear_workflow_cache()
+
+    def tearDown(self):
+        clear_workflow_cache()
+
+    def test_discovers_roles_from_bundled_workflow(self):
+        template = get_workflow_template()
+        self.assertEqual(template.node_id("sampler"), "3")
+        self.assertEqual(template.node_id("text_encoder"), "94")
+        self.assertEqual(template.node_id("latent"), "98")
+        self.assertEqual(template.node_id("save_audio"), "104")
+        self.assertEqual(template.node_id("negative"), "7")
+
+    def test_template_loaded_once(self):
+        get_workflow_template()
+        with patch('builtins.open', side_effect=AssertionError("template re-read from disk")):
+            template = get_workflow_template()
+            prompt = template.build_prompt({"lyrics": "la la", "seed": 7})
+        self.assertEqual(prompt["94"]["inputs"]["lyrics"], "la la")
+        self.assertEqual(prompt["3"]["inputs"]["seed"], 7)
+
+    def test_build_prompt_does_not_mutate_template(self):
+        template = get_workflow_template()
+        original_seconds = template.nodes["98"]["inputs"]["seconds"]
+        prompt = template.build_prompt({"duration": 999, "filename_prefix": "audio/x"})
+        self.assertEqual(prompt["98"]["inputs"]["seconds"], 999)
+        self.assertEqual(prompt["104"]["inputs"]["filename_prefix"], "audio/x")
+        self.assertEqual(template.nodes["98"]["inputs"]["seconds"], original_seconds)
+
+    def test_roles_follow_class_type_not_node_id(self):
+        nodes = {
+            "10": {"class_type": "KSampler", "inputs": {"seed": 0, "negative": ["20", 0]}},
+            "20": {"class_type": "CLIPTextEncode", "inputs": {"text": ""}},
+            "30": {"class_type": "TextEncodeAceStepAudio1.5", "inputs": {"tags": ""}},
+            "40": {"class_type": "EmptyAceStep1.5LatentAudio", "inputs": {"seconds": 60}},
+            "50": {"class_type": "SaveAudioMP3", "inputs": {"filename_prefix": "audio/x"}},
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "variant.json")
+            with open(path, "w") as f:
+                json.dump(nodes, f)
+            template = get_workflow_template(path)
+
+        prompt = template.build_prompt({"seed": 5, "negative_prompt": "noise", "duration": 30})
+        self.assertEqual(prompt["10"]["inputs"]["seed"], 5)
+        self.assertEqual(prompt["20"]["inputs"]["text"], "noise")
+        self.assertEqual(prompt["40"]["inputs"]["seconds"], 30)
+        self.assertEqual(template.node_id("save_audio"), "50")
+
+    def test_legacy_template_without_class_types(self):
+        template = WorkflowTemplate({"3": {"inputs": {}}})
+        prompt = template.build_prompt({"steps": 8})
+        self.assertEqual(prompt["3"]["inputs"]["steps"], 8)
+
+    def test_text_inputs_are_canonicalised(self):
+        self.assertEqual(canonical_tags(" synthwave ,  dreamy,, female vocals "), "synthwave, dreamy, female vocals")
+        self.assertEqual(canonical_text("\n[Verse]  \nla la \n\n\n\n[Chorus]\n"), "[Verse]\nla la\n\n[Chorus]")
+
+        template = get_workflow_template()
+        a = template.build_prompt({"tags": "pop,  bright", "negative_prompt": "male vocals ", "lyrics": "la\n"})
+        b = template.build_prompt({"tags": "pop, bright", "negative_prompt": "male vocals", "lyrics": "la"})
+        self.assertEqual(a, b)
+
+    def test_encoder_seed_patched_separately(self):
+        template = get_workflow_template()
+        prompt = template.build_prompt({"seed": 5, "encoder_seed": 9})
+        self.assertEqual(prompt["3"]["inputs"]["seed"], 5)
+        self.assertEqual(prompt["94"]["inputs"]["seed"], 9)
+
+        # Without audio-code generation the encoder ignores its seed, so the template's is kept
+        template = WorkflowTemplate({
+            "94": {"class_type": "TextEncodeAceStepAudio1.5", "inputs": {"seed": 1, "generate_audio_codes": False}},
+        })
+        self.assertEqual(template.build_prompt({"encoder_seed": 9})["94"]["inputs"]["seed"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
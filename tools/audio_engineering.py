@@ -1,5 +1,5 @@
 import random
-from typing import TypedDict, Dict, List, Any
+from typing import TypedDict, Dict, List, Any, Optional
 
 # Genre BPM Logic
 GENRE_BPM = {
@@ -151,13 +151,15 @@ def calculate_lyric_budget(genre: str, duration: int = 240) -> LyricBudget:
         "duration": duration
     }
 
-def calculate_song_parameters(genre: str, lyrics: str) -> SongParameters:
+def calculate_song_parameters(genre: str, lyrics: str, seed: Optional[int] = None) -> SongParameters:
     """
     Dynamically determines song parameters based on genre and lyrics for ACE Step 1.5.
 
     Args:
         genre: The musical genre.
         lyrics: The song lyrics (used for duration estimation).
+        seed: Optional render seed. When given, the duration pick is derived from
+              (seed, genre, lyrics) so identical inputs always get identical parameters.
 
     Returns:
         SongParameters: Dictionary containing duration, steps, cfg, sampler_name, and scheduler.
@@ -181,7 +183,8 @@ def calculate_song_parameters(genre: str, lyrics: str) -> SongParameters:
             break
 
     # Base duration from range
-    base_duration = random.randint(target_range["min"], target_range["max"])
+    rng = random.Random(f"{seed}:{genre_upper}:{lyrics}") if seed is not None else random
+    base_duration = rng.randint(target_range["min"], target_range["max"])
 
     # Adjust based on Lyrical Density
     word_count = len(lyrics.split()) if lyrics else 0
@@ -1,21 +1,91 @@
 import requests
-import json
 import time
 import os
-import re
-import config
 import logging
 import uuid
-import websocket
+import json
 import ssl
+import random
+import shutil
+import posixpath
+import re
 from urllib.parse import urlparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.retry import Retry
+from tools.workflow import get_workflow_template, canonical_params, content_seed
+from tools.comfy_events import ComfyEventListener, ComfyExecutionError
+from tools.metrics import metrics
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Key in a prompt's extra_data marking it as a Songbird job (for finding orphans on a shared server)
+JOB_MARKER = "songbird_job"
+# Namespace of the uuid5 job keys sent as prompt ids, so retried submissions can be recognised
+JOB_KEY_NAMESPACE = uuid.UUID("5f0c6b1e-8d9a-4c1b-9a57-3b8e2f6d4c10")
+# Warm-up render: just enough audio and steps to make ComfyUI load the checkpoint and encoders
+WARMUP_JOB = dict(lyrics="[instrumental]", tags="warm-up", duration=2, steps=1, seed=0, filename_prefix="songbird_warmup")
 
 class ComfyClient:
-    def __init__(self, url=None, output_dir="output", timeout=120):
+    def __init__(self, url=None, output_dir="output", timeout=120, workflow_path=None, pool_size=None, connect_timeout=None, max_retries=None, backoff_factor=None, journal=None):
         self.url = url or os.getenv("COMFYUI_URL", "http://localhost:8188")
         self.output_dir = output_dir
         self.timeout = timeout
+        self.workflow_path = workflow_path
         self.client_id = str(uuid.uuid4())
+        self._events = None
+        self._events_lock = threading.Lock()
+        # prompt_id -> (server filename prefix incl. subfolder, local filename prefix)
+        self._output_prefixes = {}
+        # prompt_id -> takes per render (batched prompts only), and the local paths of downloaded takes
+        self._batch_sizes = {}
+        # Prompt ids whose submission failed without a clear answer; the server may still have them
+        self._unconfirmed_submissions = set()
+        # Optional RenderJournal of uncollected prompts, for reattaching after a crash (see reattach)
+        self.journal = journal
+        self._takes = {}
+
+        # Connection pool / transport settings
+        self.pool_size = pool_size or int(os.getenv("COMFYUI_POOL_SIZE", "10"))
+        self.connect_timeout = connect_timeout or float(os.getenv("COMFYUI_CONNECT_TIMEOUT", "10"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("COMFYUI_MAX_RETRIES", "3"))
+        self.backoff_factor = backoff_factor if backoff_factor is not None else float(os.getenv("COMFYUI_RETRY_BACKOFF", "0.5"))
+
+        # Backpressure: never keep more than this many prompts queued on the server
+        self.max_pending = int(os.getenv("COMFYUI_MAX_PENDING", "2"))
+
+        # Warn when a running prompt reports no progress for this many seconds
+        self.stall_warning = float(os.getenv("COMFYUI_STALL_WARNING", "120"))
+        # Sampler steps per second, averaged over finished renders (None until observed)
+        self.steps_per_second = None
+        # Render duration averaged over finished renders; paces HTTP polling (None until observed)
+        self.avg_render_seconds = None
+
+        # HTTP fallback polling: first delay and cap (seconds) for the jittered backoff
+        self.poll_initial = float(os.getenv("COMFYUI_POLL_INITIAL", "0.5"))
+        self.poll_max = float(os.getenv("COMFYUI_POLL_MAX", "30"))
+
+        # Downloads at least this large are split into parallel ranged requests
+        self.download_segments = int(os.getenv("COMFYUI_DOWNLOAD_SEGMENTS", "4"))
+        self.parallel_download_min_bytes = int(float(os.getenv("COMFYUI_PARALLEL_DOWNLOAD_MIN_MB", "16")) * 1024 * 1024)
+
+        # ComfyUI output directories mounted on this host (os.pathsep-separated); outputs found
+        # there are linked or moved into place instead of downloaded over HTTP
+        self.shared_output_dirs = [d for d in os.getenv("COMFYUI_OUTPUT_DIR", "").split(os.pathsep) if d]
+        self.shared_output_move = os.getenv("COMFYUI_OUTPUT_MODE", "link").lower() == "move"
+
+        # Job lifecycle: stop prompts we stop waiting for, drop history entries once collected
+        self.cancel_on_timeout = os.getenv("COMFYUI_CANCEL_ON_TIMEOUT", "true").lower() == "true"
+        self.prune_history = os.getenv("COMFYUI_PRUNE_HISTORY", "true").lower() == "true"
+
+        # Pre-warm: load the checkpoint with a tiny render while the LLM stages run
+        self.warmup = os.getenv("COMFYUI_WARMUP", "false").lower() == "true"
+        # Internal prompts (warm-ups) hidden from progress callbacks and render-time averages
+        self._background_prompts = set()
+
+        # Text encoder seed: "render" uses the sampler seed; "content" derives it from the
+        # encoder's inputs so re-renders of the same lyrics and tags hit ComfyUI's cache
+        self.encoder_seed_mode = os.getenv("COMFYUI_ENCODER_SEED", "render").lower()
         
         # SSL Verification Bypass support for Cloudflare Tunnels/Remote Servers
         verify_ssl = os.getenv("COMFYUI_VERIFY_SSL", "true").lower()
@@ -26,82 +96,275 @@ class ComfyClient:
             urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
             logging.info("COMFYUI_VERIFY_SSL is False: SSL verification disabled for ComfyUI.")
 
+        self.session = self._create_session()
         os.makedirs(self.output_dir, exist_ok=True)
 
-    def submit_prompt(self, lyrics, tags, bpm=120, keyscale="C major", duration=240, filename_prefix="songbird", seed=None, steps=50, cfg=4.0, sampler_name="euler", scheduler="sgm_uniform", negative_prompt="", min_p=0, cfg_scale=4.0):
-        # Load workflow template
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        template_path = os.path.join(base_dir, "audio_ace_step_1_5_checkpoint.json")
+    def _create_session(self):
+        """
+        Creates the pooled keep-alive session shared by every HTTP call to this server.
+        Connection failures are retried with exponential backoff for all methods;
+        5xx gateway errors are only retried for idempotent requests (never POST /prompt).
+        """
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=self.max_retries,
+            status=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False
+        )
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.verify = self.verify
+        return session
 
-        try:
-            with open(template_path, "r") as f:
-                prompt = json.load(f)
-        except Exception as e:
-            logging.error(f"Error loading workflow template: {e}")
-            return None
+    @property
+    def request_timeout(self):
+        """(connect, read) timeout tuple used for every HTTP call."""
+        return (self.connect_timeout, self.timeout)
+
+    def close(self):
+        """Closes pooled connections and the WebSocket listener."""
+        if self._events is not None:
+            self._events.stop()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
+    def build_prompt(self, lyrics, tags, bpm=120, keyscale="C major", duration=240, filename_prefix="songbird", seed=None, steps=50, cfg=4.0, sampler_name="euler", scheduler="sgm_uniform", negative_prompt="", min_p=0, cfg_scale=4.0, batch_size=1):
+        """Returns the patched workflow prompt for a render, without submitting it."""
+        template = get_workflow_template(self.workflow_path)
         generation_seed = seed if seed is not None else int(time.time())
+        encoder_seed = generation_seed
+        if self.encoder_seed_mode == "content":
+            # Same text encoder inputs, same seed: ComfyUI reuses the conditioning across renders
+            text = canonical_params({"tags": tags, "lyrics": lyrics})
+            encoder_seed = content_seed(text["tags"], text["lyrics"], bpm, duration, keyscale)
 
-        # Update KSampler (Node 3)
-        if "3" in prompt:
-            inputs = prompt["3"]["inputs"]
-            inputs["seed"] = generation_seed
-            inputs["steps"] = steps
-            inputs["cfg"] = cfg
-            inputs["sampler_name"] = sampler_name
-            inputs["scheduler"] = scheduler
-
-        # Update TextEncodeAceStepAudio1.5 (Node 94)
-        if "94" in prompt:
-            inputs = prompt["94"]["inputs"]
-            inputs["tags"] = tags
-            inputs["lyrics"] = lyrics
-            inputs["seed"] = generation_seed
-            inputs["bpm"] = bpm
-            inputs["duration"] = duration
-            inputs["keyscale"] = keyscale
-            inputs["min_p"] = min_p
-            inputs["cfg_scale"] = cfg_scale
-
-        # Update EmptyAceStep1.5LatentAudio (Node 98)
-        if "98" in prompt:
-            prompt["98"]["inputs"]["seconds"] = duration
-
-        # Update SaveAudioMP3 (Node 104)
-        if "104" in prompt:
-            prompt["104"]["inputs"]["filename_prefix"] = f"audio/{filename_prefix}"
-
-        # Handle Negative Prompt
-        # Uses CLIPTextEncode (Node 7) instead of ConditioningZeroOut
+        # Negative prompt is patched into a CLIPTextEncode node instead of ConditioningZeroOut
         # Note: We previously used ConditioningZeroOut but it caused sound quality issues
         # by effectively combining negative and positive prompts
-        neg_node_id = getattr(config, "NEGATIVE_PROMPT_NODE_ID", "7")
-        if neg_node_id in prompt:
-            prompt[neg_node_id]["inputs"]["text"] = negative_prompt
-        else:
-            logging.warning(f"Negative prompt node {neg_node_id} not found in workflow.")
+        return template.build_prompt({
+            "seed": generation_seed,
+            "encoder_seed": encoder_seed,
+            "steps": steps,
+            "cfg": cfg,
+            "sampler_name": sampler_name,
+            "scheduler": scheduler,
+            "tags": tags,
+            "lyrics": lyrics,
+            "bpm": bpm,
+            "duration": duration,
+            "keyscale": keyscale,
+            "min_p": min_p,
+            "cfg_scale": cfg_scale,
+            "batch_size": batch_size,
+            "filename_prefix": f"audio/{filename_prefix}",
+            "negative_prompt": negative_prompt,
+        })
+
+    def submit_prompt(self, lyrics, tags, bpm=120, keyscale="C major", duration=240, filename_prefix="songbird", seed=None, steps=50, cfg=4.0, sampler_name="euler", scheduler="sgm_uniform", negative_prompt="", min_p=0, cfg_scale=4.0, batch_size=1, prompt_id=None):
+        """
+        Queues a render under a job key derived from its patched inputs (see prepare_submission),
+        sent to ComfyUI as the prompt id; an explicit prompt_id is used instead when given
+        (servers that predate client ids assign their own). The saved file's prefix carries a
+        token of the key so its output can be identified exactly; the token is dropped again
+        from the local filename. batch_size > 1 renders that many takes in one pass (see pop_takes).
 
+        A submission that fails without a clear answer (timeout, dropped connection, 5xx) may
+        still have been queued, so it is retried, and any later attempt with the same key first
+        looks the key up in /queue and /history instead of rendering it twice.
+        """
         try:
-            response = requests.post(
-                f"{self.url}/prompt", 
-                json={"prompt": prompt, "client_id": self.client_id}, 
-                timeout=self.timeout,
-                verify=self.verify
+            prompt, prompt_id, job_prefix = self.prepare_submission(
+                lyrics, tags, bpm=bpm, keyscale=keyscale, duration=duration,
+                filename_prefix=filename_prefix, seed=seed, steps=steps, cfg=cfg,
+                sampler_name=sampler_name, scheduler=scheduler,
+                negative_prompt=negative_prompt, min_p=min_p, cfg_scale=cfg_scale,
+                batch_size=batch_size, prompt_id=prompt_id
             )
-            response.raise_for_status()
-            return response.json()
         except Exception as e:
-            if "WRONG_VERSION_NUMBER" in str(e):
-                logging.error(f"Error submitting to ComfyUI: SSL Error (Wrong Version). TIP: You are likely using 'https://' for a server that only supports 'http://'. Please check COMFYUI_URL in .env.")
-            else:
-                logging.error(f"Error submitting to ComfyUI: {e}")
+            logging.error(f"Error loading workflow template: {e}")
             return None
 
+        payload = self.submission_payload(prompt, prompt_id, job_prefix)
+        self.begin_submission(prompt_id)
+
+        for attempt in range(self.max_retries + 1):
+            if self.needs_confirmation(prompt_id):
+                result = self._find_submitted(prompt_id)
+                if result:
+                    return self.accept_submission(result, prompt_id, job_prefix, filename_prefix, batch_size)
+            try:
+                response = self.session.post(
+                    f"{self.url}/prompt", 
+                    json=payload, 
+                    timeout=self.request_timeout,
+                    verify=self.verify
+                )
+                response.raise_for_status()
+                return self.accept_submission(response.json(), prompt_id, job_prefix, filename_prefix, batch_size)
+            except Exception as e:
+                delay = self.submission_retry_delay(prompt_id, e, attempt, _maybe_received(e))
+                if delay is None:
+                    return None
+                time.sleep(delay)
+
+    def prepare_submission(self, lyrics, tags, filename_prefix="songbird", seed=None, prompt_id=None, **params):
+        """
+        Returns (prompt, prompt_id, job_prefix) for a render. Without an explicit prompt_id the
+        id is a uuid5 job key of the patched inputs, so resubmitting the same job yields the
+        same id; a random seed is drawn here, so the key covers the seed actually rendered.
+        """
+        seed = seed if seed is not None else int(time.time())
+        if not prompt_id:
+            prompt_id = job_key(self.build_prompt(lyrics, tags, filename_prefix=filename_prefix, seed=seed, **params))
+        job_prefix = self._job_prefix(filename_prefix, prompt_id)
+        prompt = self.build_prompt(lyrics, tags, filename_prefix=job_prefix, seed=seed, **params)
+        return prompt, prompt_id, job_prefix
+
+    def submission_payload(self, prompt, prompt_id, job_prefix):
+        """The POST /prompt body for a prepared submission (see prepare_submission)."""
+        return {"prompt": prompt, "client_id": self.client_id, "prompt_id": prompt_id, "extra_data": {JOB_MARKER: job_prefix}}
+
+    def begin_submission(self, prompt_id):
+        """
+        Called before a prompt is POSTed. Job ids are deterministic, so a resubmitted job (e.g. a
+        retry after a failed render) reuses the id of its earlier run; that run's finished result
+        is dropped so the new render is awaited. Kept when an earlier unanswered POST of the id
+        may have reached the server, since its result then belongs to this submission.
+        """
+        if not self.needs_confirmation(prompt_id):
+            self.events.reset(prompt_id)
+
+    def needs_confirmation(self, prompt_id):
+        """True when an earlier POST of this prompt failed without an answer, so the server may already have it."""
+        return prompt_id in self._unconfirmed_submissions
+
+    def accept_submission(self, result, prompt_id, job_prefix, filename_prefix, batch_size=1):
+        """Records a prompt the server has accepted, so its output can be collected. Returns result."""
+        self._unconfirmed_submissions.discard(prompt_id)
+        self._remember_prefix(result, job_prefix, filename_prefix, batch_size)
+        return result
+
+    def submission_retry_delay(self, prompt_id, error, attempt, maybe_received):
+        """
+        Handles a failed POST /prompt. maybe_received says whether the transport error leaves
+        open that the server got the request (no answer or a 5xx, but not a refused connection).
+        Returns the seconds to wait before confirming and retrying, or None when the submission
+        has failed.
+        """
+        if maybe_received:
+            self._unconfirmed_submissions.add(prompt_id)
+            if attempt < self.max_retries:
+                logging.warning(f"Submitting Prompt {prompt_id} failed ({error}); checking the server before retrying")
+                return self.backoff_factor * (2 ** attempt)
+        if "WRONG_VERSION_NUMBER" in str(error):
+            logging.error(f"Error submitting to ComfyUI: SSL Error (Wrong Version). TIP: You are likely using 'https://' for a server that only supports 'http://'. Please check COMFYUI_URL in .env.")
+        else:
+            logging.error(f"Error submitting to ComfyUI: {error}")
+        return None
+
+    def submitted_result(self, prompt_id, queue, history):
+        """
+        Looks for a prompt in a /queue payload, then in its /history payload (only needed when
+        it is not queued). Returns a /prompt-style result if the server has it, else None.
+        """
+        if not queue_position(queue, prompt_id):
+            if not history or prompt_id not in history:
+                return None
+            # Finished already: resolve it now, as its WebSocket events may have gone unwatched
+            self.apply_history_entry(prompt_id, history[prompt_id])
+        logging.info(f"Prompt {prompt_id} was already queued by an earlier attempt; not resubmitting")
+        return {"prompt_id": prompt_id, "number": None, "node_errors": {}}
+
+    def _find_submitted(self, prompt_id):
+        """Looks for a prompt in /queue, then /history. Returns a /prompt-style result if the server has it."""
+        queue = self.get_queue()
+        history = None if queue_position(queue, prompt_id) else self.get_history(prompt_id)
+        return self.submitted_result(prompt_id, queue, history)
+
+    @staticmethod
+    def _job_prefix(filename_prefix, prompt_id=None):
+        token = uuid.UUID(prompt_id).hex if prompt_id and _is_uuid(prompt_id) else uuid.uuid4().hex
+        return f"{filename_prefix}_{token[:12]}"
+
+    def _remember_prefix(self, result, job_prefix, filename_prefix, batch_size=1):
+        if result and "prompt_id" in result:
+            self._output_prefixes[result["prompt_id"]] = (f"audio/{job_prefix}", filename_prefix)
+            if batch_size > 1:
+                self._batch_sizes[result["prompt_id"]] = batch_size
+            if self.journal and result["prompt_id"] not in self._background_prompts:
+                self.journal.add(
+                    result["prompt_id"], url=self.url, job_prefix=job_prefix, filename_prefix=filename_prefix,
+                    batch_size=batch_size, output_dir=self.output_dir
+                )
+
+    def forget_submission(self, prompt_id):
+        """Drops a prompt from the journal once it is collected, cancelled or failed."""
+        if self.journal:
+            self.journal.remove(prompt_id)
+
+    def reattach(self, timeout=1200):
+        """
+        Picks up this server's journaled prompts from an earlier run that exited without
+        collecting them (renders of runs still going are left to those runs). Prompts still
+        queued, or finished in /history, are claimed for this run, get their output prefixes
+        restored and can be collected with await_all(); prompts the server no longer knows are
+        dropped from the journal. Entries are kept when the server is unreachable.
+        Returns {prompt_id: journal entry}.
+
+        ComfyUI streams a prompt's events only to the client that queued it, so prompts still
+        queued are followed over HTTP (for up to timeout seconds).
+        """
+        entries = self.journal.orphaned(self.url) if self.journal else {}
+        if not entries:
+            return {}
+        queue = self.get_queue()
+        if queue is None:
+            logging.warning(f"Cannot reattach {len(entries)} journaled render(s): {self.url} is unreachable")
+            return {}
+
+        reattached = {}
+        queued = {}
+        for prompt_id, entry in entries.items():
+            if queue_position(queue, prompt_id):
+                queued[prompt_id] = self.events.watch(prompt_id)
+            else:
+                history = self.get_history(prompt_id)
+                if history is None:
+                    continue
+                if prompt_id not in history:
+                    logging.info(f"Journaled Prompt {prompt_id} is unknown to {self.url}; dropping it")
+                    self.forget_submission(prompt_id)
+                    continue
+                self.apply_history_entry(prompt_id, history[prompt_id])
+            self.journal.claim(prompt_id)
+            self._output_prefixes[prompt_id] = (f"audio/{entry['job_prefix']}", entry["filename_prefix"])
+            if entry.get("batch_size", 1) > 1:
+                self._batch_sizes[prompt_id] = entry["batch_size"]
+            reattached[prompt_id] = entry
+        if queued:
+            threading.Thread(
+                target=self.poll_until_done, args=(queued, time.time() + timeout),
+                name="comfy-reattach-poll", daemon=True
+            ).start()
+        if reattached:
+            logging.info(f"Reattached to {len(reattached)} render(s) from an earlier run on {self.url}")
+        return reattached
+
     def get_history(self, prompt_id):
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.url}/history/{prompt_id}", 
-                timeout=self.timeout,
+                timeout=self.request_timeout,
                 verify=self.verify
             )
             response.raise_for_status()
@@ -110,224 +373,659 @@ class ComfyClient:
             logging.error(f"Error fetching ComfyUI history: {e}")
             return None
 
-    def wait_and_download_output(self, prompt_id, timeout=1200):
-        """Monitors WebSocket for completion and downloads the generated file."""
-        logging.info(f"Connecting to WebSocket for monitoring (Prompt ID: {prompt_id})...")
-        
+    @property
+    def ws_url(self):
         ws_protocol = "wss" if self.url.startswith("https") else "ws"
         # Extract host from URL
-        parsed_url = urlparse(self.url)
-        host = parsed_url.netloc
-        
-        ws_url = f"{ws_protocol}://{host}/ws?clientId={self.client_id}"
-        
-        success = False
-        try:
-            ws = websocket.WebSocket()
-            # Set timeout for the WebSocket connection itself
-            ws.settimeout(30) # Connection timeout
-            
-            # Respect SSL verification setting
-            sslopt = {"cert_reqs": ssl.CERT_NONE} if not self.verify else {}
-            
-            ws.connect(ws_url, sslopt=sslopt)
-            logging.info(f"WebSocket connected. Monitoring execution...")
-            
-            # Reset timeout for monitoring phase
-            ws.settimeout(timeout)
-            
-            start_time = time.time()
+        host = urlparse(self.url).netloc
+        return f"{ws_protocol}://{host}/ws?clientId={self.client_id}"
+
+    @property
+    def events(self):
+        """The shared WebSocket listener for this client_id, created on first use."""
+        with self._events_lock:
+            if self._events is None:
+                # Respect SSL verification setting
+                sslopt = {"cert_reqs": ssl.CERT_NONE} if not self.verify else {}
+                self._events = ComfyEventListener(self.ws_url, sslopt=sslopt, on_connect=self._recover_missed_events)
+                self._events.add_progress_callback(self._record_progress)
+            return self._events
+
+    def add_progress_callback(self, callback):
+        """Registers callback(event) for progress/ETA events of every prompt on this server."""
+        def forward(event):
+            if event["prompt_id"] not in self._background_prompts:
+                callback(event)
+        self.events.add_progress_callback(forward)
+
+    def _record_progress(self, event):
+        """Feeds step rates and render outcomes into the metrics layer."""
+        if event["prompt_id"] in self._background_prompts:
+            return
+        if event["type"] == "progress" and event.get("steps_per_second"):
+            metrics.gauge(f"comfy.steps_per_second.{self.url}", event["steps_per_second"])
+        elif event["type"] == "completed":
+            rate = event.get("steps_per_second")
+            if rate:
+                previous = self.steps_per_second
+                self.steps_per_second = rate if previous is None else 0.7 * previous + 0.3 * rate
+            elapsed = event["elapsed_seconds"]
+            previous = self.avg_render_seconds
+            self.avg_render_seconds = elapsed if previous is None else 0.7 * previous + 0.3 * elapsed
+            cached = event.get("cached_nodes") or []
+            self._report_cached_nodes(event["prompt_id"], cached)
+            metrics.record(
+                "comfy.render_complete", url=self.url, prompt_id=event["prompt_id"],
+                elapsed_seconds=event["elapsed_seconds"], steps=event.get("max"),
+                steps_per_second=rate, cached_nodes=len(cached), cached_node_ids=list(cached)
+            )
+        elif event["type"] == "failed":
+            metrics.record("comfy.render_failed", url=self.url, prompt_id=event["prompt_id"],
+                           elapsed_seconds=event["elapsed_seconds"], node=event.get("node"))
+
+    def _report_cached_nodes(self, prompt_id, nodes):
+        """Logs which workflow nodes ComfyUI served from its execution cache for a prompt."""
+        if nodes:
+            metrics.increment("comfy.cached_nodes", len(nodes))
+            logging.info(f"Prompt {prompt_id}: ComfyUI reused cached nodes {', '.join(map(str, nodes))}")
+
+    def check_stalled(self, prompt_id, warned_at):
+        """Logs a warning when a running prompt has not reported progress for stall_warning seconds."""
+        progress = self.events.progress(prompt_id)
+        if not progress:
+            return warned_at
+        idle = time.time() - progress["updated_at"]
+        if idle >= self.stall_warning and progress["updated_at"] != warned_at:
+            logging.warning(
+                f"Prompt {prompt_id} has reported no progress for {idle:.0f}s "
+                f"(last node: {progress.get('node')}, step {progress.get('value')}/{progress.get('max')})"
+            )
+            return progress["updated_at"]
+        return warned_at
+
+    def _recover_missed_events(self, prompt_ids):
+        """Resolves watched prompts that finished while the WebSocket was down."""
+        for prompt_id in self._finished_candidates(prompt_ids):
+            if self._resolve_from_history(prompt_id):
+                logging.info(f"Prompt {prompt_id} finished while WebSocket was disconnected.")
+
+    def _resolve_from_history(self, prompt_id):
+        """Completes or fails a watched prompt from its /history entry. Returns False if it has none yet."""
+        history = self.get_history(prompt_id)
+        if not history or prompt_id not in history:
+            return False
+        self.apply_history_entry(prompt_id, history[prompt_id])
+        return True
+
+    def apply_history_entry(self, prompt_id, entry):
+        status = entry.get("status") or {}
+        if status.get("status_str") == "error":
+            error = {}
+            for message in status.get("messages", []):
+                if isinstance(message, list) and len(message) == 2 and message[0] == "execution_error":
+                    error = message[1]
+            self.events.fail(prompt_id, error)
+        else:
+            if prompt_id not in self._background_prompts and not self.events.progress(prompt_id):
+                # No WebSocket events were seen for this prompt, so report its cache hits from history
+                cached = [node for message in status.get("messages", [])
+                          if isinstance(message, list) and len(message) == 2 and message[0] == "execution_cached"
+                          for node in (message[1] or {}).get("nodes", [])]
+                self._report_cached_nodes(prompt_id, cached)
+            self.events.complete(prompt_id, entry.get("outputs", {}))
+
+    def _finished_candidates(self, prompt_ids):
+        """Prompt ids that are no longer running or pending, from one /queue call."""
+        return not_queued(prompt_ids, self.queued_prompt_ids())
+
+    def poll_delay(self, attempt, elapsed):
+        """
+        Seconds to sleep before the next HTTP poll.
+
+        Until the expected render time has passed, polls at half the remaining time;
+        after that backs off exponentially from poll_initial. Equal jitter keeps
+        many waiting clients from polling in lockstep.
+        """
+        expected = self.avg_render_seconds
+        if expected and elapsed < expected:
+            base = (expected - elapsed) / 2
+        else:
+            base = self.poll_initial * (2 ** attempt)
+        base = min(self.poll_max, max(self.poll_initial, base))
+        return random.uniform(base / 2, base)
+
+    def next_poll(self, attempt, elapsed):
+        """(delay, next attempt) for an HTTP poll; attempts only count once the expected render time has passed."""
+        delay = self.poll_delay(attempt, elapsed)
+        if not (self.avg_render_seconds and elapsed < self.avg_render_seconds):
+            attempt += 1
+        return delay, attempt
+
+    def poll_until_done(self, futures, deadline):
+        """
+        HTTP fallback for when the WebSocket is unavailable.
+
+        futures maps prompt_id -> listener future. Each round makes one /queue call for
+        all outstanding prompts and fetches /history only for those that have left the
+        queue, resolving their futures. Returns when all are resolved or at the deadline.
+        """
+        started = time.time()
+        attempt = 0
+        while True:
+            pending = [pid for pid, future in futures.items() if not future.done()]
+            if not pending:
+                return
+            for prompt_id in self._finished_candidates(pending):
+                if self._resolve_from_history(prompt_id):
+                    logging.info(f"Generation complete (verified via history polling): {prompt_id}")
+
+            now = time.time()
+            if now >= deadline or all(future.done() for future in futures.values()):
+                return
+            delay, attempt = self.next_poll(attempt, now - started)
+            time.sleep(min(delay, deadline - now))
+
+    def wait_for(self, prompt_id, timeout=1200):
+        """
+        Blocks until a prompt finishes.
+
+        Returns the prompt's outputs ({node_id: output}, possibly empty when only the
+        completion signal was seen) or None on timeout. Raises ComfyExecutionError if
+        ComfyUI reports that the prompt failed.
+        """
+        deadline = time.time() + timeout
+        future = self.events.watch(prompt_id)
+
+        if self.events.wait_connected(30):
+            logging.info(f"Monitoring execution via shared WebSocket (Prompt ID: {prompt_id})...")
+            warned_at = None
+            check_interval = max(1, self.stall_warning / 4) if self.stall_warning > 0 else timeout
             while True:
                 try:
-                    out = ws.recv()
-                    if not out:
-                        continue
-                    
-                    if isinstance(out, str):
-                        message = json.loads(out)
-                        if message['type'] == 'executing':
-                            data = message['data']
-                            # When node is None and the prompt_id matches, the workflow has finished
-                            if data['node'] is None and data['prompt_id'] == prompt_id:
-                                logging.info("Execution complete via WebSocket signal.")
-                                success = True
-                                break 
-                    
-                except websocket.WebSocketTimeoutException:
-                     if time.time() - start_time > timeout:
+                    outputs = future.result(timeout=max(0, min(check_interval, deadline - time.time())))
+                    logging.info("Execution complete via WebSocket signal.")
+                    return outputs
+                except FutureTimeoutError:
+                    if time.time() >= deadline:
                         logging.error(f"Timeout waiting for WebSocket message (Prompt ID: {prompt_id})")
                         break
-                except Exception as e:
-                    logging.warning(f"WebSocket error during receive: {e}")
-                    break
+                    if self.stall_warning > 0:
+                        warned_at = self.check_stalled(prompt_id, warned_at)
+        else:
+            logging.error("Failed to connect to WebSocket. Falling back to standard polling...")
 
-            ws.close()
-        except Exception as e:
-            logging.error(f"Failed to connect or monitor via WebSocket: {e}. Falling back to standard polling...")
+        logging.info(f"Falling back to HTTP polling for Prompt ID: {prompt_id}")
+        try:
+            self.poll_until_done({prompt_id: future}, deadline)
+            return future.result() if future.done() else None
+        finally:
+            self.events.forget(prompt_id)
 
-        if not success:
-            logging.info(f"WebSocket monitoring failed or timed out. Falling back to HTTP polling for Prompt ID: {prompt_id}")
-            start_time = time.time()
-            while True:
-                history = self.get_history(prompt_id)
-                if history and prompt_id in history:
-                    logging.info("Generation complete (verified via history polling).")
-                    success = True
-                    break
-                
-                if time.time() - start_time > timeout:
-                    logging.error(f"Timeout waiting for generation (Prompt ID: {prompt_id})")
-                    return self._fallback_download(prompt_id)
-                
-                time.sleep(5)
+    def get_queue(self):
+        """Returns the /queue payload (queue_running, queue_pending), or None if it is unreachable."""
+        try:
+            response = self.session.get(
+                f"{self.url}/queue",
+                timeout=self.request_timeout,
+                verify=self.verify
+            )
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logging.warning(f"Error fetching ComfyUI queue: {e}")
+            return None
 
-        # Retrieve history to get output information
-        history = self.get_history(prompt_id)
-        if not history or prompt_id not in history:
-            logging.error(f"Could not retrieve history for Prompt ID {prompt_id} after completion.")
-            return self._fallback_download(prompt_id)
+    def queue_depth(self):
+        """Returns the number of running + pending prompts on the server, or None if /queue is unreachable."""
+        return count_queued(self.get_queue())
 
-        # Extract filename
-        outputs = history[prompt_id].get("outputs", {})
-        
-        # Find the output from SaveAudioMP3 node (ID 104)
-        node_output = outputs.get("104")
-        
-        if not node_output:
-            logging.warning(f"Node 104 not found in outputs for Prompt ID {prompt_id}. Searching all nodes for audio output...")
-            # Fallback: Search all nodes for anything that looks like audio output
-            for node_id, data in outputs.items():
-                if isinstance(data, dict) and any(k in str(data).lower() for k in ["audio", "mp3", "wav"]):
-                    logging.info(f"Potential audio output found in Node {node_id}")
-                    node_output = data
-                    break
-                elif isinstance(data, list) and len(data) > 0:
-                    if any(isinstance(f, dict) and "filename" in f for f in data):
-                         logging.info(f"Found files list in Node {node_id}")
-                         node_output = data
-                         break
-
-        if not node_output:
-            logging.error(f"No output files found in history for Prompt ID {prompt_id}. Available nodes: {list(outputs.keys())}")
-            return self._fallback_download(prompt_id)
+    def queued_prompt_ids(self):
+        """Returns the set of running + pending prompt ids, or None if /queue is unreachable."""
+        return queued_ids(self.get_queue())
 
-        files = []
-        if isinstance(node_output, list):
-            files.extend(node_output)
-        elif isinstance(node_output, dict):
-            for key, val in node_output.items():
-                if isinstance(val, list):
-                    files.extend(val)
+    def _post_command(self, path, payload):
+        """POSTs a JSON command to the server. Returns True on success."""
+        try:
+            response = self.session.post(
+                f"{self.url}{path}",
+                json=payload,
+                timeout=self.request_timeout,
+                verify=self.verify
+            )
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            logging.warning(f"Error calling ComfyUI {path}: {e}")
+            return False
 
-        if not files:
-            logging.error("No output files found in history.")
-            return self._fallback_download(prompt_id)
+    def interrupt(self, prompt_id=None):
+        """Interrupts the running prompt (only prompt_id, on servers that support targeted interrupts)."""
+        return self._post_command("/interrupt", {"prompt_id": prompt_id} if prompt_id else {})
 
-        # Download the first file
-        file_info = files[0]
-        if not file_info or not isinstance(file_info, dict):
-            logging.error("Invalid file info found in history.")
-            return self._fallback_download(prompt_id)
+    def delete_queued(self, prompt_ids):
+        """Removes pending prompts from the server queue."""
+        return self._post_command("/queue", {"delete": list(prompt_ids)})
 
-        filename = file_info.get("filename")
-        subfolder = file_info.get("subfolder", "")
-        folder_type = file_info.get("type", "output")
+    def delete_history(self, prompt_ids):
+        """Deletes history entries (the output files stay on the server)."""
+        return self._post_command("/history", {"delete": list(prompt_ids)})
 
-        return self.download_file(filename, subfolder, folder_type)
+    def cancel(self, prompt_id):
+        """
+        Stops a prompt nobody will collect: interrupts it if it is running, dequeues it if pending.
+        Returns True if the prompt was still on the server and a cancel was sent.
+        """
+        request = self.cancel_request(self.get_queue(), prompt_id)
+        if not request:
+            return False
+        position, path, payload = request
+        cancelled = self._post_command(path, payload)
+        if cancelled:
+            self.record_cancel(position, prompt_id)
+        return cancelled
 
-    def _fallback_download(self, prompt_id):
-        """Fallback method to download when history API fails (Cloudflare tunnel issue)."""
-        logging.info(f"Using fallback download for Prompt ID: {prompt_id}")
-        
-        # First, try to list audio files from output directory and download the most recent
-        logging.warning("History API unavailable (likely Cloudflare tunnel issue). Attempting to find recently generated file...")
-        audio_files = self._list_output_files("audio")
-        
-        if audio_files:
-            logging.info(f"Found {len(audio_files)} potential audio files")
-            for filename in audio_files[:5]:  # Try up to 5 files
-                try:
-                    logging.info(f"Attempting to download: {filename}")
-                    result = self.download_file(filename, "audio", "output")
-                    if result:
-                        logging.info(f"✓ Successfully downloaded via directory listing: {result}")
-                        return result
-                except Exception as e:
-                    logging.debug(f"Could not download {filename}: {e}")
-        
-        # Fallback: Try common ComfyUI naming patterns
-        logging.warning("Directory listing failed. Trying common filename patterns...")
-        common_patterns = [
-            ("ComfyUI_00001.mp3", "audio", "output"),
-            ("ComfyUI_00001.wav", "audio", "output"),
-            ("songbird.mp3", "audio", "output"),
-            ("songbird.wav", "audio", "output"),
-        ]
-        
-        for filename, subfolder, folder_type in common_patterns:
-            try:
-                logging.info(f"Trying pattern: {filename}")
-                result = self.download_file(filename, subfolder, folder_type)
-                if result:
-                    logging.info(f"✓ Successfully downloaded via fallback pattern: {result}")
-                    return result
-            except Exception as e:
-                logging.debug(f"Fallback pattern {filename} failed: {e}")
-        
-        logging.error("All fallback methods exhausted. Could not download generated file.")
+    def cancel_request(self, queue, prompt_id):
+        """(position, path, payload) of the command that cancels a prompt in a /queue payload, or None if it is not queued."""
+        position = queue_position(queue, prompt_id)
+        if position == "running":
+            # Checked against /queue first: older servers ignore prompt_id and stop whatever runs
+            return position, "/interrupt", {"prompt_id": prompt_id}
+        if position == "pending":
+            return position, "/queue", {"delete": [prompt_id]}
         return None
 
-    def _list_output_files(self, subfolder="audio"):
-        """Attempt to list files in a given output subfolder."""
+    def record_cancel(self, position, prompt_id):
+        """Logs and counts a cancel sent for a prompt at a queue position ("running" or "pending")."""
+        logging.warning(f"Cancelled abandoned {position} Prompt ID {prompt_id} on {self.url}")
+        metrics.increment("comfy.cancelled")
+
+    def _abandon(self, prompt_id):
+        """Called when we give up waiting on a prompt. Returns True if it was cancelled on the server."""
+        cancelled = self.cancel_on_timeout and self.cancel(prompt_id)
+        if cancelled:
+            self.forget_submission(prompt_id)
+        return cancelled
+
+    def warm_up(self, timeout=600):
+        """
+        Renders WARMUP_JOB through the normal workflow so ComfyUI loads the checkpoint, text
+        encoder and VAE before the first real render. Skipped when the server is unreachable or
+        already has work queued (the model is then loaded or loading anyway). Returns True if a
+        warm-up render ran.
+
+        Its history entry is deleted afterwards. ComfyUI has no API to delete output files, so
+        the tiny warm-up audio is only removed when the output directory is mounted here
+        (COMFYUI_OUTPUT_DIR); otherwise it stays in ComfyUI's output directory.
+        """
+        depth = self.queue_depth()
+        if depth is None or depth > 0:
+            logging.info(f"Skipping ComfyUI warm-up on {self.url} (queue depth: {depth})")
+            return False
+
+        started = time.time()
+        # Registered before submitting so not even the first progress event leaks out
+        prompt_id = str(uuid.uuid4())
+        self._background_prompts.add(prompt_id)
+        result = self.submit_prompt(prompt_id=prompt_id, **WARMUP_JOB)
+        if not result or "prompt_id" not in result:
+            self._background_prompts.discard(prompt_id)
+            return False
+        if result["prompt_id"] != prompt_id:
+            self._background_prompts.discard(prompt_id)
+            prompt_id = result["prompt_id"]
+            self._background_prompts.add(prompt_id)
+            self.forget_submission(prompt_id)
+        try:
+            outputs = self.wait_for(prompt_id, timeout=timeout)
+            self._remove_shared_outputs(prompt_id, outputs)
+        except ComfyExecutionError as e:
+            logging.warning(f"ComfyUI warm-up failed: {e}")
+            return False
+        finally:
+            self._output_prefixes.pop(prompt_id, None)
+            self.delete_history([prompt_id])
+            self._background_prompts.discard(prompt_id)
+
+        elapsed = time.time() - started
+        logging.info(f"ComfyUI warm-up on {self.url} finished in {elapsed:.1f}s")
+        metrics.record("comfy.warmup", url=self.url, elapsed_seconds=elapsed)
+        return True
+
+    def warm_up_async(self):
+        """Starts warm_up() in a background thread if COMFYUI_WARMUP is enabled. Returns the thread or None."""
+        if not self.warmup:
+            return None
+        thread = threading.Thread(target=self.warm_up, name="comfy-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def get_all_history(self, max_items=None):
+        """Returns every /history entry ({prompt_id: entry}), or None if it is unreachable."""
         try:
-            logging.info(f"Attempting to list files in {subfolder}/...")
-            
-            # Try to access the files directly via web interface
-            # This is a fallback that might work if the /view endpoint supports directory listing
-            response = requests.get(
-                f"{self.url}/",
-                timeout=self.timeout,
+            response = self.session.get(
+                f"{self.url}/history",
+                params={"max_items": max_items} if max_items else None,
+                timeout=self.request_timeout,
                 verify=self.verify
             )
-            
-            # Look for audio file links in the HTML
-            import re
-            pattern = r'href=["\']/view\?[^"\']*filename=([^&\'"]+)[^"\']*["\']'
-            matches = re.findall(pattern, response.text)
-            
-            if matches:
-                logging.info(f"Found {len(matches)} files in web interface")
-                # Filter for audio files
-                audio_files = [f for f in matches if f.endswith(('.mp3', '.wav', '.flac'))]
-                return audio_files[:5]  # Return first 5 to avoid too many attempts
-            
+            response.raise_for_status()
+            return response.json()
         except Exception as e:
-            logging.debug(f"Could not list files: {e}")
-        
-        return []
+            logging.warning(f"Error fetching ComfyUI history: {e}")
+            return None
+
+    def cleanup_orphans(self):
+        """
+        Cancels every queued Songbird prompt and deletes every Songbird history entry on the server.
+        Meant for a maintenance run: it cannot tell another live Songbird run's jobs from orphans.
+        Returns {"cancelled": n, "pruned": n}.
+        """
+        cancelled = pruned = 0
+        queue = self.get_queue()
+        if queue:
+            # Dequeue first so an interrupted render is not simply followed by the next orphan
+            pending = [item[1] for item in queue.get("queue_pending", []) if _is_songbird_job(item)]
+            if pending and self.delete_queued(pending):
+                cancelled += len(pending)
+            for item in queue.get("queue_running", []):
+                if _is_songbird_job(item) and self.interrupt(item[1]):
+                    cancelled += 1
+
+        history = self.get_all_history() or {}
+        stale = [pid for pid, entry in history.items() if _is_songbird_job(entry.get("prompt"))]
+        if stale and self.delete_history(stale):
+            pruned = len(stale)
+
+        logging.info(f"ComfyUI cleanup on {self.url}: cancelled {cancelled} queued prompt(s), pruned {pruned} history entries")
+        return {"cancelled": cancelled, "pruned": pruned}
+
+    def wait_for_queue_slot(self, max_pending=None, timeout=3600, poll_interval=2):
+        """
+        Blocks until the server queue holds fewer than max_pending prompts.
+        Returns False on timeout. An unreachable /queue does not block submission.
+        """
+        max_pending = max_pending or self.max_pending
+        deadline = time.time() + timeout
+        while True:
+            depth = self.queue_depth()
+            if depth is None or depth < max_pending:
+                return True
+            if time.time() > deadline:
+                logging.error(f"Timed out waiting for ComfyUI queue to drain below {max_pending} (depth {depth})")
+                return False
+            logging.info(f"ComfyUI queue full ({depth}/{max_pending}). Waiting...")
+            time.sleep(poll_interval)
+
+    def submit_when_ready(self, max_pending=None, **job):
+        """Submits a prompt (submit_prompt kwargs) once the server queue has room for it."""
+        if not self.wait_for_queue_slot(max_pending):
+            return None
+        result = self.submit_prompt(**job)
+        if result and "prompt_id" in result:
+            # Start listening before the render can finish
+            self.events.watch(result["prompt_id"])
+        return result
+
+    def submit_batch(self, jobs, max_pending=None):
+        """
+        Enqueues many prompts, keeping at most max_pending queued on the server.
+        jobs is an iterable of submit_prompt kwargs. Returns one prompt id (or None) per job.
+        """
+        prompt_ids = []
+        for job in jobs:
+            result = self.submit_when_ready(max_pending=max_pending, **job)
+            prompt_ids.append(result.get("prompt_id") if result else None)
+        return prompt_ids
+
+    def await_all(self, prompt_ids, timeout=1200):
+        """
+        Waits for many prompts at once and downloads each output as soon as it finishes.
+        Yields (prompt_id, local_path) in completion order; local_path is None on failure.
+        A prompt times out when it has not finished `timeout` seconds after the wait began;
+        downloads and the caller's time between yields never time out a finished render.
+        """
+        prompt_ids = [pid for pid in prompt_ids if pid]
+        if not prompt_ids:
+            return
+
+        futures = {self.events.watch(pid): pid for pid in prompt_ids}
+        if not self.events.wait_connected(30):
+            logging.error("Failed to connect to WebSocket. Polling the batch over HTTP...")
+            by_prompt = {pid: future for future, pid in futures.items()}
+            threading.Thread(
+                target=self.poll_until_done, args=(by_prompt, time.time() + timeout),
+                name="comfy-poll", daemon=True
+            ).start()
+
+        deadline = time.time() + timeout
+        pending = set(futures)
+        while pending:
+            # Prompts that finished while outputs were downloading are picked up at once
+            done, pending = wait(pending, timeout=max(0, deadline - time.time()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                prompt_id = futures[future]
+                try:
+                    outputs = future.result()
+                except ComfyExecutionError as e:
+                    logging.error(f"ComfyUI execution failed: {e}")
+                    self.forget_submission(prompt_id)
+                    yield prompt_id, None
+                    continue
+                yield prompt_id, self.download_outputs(prompt_id, outputs)
+
+        for future in pending:
+            prompt_id = futures[future]
+            logging.error(f"Timeout waiting for generation (Prompt ID: {prompt_id})")
+            self.events.forget(prompt_id)
+            self._abandon(prompt_id)
+            yield prompt_id, None
+
+    def wait_and_download_output(self, prompt_id, timeout=1200):
+        """Waits for completion via the shared WebSocket listener and downloads the generated file."""
+        try:
+            outputs = self.wait_for(prompt_id, timeout)
+        except ComfyExecutionError as e:
+            logging.error(f"ComfyUI execution failed: {e}")
+            self.forget_submission(prompt_id)
+            return None
+
+        if outputs is None:
+            logging.error(f"Timeout waiting for generation (Prompt ID: {prompt_id})")
+            if self._abandon(prompt_id):
+                return None
+            return self._download_by_prefix(prompt_id)
+
+        return self.download_outputs(prompt_id, outputs)
+
+    def download_outputs(self, prompt_id, outputs):
+        """Downloads the audio file from a finished prompt's outputs, consulting history if they are empty."""
+        if not outputs:
+            # Retrieve history to get output information
+            history = self.get_history(prompt_id)
+            if history and prompt_id in history:
+                outputs = history[prompt_id].get("outputs", {})
+            else:
+                logging.error(f"Could not retrieve history for Prompt ID {prompt_id} after completion.")
+        return self._download_takes(prompt_id, self.output_downloads(prompt_id, outputs))
+
+    def output_downloads(self, prompt_id, outputs):
+        """
+        The files to fetch for a finished prompt, one (filename, subfolder, type, local_name) per
+        take: picked from its outputs, else derived from its unique prefix. Consumes the prompt's
+        batch size, so it is called once per collection.
+        """
+        file_infos = (outputs and self._select_outputs(prompt_id, outputs)) or self._prefixed_outputs(prompt_id)
+        file_infos = file_infos[:self._batch_sizes.pop(prompt_id, 1)]
+        return [(filename, subfolder, folder_type, self._local_name(prompt_id, filename))
+                for filename, subfolder, folder_type in file_infos]
+
+    def finish_downloads(self, prompt_id, paths):
+        """
+        Records a prompt's downloaded takes (see pop_takes) and drops its bookkeeping.
+        Returns the first take's path, or None. The caller prunes the history entry if
+        prune_history is set and a path came back.
+        """
+        if len(paths) > 1:
+            self._takes[prompt_id] = [path for path in paths if path]
+        self._output_prefixes.pop(prompt_id, None)
+        self.forget_submission(prompt_id)
+        return next((path for path in paths if path), None)
+
+    def _download_takes(self, prompt_id, downloads):
+        """
+        Downloads a prompt's output, every take of a batched render concurrently, then prunes
+        its history. Returns the first take's path; all takes are kept for pop_takes().
+        """
+        if not downloads:
+            return None
+        if len(downloads) > 1:
+            with ThreadPoolExecutor(max_workers=len(downloads)) as pool:
+                paths = list(pool.map(lambda download: self._download_output(*download), downloads))
+        else:
+            paths = [self._download_output(*downloads[0])]
+        path = self.finish_downloads(prompt_id, paths)
+        if path and self.prune_history:
+            self.delete_history([prompt_id])
+        return path
+
+    def pop_takes(self, prompt_id):
+        """Local paths of every downloaded take of a batched prompt, first take first ([] if not batched)."""
+        return self._takes.pop(prompt_id, [])
+
+    def _select_output(self, prompt_id, outputs):
+        """Picks (filename, subfolder, type) of the prompt's audio from its outputs, or None."""
+        file_infos = self._select_outputs(prompt_id, outputs)
+        return file_infos[0] if file_infos else None
+
+    def _select_outputs(self, prompt_id, outputs):
+        """Every (filename, subfolder, type) of the prompt's audio, save node and job prefix first."""
+        files = self._output_files(outputs)
+        if not files:
+            logging.error(f"No output files found in history for Prompt ID {prompt_id}. Available nodes: {list(outputs.keys())}")
+            return []
+
+        # Prefer the file carrying this job's unique prefix
+        server_prefix = self._output_prefixes.get(prompt_id, (None, None))[0]
+        if server_prefix:
+            matching = [f for f in files if _output_path(f).startswith(server_prefix)]
+            if matching:
+                files = matching
+            else:
+                logging.warning(f"No output matches prefix {server_prefix} for Prompt ID {prompt_id}; using the save node's output.")
+
+        return [(f["filename"], f.get("subfolder", ""), f.get("type", "output")) for f in files]
+
+    def _output_files(self, outputs):
+        """File entries ({filename, subfolder, type}) from prompt outputs, save node first."""
+        save_node_id = self._save_node_id()
+        ordered = [outputs[save_node_id]] if save_node_id in outputs else []
+        if not ordered:
+            logging.warning(f"Node {save_node_id} not found in outputs. Searching all nodes for audio output...")
+        ordered += [data for node_id, data in outputs.items() if node_id != save_node_id]
+
+        files = []
+        for node_output in ordered:
+            if isinstance(node_output, list):
+                candidates = node_output
+            elif isinstance(node_output, dict):
+                candidates = [f for val in node_output.values() if isinstance(val, list) for f in val]
+            else:
+                continue
+            files.extend(f for f in candidates if isinstance(f, dict) and f.get("filename"))
+        return files
+
+    def _download_output(self, filename, subfolder, folder_type, local_name):
+        return self.download_file(filename, subfolder, folder_type, local_name=local_name)
+
+    def _local_name(self, prompt_id, filename):
+        """Local filename for a prompt's output with its job token removed (None keeps the server name)."""
+        server_prefix, local_prefix = self._output_prefixes.get(prompt_id, (None, None))
+        if server_prefix:
+            job_prefix = posixpath.basename(server_prefix)
+            if filename.startswith(job_prefix):
+                return local_prefix + filename[len(job_prefix):]
+        return None
+
+    def _prefixed_output(self, prompt_id):
+        """(filename, subfolder, type) of a prompt's output derived from its unique prefix, or None."""
+        file_infos = self._prefixed_outputs(prompt_id)
+        return file_infos[0] if file_infos else None
 
-    def download_file(self, filename, subfolder, folder_type, retries=3):
+    def _prefixed_outputs(self, prompt_id):
+        """
+        (filename, subfolder, type) of each take of a prompt's output, derived from its unique prefix.
+
+        ComfyUI numbers saved files per prefix starting at 00001 (one number per take), so a
+        prefix used by exactly one job maps to exactly these file names and nothing is guessed.
+        """
+        server_prefix = self._output_prefixes.get(prompt_id, (None, None))[0]
+        if not server_prefix:
+            logging.error(f"No output prefix recorded for Prompt ID {prompt_id}. Cannot resolve its output.")
+            return []
+        subfolder, job_prefix = posixpath.split(server_prefix)
+        takes = self._batch_sizes.get(prompt_id, 1)
+        file_infos = [(f"{job_prefix}_{take:05}_.mp3", subfolder, "output") for take in range(1, takes + 1)]
+        logging.info(f"Resolving output for Prompt ID {prompt_id} by prefix: {subfolder}/{file_infos[0][0]}")
+        return file_infos
+
+    def _download_by_prefix(self, prompt_id):
+        """Downloads a prompt's output by its unique prefix when history is unavailable."""
+        return self._download_takes(prompt_id, self.output_downloads(prompt_id, None))
+
+    def _save_node_id(self):
+        """Returns the id of the workflow's SaveAudioMP3 node."""
+        try:
+            return get_workflow_template(self.workflow_path).node_id("save_audio", "104")
+        except Exception as e:
+            logging.debug(f"Could not resolve save node from workflow template: {e}")
+            return "104"
+
+    def download_file(self, filename, subfolder, folder_type, retries=3, local_name=None):
+        """
+        Streams a ComfyUI output file to disk (as local_name if given).
+
+        The body is written in chunks to a `.part` file and moved into place once its
+        size matches Content-Length. A dropped connection resumes from the bytes already
+        on disk with an HTTP Range request. Large files on servers that accept ranges are
+        fetched as parallel segments.
+        """
         params = {
             "filename": filename,
             "subfolder": subfolder,
             "type": folder_type
         }
-        
+        url = f"{self.url}/view"
+
+        local_path, part_path = self.download_paths(filename, local_name)
+
+        if folder_type == "output" and self.place_shared_output(filename, subfolder, part_path):
+            return self.finalize_download(part_path, local_path)
+
+        split_allowed = True
         for attempt in range(retries):
+            response = None
             try:
                 logging.info(f"Downloading file: {filename} (subfolder={subfolder}, type={folder_type}) - Attempt {attempt + 1}/{retries}")
-                response = requests.get(
-                    f"{self.url}/view", 
+                downloaded = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                headers = {"Range": f"bytes={downloaded}-"} if downloaded else {}
+                if downloaded:
+                    logging.info(f"Resuming download at byte {downloaded}")
+
+                response = self.session.get(
+                    url, 
                     params=params, 
-                    timeout=self.timeout,
+                    headers=headers,
+                    timeout=self.request_timeout,
                     verify=self.verify,
-                    allow_redirects=True
+                    allow_redirects=True,
+                    stream=True
                 )
                 
                 # Log detailed response info for debugging
                 logging.debug(f"Response status: {response.status_code}")
                 logging.debug(f"Response headers: {dict(response.headers)}")
-                logging.debug(f"Content length: {len(response.content)}")
                 
                 if response.status_code == 404:
                     logging.warning(f"File not found (404): {filename}")
@@ -336,11 +1034,34 @@ class ComfyClient:
                         time.sleep(2)
                         continue
                     return None
+
+                if response.status_code == 416:
+                    # Our partial no longer matches the server's file; start over
+                    logging.warning("Server rejected resume range (416). Restarting download from zero.")
+                    os.remove(part_path)
+                    continue
                     
                 response.raise_for_status()
 
+                downloaded, total, mode = response_range(response.status_code, response.headers, downloaded)
+                if mode == "wb" and split_allowed and self.should_split(response.headers, total):
+                    response.close()
+                    if self._download_segments(url, params, part_path, total):
+                        return self.finalize_download(part_path, local_path)
+                    logging.warning("Parallel segment download failed. Falling back to a single stream.")
+                    split_allowed = False
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                    continue
+
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        if chunk:
+                            f.write(chunk)
+                            downloaded += len(chunk)
+
                 # Verify we got actual content
-                if len(response.content) == 0:
+                if downloaded == 0:
                     logging.warning(f"Downloaded file is empty (0 bytes)")
                     if attempt < retries - 1:
                         logging.info("Retrying...")
@@ -348,17 +1069,10 @@ class ComfyClient:
                         continue
                     return None
 
-                # Save to local output dir
-                # Sanitize filename to prevent path traversal
-                safe_filename = os.path.basename(filename)
-                local_path = os.path.join(self.output_dir, safe_filename)
-
-                with open(local_path, "wb") as f:
-                    f.write(response.content)
+                if total is not None and downloaded != total:
+                    raise IOError(f"Incomplete download: received {downloaded} of {total} bytes")
 
-                file_size = os.path.getsize(local_path)
-                logging.info(f"✓ Successfully saved generated audio: {local_path} (Size: {file_size} bytes)")
-                return local_path
+                return self.finalize_download(part_path, local_path)
                 
             except requests.exceptions.Timeout:
                 logging.warning(f"Download timeout (attempt {attempt + 1}/{retries}): {filename}")
@@ -366,15 +1080,13 @@ class ComfyClient:
                     logging.info("Retrying after delay...")
                     time.sleep(5)
                     continue
-                return None
                 
-            except requests.exceptions.ConnectionError as e:
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
                 logging.warning(f"Connection error (attempt {attempt + 1}/{retries}): {e}")
                 if attempt < retries - 1:
                     logging.info("Retrying after delay...")
                     time.sleep(5)
                     continue
-                return None
                     
             except Exception as e:
                 logging.error(f"Error downloading file (attempt {attempt + 1}/{retries}): {e}")
@@ -382,7 +1094,313 @@ class ComfyClient:
                     logging.info("Retrying...")
                     time.sleep(2)
                     continue
-                return None
+
+            finally:
+                if response is not None:
+                    response.close()
         
+        if os.path.exists(part_path):
+            os.remove(part_path)
         logging.error(f"Failed to download {filename} after {retries} attempts")
         return None
+
+    def download_paths(self, filename, local_name=None):
+        """
+        (local path, part path) for a download into output_dir; a stale part file is removed.
+        The part file carries the server filename, which is unique per job, so concurrent
+        downloads that share a local name never write into the same partial.
+        """
+        # Sanitize filenames to prevent path traversal
+        local_path = os.path.join(self.output_dir, os.path.basename(local_name or filename))
+        part_path = os.path.join(self.output_dir, f"{os.path.basename(filename)}.part")
+
+        # Only resume bytes fetched by this call, never a stale partial from an earlier run
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return local_path, part_path
+
+    def _shared_output_path(self, filename, subfolder):
+        """Local path of a ComfyUI output file under a mounted COMFYUI_OUTPUT_DIR, or None if not visible."""
+        for root in self.shared_output_dirs:
+            root = os.path.realpath(root)
+            path = os.path.realpath(os.path.join(root, subfolder or "", filename))
+            # Never follow names out of the mapped directory
+            if os.path.commonpath([root, path]) != root:
+                continue
+            if os.path.isfile(path) and os.path.getsize(path) > 0:
+                return path
+        return None
+
+    def _remove_shared_outputs(self, prompt_id, outputs):
+        """Deletes a prompt's output files through the shared output mount, where visible."""
+        if not self.shared_output_dirs:
+            return
+        if not outputs:
+            outputs = ((self.get_history(prompt_id) or {}).get(prompt_id) or {}).get("outputs", {})
+        for filename, subfolder, _ in self._select_outputs(prompt_id, outputs) if outputs else []:
+            path = self._shared_output_path(filename, subfolder)
+            if not path:
+                continue
+            try:
+                os.remove(path)
+                logging.info(f"Removed background render output {path}")
+            except OSError as e:
+                logging.warning(f"Could not remove background render output {path}: {e}")
+
+    def place_shared_output(self, filename, subfolder, part_path):
+        """
+        Puts an output visible on the shared filesystem at part_path without HTTP.
+        Returns False (nothing written) when the file is not mounted here or cannot be placed.
+        """
+        source = self._shared_output_path(filename, subfolder)
+        if not source:
+            return False
+        try:
+            method = _place_file(source, part_path, move=self.shared_output_move)
+        except OSError as e:
+            logging.warning(f"Could not take {source} from the shared output directory ({e}). Downloading over HTTP.")
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            return False
+        logging.info(f"Took {filename} from the shared output directory ({method}): {source}")
+        metrics.increment(f"comfy.shared_output.{method}")
+        return True
+
+    def finalize_download(self, part_path, local_path):
+        """
+        Moves a finished download to local_path. An existing file there (an earlier render
+        with the same prefix) is never replaced: the download takes the next free `_NNNNN_`
+        number instead, as ComfyUI numbers its own outputs. Returns the final path.
+        """
+        while True:
+            try:
+                # Fails atomically if the name is taken, unlike os.replace
+                os.link(part_path, local_path)
+            except FileExistsError:
+                local_path = _next_numbered_path(local_path)
+                continue
+            except OSError:
+                # Filesystem without hard links
+                if os.path.exists(local_path):
+                    local_path = _next_numbered_path(local_path)
+                    continue
+                os.replace(part_path, local_path)
+                break
+            os.remove(part_path)
+            break
+        file_size = os.path.getsize(local_path)
+        logging.info(f"✓ Successfully saved generated audio: {local_path} (Size: {file_size} bytes)")
+        return local_path
+
+    def should_split(self, headers, total):
+        """Returns True when a download (response headers, total size) is large enough to fetch as parallel ranges."""
+        return (
+            self.download_segments > 1
+            and total is not None
+            and total >= self.parallel_download_min_bytes
+            and headers.get("Accept-Ranges", "").lower() == "bytes"
+        )
+
+    def segment_bounds(self, part_path, total):
+        """Preallocates part_path for a segmented download. Returns the inclusive (start, end) byte range of each segment."""
+        segment_size = -(-total // self.download_segments)
+        bounds = [(start, min(start + segment_size, total) - 1) for start in range(0, total, segment_size)]
+        logging.info(f"Downloading {total} bytes as {len(bounds)} parallel segments")
+        with open(part_path, "wb") as f:
+            f.truncate(total)
+        return bounds
+
+    def _download_segments(self, url, params, part_path, total):
+        """Fetches a file as parallel byte ranges written into a preallocated part file."""
+        bounds = self.segment_bounds(part_path, total)
+
+        with ThreadPoolExecutor(max_workers=len(bounds)) as pool:
+            results = list(pool.map(lambda b: self._download_range(url, params, part_path, *b), bounds))
+        return all(results)
+
+    def _download_range(self, url, params, part_path, start, end, retries=3):
+        """Downloads bytes [start, end] into part_path, resuming from the last byte written."""
+        offset = start
+        for attempt in range(retries):
+            try:
+                response = self.session.get(
+                    url,
+                    params=params,
+                    headers={"Range": f"bytes={offset}-{end}"},
+                    timeout=self.request_timeout,
+                    verify=self.verify,
+                    stream=True
+                )
+                try:
+                    if response.status_code != 206:
+                        logging.warning(f"Server ignored range request (status {response.status_code})")
+                        return False
+                    with open(part_path, "r+b") as f:
+                        f.seek(offset)
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            chunk = chunk[:end + 1 - offset]
+                            f.write(chunk)
+                            offset += len(chunk)
+                            if offset > end:
+                                break
+                finally:
+                    response.close()
+
+                if offset > end:
+                    return True
+                logging.warning(f"Segment {start}-{end} ended early at byte {offset}")
+            except requests.exceptions.RequestException as e:
+                logging.warning(f"Segment {start}-{end} failed at byte {offset} (attempt {attempt + 1}/{retries}): {e}")
+            time.sleep(1)
+        return False
+
+
+def _int_header(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _content_range_total(value):
+    """Parses the total size from a `bytes start-end/total` Content-Range header."""
+    if not value or "/" not in value:
+        return None
+    return _int_header(value.rsplit("/", 1)[1])
+
+
+def _next_numbered_path(path):
+    """path with its `_NNNNN_` counter (or a `_N` suffix) incremented, e.g. song_00001_.mp3 -> song_00002_.mp3."""
+    directory, name = os.path.split(path)
+    match = re.match(r"^(.*_)(\d{5})(_\.[^.]+)$", name)
+    if match:
+        return os.path.join(directory, f"{match.group(1)}{int(match.group(2)) + 1:05}{match.group(3)}")
+    base, ext = os.path.splitext(name)
+    match = re.match(r"^(.*)_(\d+)$", base)
+    if match:
+        return os.path.join(directory, f"{match.group(1)}_{int(match.group(2)) + 1}{ext}")
+    return os.path.join(directory, f"{base}_2{ext}")
+
+
+def response_range(status_code, headers, downloaded):
+    """
+    (bytes already on disk, expected total, file mode) for writing a /view response body:
+    appended after `downloaded` bytes when the server honoured the resume Range (206),
+    otherwise written from the start (fresh download, or the Range header was ignored).
+    """
+    if downloaded and status_code == 206:
+        return downloaded, _content_range_total(headers.get("Content-Range")), "ab"
+    return 0, _int_header(headers.get("Content-Length")), "wb"
+
+
+def count_queued(queue):
+    """Running + pending count from a /queue payload (None passes through)."""
+    if queue is None:
+        return None
+    return len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+
+
+def queued_ids(queue):
+    """Running + pending prompt ids from a /queue payload (None passes through)."""
+    if queue is None:
+        return None
+    # Queue items are [number, prompt_id, prompt, extra_data, outputs_to_execute]
+    return {
+        item[1] for item in queue.get("queue_running", []) + queue.get("queue_pending", [])
+        if isinstance(item, (list, tuple)) and len(item) > 1
+    }
+
+
+def job_key(prompt):
+    """Deterministic prompt id for a patched workflow prompt: the same inputs give the same id."""
+    return str(uuid.uuid5(JOB_KEY_NAMESPACE, json.dumps(prompt, sort_keys=True, default=str)))
+
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+
+def _maybe_received(error):
+    """True when a failed POST may still have reached the server: no answer, or a 5xx, but not a refused connection."""
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return False
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return not isinstance(reason, NewConnectionError)
+    return isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError))
+
+
+def queue_position(queue, prompt_id):
+    """"running", "pending" or None (not queued, or the queue is unknown) for a prompt in a /queue payload."""
+    if not queue:
+        return None
+    for position in ("running", "pending"):
+        for item in queue.get(f"queue_{position}", []):
+            if isinstance(item, (list, tuple)) and len(item) > 1 and item[1] == prompt_id:
+                return position
+    return None
+
+
+def _is_songbird_job(item):
+    """True for a queue item or history prompt ([number, id, prompt, extra_data, ...]) that Songbird submitted."""
+    return (
+        isinstance(item, (list, tuple)) and len(item) > 3
+        and isinstance(item[3], dict) and JOB_MARKER in item[3]
+    )
+
+
+def not_queued(prompt_ids, queued):
+    """Prompt ids absent from the queued set; every id if the queue is unknown (None)."""
+    if queued is None:
+        return list(prompt_ids)
+    return [pid for pid in prompt_ids if pid not in queued]
+
+
+def _reflink(source, target):
+    """Copy-on-write clone of source at target (Linux FICLONE on btrfs/XFS/NFS 4.2); raises OSError if unsupported."""
+    import fcntl
+    FICLONE = 0x40049409
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(target)
+            raise
+
+
+def _place_file(source, target, move=False):
+    """
+    Places source at target without going through HTTP and returns how: "rename" (move=True),
+    "hardlink", "reflink", or "copy" (in-kernel via shutil) when the others are unavailable.
+    """
+    if move:
+        try:
+            os.rename(source, target)
+            return "rename"
+        except OSError:
+            shutil.move(source, target)
+            return "copy"
+    try:
+        os.link(source, target)
+        return "hardlink"
+    except OSError:
+        pass
+    try:
+        _reflink(source, target)
+        return "reflink"
+    except (ImportError, OSError):
+        pass
+    shutil.copyfile(source, target)
+    return "copy"
+
+
+def _output_path(file_info):
+    """'subfolder/filename' for a ComfyUI output file entry."""
+    return posixpath.join(file_info.get("subfolder") or "", file_info["filename"])
@@ -0,0 +1,358 @@
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+
+from tools.comfy import ComfyClient, count_queued, not_queued, queue_position, queued_ids, response_range
+from tools.comfy_events import ComfyExecutionError
+
+
+class AsyncComfyClient:
+    """
+    asyncio counterpart of ComfyClient with the same surface (submit_prompt, wait_for,
+    download_file, wait_and_download_output, ...).
+
+    HTTP goes through one pooled httpx.AsyncClient and completion comes from the
+    ComfyClient's shared WebSocket listener, awaited via asyncio.wrap_future, so a
+    single event loop can drive many concurrent renders and downloads without a
+    thread per job. Only the HTTP calls live here: submission retries, history
+    handling, output selection and download bookkeeping go through the wrapped sync
+    client's public helpers, so both APIs behave alike and can be used side by side.
+    """
+
+    def __init__(self, client=None, **client_kwargs):
+        self.client = client or ComfyClient(**client_kwargs)
+        c = self.client
+        self.http = httpx.AsyncClient(
+            base_url=c.url,
+            verify=c.verify,
+            timeout=httpx.Timeout(c.timeout, connect=c.connect_timeout),
+            limits=httpx.Limits(max_connections=c.pool_size, max_keepalive_connections=c.pool_size),
+            # Retries connection failures only; a POST /prompt is never replayed after it was sent
+            transport=httpx.AsyncHTTPTransport(verify=c.verify, retries=c.max_retries),
+        )
+
+    @property
+    def url(self):
+        return self.client.url
+
+    @property
+    def output_dir(self):
+        return self.client.output_dir
+
+    @property
+    def events(self):
+        return self.client.events
+
+    async def aclose(self):
+        await self.http.aclose()
+        self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def submit_prompt(self, lyrics, tags, filename_prefix="songbird", prompt_id=None, **params):
+        """
+        Queues a render; takes the same parameters as ComfyClient.submit_prompt and, like it,
+        retries an unanswered submission only after checking that the server does not have it.
+        """
+        try:
+            prompt, prompt_id, job_prefix = self.client.prepare_submission(
+                lyrics, tags, filename_prefix=filename_prefix, prompt_id=prompt_id, **params
+            )
+        except Exception as e:
+            logging.error(f"Error loading workflow template: {e}")
+            return None
+
+        payload = self.client.submission_payload(prompt, prompt_id, job_prefix)
+        batch_size = params.get("batch_size", 1)
+        self.client.begin_submission(prompt_id)
+        for attempt in range(self.client.max_retries + 1):
+            if self.client.needs_confirmation(prompt_id):
+                result = await self._find_submitted(prompt_id)
+                if result:
+                    return self.client.accept_submission(result, prompt_id, job_prefix, filename_prefix, batch_size)
+            try:
+                response = await self.http.post("/prompt", json=payload)
+                response.raise_for_status()
+                return self.client.accept_submission(response.json(), prompt_id, job_prefix, filename_prefix, batch_size)
+            except Exception as e:
+                delay = self.client.submission_retry_delay(prompt_id, e, attempt, _maybe_received(e))
+                if delay is None:
+                    return None
+                await asyncio.sleep(delay)
+
+    async def _find_submitted(self, prompt_id):
+        queue = await self.get_queue()
+        history = None if queue_position(queue, prompt_id) else await self.get_history(prompt_id)
+        return self.client.submitted_result(prompt_id, queue, history)
+
+    async def get_history(self, prompt_id):
+        try:
+            response = await self.http.get(f"/history/{prompt_id}")
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logging.error(f"Error fetching ComfyUI history: {e}")
+            return None
+
+    async def get_queue(self):
+        try:
+            response = await self.http.get("/queue")
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logging.warning(f"Error fetching ComfyUI queue: {e}")
+            return None
+
+    async def queue_depth(self):
+        return count_queued(await self.get_queue())
+
+    async def queued_prompt_ids(self):
+        return queued_ids(await self.get_queue())
+
+    async def _post_command(self, path, payload):
+        try:
+            response = await self.http.post(path, json=payload)
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            logging.warning(f"Error calling ComfyUI {path}: {e}")
+            return False
+
+    async def cancel(self, prompt_id):
+        """Interrupts a running prompt or dequeues a pending one. Returns True if a cancel was sent."""
+        request = self.client.cancel_request(await self.get_queue(), prompt_id)
+        if not request:
+            return False
+        position, path, payload = request
+        cancelled = await self._post_command(path, payload)
+        if cancelled:
+            self.client.record_cancel(position, prompt_id)
+        return cancelled
+
+    async def delete_history(self, prompt_ids):
+        return await self._post_command("/history", {"delete": list(prompt_ids)})
+
+    async def _wait_connected(self, timeout):
+        """Non-blocking version of ComfyEventListener.wait_connected."""
+        self.events.start()
+        deadline = time.time() + timeout
+        while not self.events.connection_attempted() and time.time() < deadline:
+            await asyncio.sleep(0.05)
+        return self.events.connected.is_set()
+
+    async def wait_for(self, prompt_id, timeout=1200):
+        """
+        Awaits a prompt's completion. Returns its outputs, or None on timeout.
+        Raises ComfyExecutionError if ComfyUI reports that the prompt failed.
+        """
+        deadline = time.time() + timeout
+        future = self.events.watch(prompt_id)
+        waiter = asyncio.wrap_future(future)
+        stall_warning = self.client.stall_warning
+        try:
+            if await self._wait_connected(30):
+                warned_at = None
+                check_interval = max(1, stall_warning / 4) if stall_warning > 0 else timeout
+                while True:
+                    # asyncio.wait does not cancel the listener's future on timeout
+                    done, _ = await asyncio.wait({waiter}, timeout=max(0, min(check_interval, deadline - time.time())))
+                    if done:
+                        logging.info("Execution complete via WebSocket signal.")
+                        return waiter.result()
+                    if time.time() >= deadline:
+                        logging.error(f"Timeout waiting for WebSocket message (Prompt ID: {prompt_id})")
+                        break
+                    if stall_warning > 0:
+                        warned_at = self.client.check_stalled(prompt_id, warned_at)
+            else:
+                logging.error("Failed to connect to WebSocket. Falling back to standard polling...")
+
+            await self._poll_until_done({prompt_id: future}, deadline)
+            return future.result() if future.done() else None
+        finally:
+            self.events.forget(prompt_id)
+
+    async def _poll_until_done(self, futures, deadline):
+        """Async twin of ComfyClient.poll_until_done: one /queue call per round, jittered backoff."""
+        started = time.time()
+        attempt = 0
+        while True:
+            pending = [pid for pid, future in futures.items() if not future.done()]
+            if not pending:
+                return
+            for prompt_id in not_queued(pending, await self.queued_prompt_ids()):
+                history = await self.get_history(prompt_id)
+                if history and prompt_id in history:
+                    self.client.apply_history_entry(prompt_id, history[prompt_id])
+
+            now = time.time()
+            if now >= deadline or all(future.done() for future in futures.values()):
+                return
+            delay, attempt = self.client.next_poll(attempt, now - started)
+            await asyncio.sleep(min(delay, deadline - now))
+
+    async def wait_and_download_output(self, prompt_id, timeout=1200):
+        try:
+            outputs = await self.wait_for(prompt_id, timeout)
+        except ComfyExecutionError as e:
+            logging.error(f"ComfyUI execution failed: {e}")
+            self.client.forget_submission(prompt_id)
+            return None
+
+        if outputs is None:
+            logging.error(f"Timeout waiting for generation (Prompt ID: {prompt_id})")
+            if self.client.cancel_on_timeout and await self.cancel(prompt_id):
+                self.client.forget_submission(prompt_id)
+                return None
+        return await self.download_outputs(prompt_id, outputs)
+
+    async def download_outputs(self, prompt_id, outputs):
+        """
+        Downloads the audio file from a finished prompt's outputs, consulting history if
+        they are empty. With outputs=None (timed out) the file is resolved by its prefix.
+        """
+        if outputs is not None and not outputs:
+            history = await self.get_history(prompt_id)
+            if history and prompt_id in history:
+                outputs = history[prompt_id].get("outputs", {})
+            else:
+                logging.error(f"Could not retrieve history for Prompt ID {prompt_id} after completion.")
+
+        downloads = self.client.output_downloads(prompt_id, outputs)
+        if not downloads:
+            return None
+        # Every take of a batched render is downloaded concurrently
+        paths = await asyncio.gather(*[
+            self.download_file(filename, subfolder, folder_type, local_name=local_name)
+            for filename, subfolder, folder_type, local_name in downloads
+        ])
+        path = self.client.finish_downloads(prompt_id, paths)
+        if path and self.client.prune_history:
+            await self.delete_history([prompt_id])
+        return path
+
+    def pop_takes(self, prompt_id):
+        return self.client.pop_takes(prompt_id)
+
+    async def download_file(self, filename, subfolder, folder_type, retries=3, local_name=None):
+        """
+        Streams a ComfyUI output file to `<name>.part`, resuming with Range, then renames it
+        atomically. Large files on servers that accept ranges are fetched as concurrent segments.
+        """
+        params = {"filename": filename, "subfolder": subfolder, "type": folder_type}
+        local_path, part_path = self.client.download_paths(filename, local_name)
+
+        if folder_type == "output" and await asyncio.to_thread(self.client.place_shared_output, filename, subfolder, part_path):
+            return self.client.finalize_download(part_path, local_path)
+
+        split_allowed = True
+        for attempt in range(retries):
+            try:
+                logging.info(f"Downloading file: {filename} (subfolder={subfolder}, type={folder_type}) - Attempt {attempt + 1}/{retries}")
+                downloaded = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                headers = {"Range": f"bytes={downloaded}-"} if downloaded else {}
+
+                async with self.http.stream("GET", "/view", params=params, headers=headers, follow_redirects=True) as response:
+                    if response.status_code == 404:
+                        logging.warning(f"File not found (404): {filename}")
+                        if attempt < retries - 1:
+                            await asyncio.sleep(2)
+                            continue
+                        return None
+
+                    if response.status_code == 416:
+                        logging.warning("Server rejected resume range (416). Restarting download from zero.")
+                        os.remove(part_path)
+                        continue
+
+                    response.raise_for_status()
+
+                    downloaded, total, mode = response_range(response.status_code, response.headers, downloaded)
+                    split = mode == "wb" and split_allowed and self.client.should_split(response.headers, total)
+                    if not split:
+                        with open(part_path, mode) as f:
+                            # Written as received, so a dropped connection keeps every byte for the resume
+                            async for chunk in response.aiter_bytes():
+                                f.write(chunk)
+                                downloaded += len(chunk)
+
+                if split:
+                    if await self._download_segments(params, part_path, total):
+                        return self.client.finalize_download(part_path, local_path)
+                    logging.warning("Parallel segment download failed. Falling back to a single stream.")
+                    split_allowed = False
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                    continue
+
+                if downloaded == 0:
+                    logging.warning("Downloaded file is empty (0 bytes)")
+                    if attempt < retries - 1:
+                        await asyncio.sleep(2)
+                        continue
+                    return None
+
+                if total is not None and downloaded != total:
+                    raise IOError(f"Incomplete download: received {downloaded} of {total} bytes")
+
+                return self.client.finalize_download(part_path, local_path)
+
+            except (httpx.TransportError, IOError) as e:
+                logging.warning(f"Connection error (attempt {attempt + 1}/{retries}): {e}")
+            except Exception as e:
+                logging.error(f"Error downloading file (attempt {attempt + 1}/{retries}): {e}")
+            if attempt < retries - 1:
+                await asyncio.sleep(2)
+
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        logging.error(f"Failed to download {filename} after {retries} attempts")
+        return None
+
+    async def _download_segments(self, params, part_path, total):
+        """Fetches a file as concurrent byte ranges written into a preallocated part file."""
+        bounds = self.client.segment_bounds(part_path, total)
+        results = await asyncio.gather(*[self._download_range(params, part_path, start, end) for start, end in bounds])
+        return all(results)
+
+    async def _download_range(self, params, part_path, start, end, retries=3):
+        """Downloads bytes [start, end] into part_path, resuming from the last byte written."""
+        offset = start
+        for attempt in range(retries):
+            try:
+                async with self.http.stream("GET", "/view", params=params, headers={"Range": f"bytes={offset}-{end}"}) as response:
+                    if response.status_code != 206:
+                        logging.warning(f"Server ignored range request (status {response.status_code})")
+                        return False
+                    with open(part_path, "r+b") as f:
+                        f.seek(offset)
+                        async for chunk in response.aiter_bytes():
+                            chunk = chunk[:end + 1 - offset]
+                            f.write(chunk)
+                            offset += len(chunk)
+                            if offset > end:
+                                break
+
+                if offset > end:
+                    return True
+                logging.warning(f"Segment {start}-{end} ended early at byte {offset}")
+            except httpx.HTTPError as e:
+                logging.warning(f"Segment {start}-{end} failed at byte {offset} (attempt {attempt + 1}/{retries}): {e}")
+            await asyncio.sleep(1)
+        return False
+
+
+def _maybe_received(error):
+    """httpx counterpart of the sync client's check: no answer or a 5xx, but not a refused connection."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+        return False
+    return isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError))
@@ -0,0 +1,325 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import websocket
+
+# Seconds between recv() wake-ups, so stop() is noticed promptly
+RECV_POLL_INTERVAL = 5
+
+
+def format_progress(event):
+    """One-line human summary of a progress event, e.g. 'abc12345 node 3: 12/50 (2.4 it/s, ETA 16s)'."""
+    label = f"{event['prompt_id'][:8]}"
+    if event["type"] in ("completed", "failed"):
+        return f"{label} {event['type']} after {event['elapsed_seconds']:.0f}s"
+    text = f"{label} node {event.get('node')}"
+    if event.get("max"):
+        text += f": {event['value']}/{event['max']}"
+    if event.get("steps_per_second"):
+        text += f" ({event['steps_per_second']:.1f} it/s, ETA {event['eta_seconds']:.0f}s)"
+    if event.get("cached_nodes"):
+        text += f" [{len(event['cached_nodes'])} cached]"
+    return text
+
+
+class ComfyExecutionError(Exception):
+    """Set on a prompt's future when ComfyUI reports an execution error or interruption."""
+
+    def __init__(self, prompt_id, data=None):
+        self.prompt_id = prompt_id
+        self.data = data or {}
+        message = self.data.get("exception_message") or self.data.get("message") or "execution failed"
+        super().__init__(f"Prompt {prompt_id}: {message}")
+
+
+class ComfyEventListener:
+    """
+    A long-lived WebSocket for one ComfyUI client_id.
+
+    A background thread receives every event for the client, routes
+    `executed` outputs and completion/error signals to per-prompt futures,
+    and reconnects with backoff when the socket drops. One listener can
+    track any number of queued prompts.
+
+    `progress`, `executing` and `execution_cached` messages are folded into a
+    per-prompt progress snapshot (current node, step, step rate, ETA, cached
+    nodes) that is passed to every registered progress callback.
+    """
+
+    def __init__(self, ws_url, sslopt=None, connect_timeout=30, on_connect=None, max_backoff=60, finished_cache_size=256):
+        self.ws_url = ws_url
+        self.sslopt = sslopt or {}
+        self.connect_timeout = connect_timeout
+        # Called with the pending prompt ids after every (re)connect, to recover missed events
+        self.on_connect = on_connect
+        self.max_backoff = max_backoff
+        self.finished_cache_size = finished_cache_size
+
+        self.connected = threading.Event()
+        self._attempted = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._ws = None
+
+        self._futures = {}
+        self._outputs = {}
+        self._progress = {}
+        self._progress_callbacks = []
+        # Prompt currently executing, for servers whose progress messages lack prompt_id
+        self._current_prompt = None
+        # prompt_id -> (outputs, error), so watch() after completion still resolves
+        self._finished = OrderedDict()
+
+    def start(self):
+        """Starts the background listener thread if it is not already running."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="comfy-events", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the listener and closes the socket."""
+        self._stop.set()
+        ws = self._ws
+        if ws:
+            try:
+                ws.close()
+            except Exception:
+                pass
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=RECV_POLL_INTERVAL + 1)
+
+    def wait_connected(self, timeout):
+        """Blocks until connected or the first connection attempt fails. Returns True if connected."""
+        self.start()
+        self._attempted.wait(timeout)
+        return self.connected.is_set()
+
+    def connection_attempted(self):
+        """True once the current connection attempt has finished, successfully or not."""
+        return self._attempted.is_set()
+
+    def watch(self, prompt_id):
+        """Returns a Future resolving to the prompt's outputs ({node_id: output}) when it finishes."""
+        with self._lock:
+            future = self._futures.get(prompt_id)
+            if future is None:
+                future = Future()
+                finished = self._finished.get(prompt_id)
+                if finished:
+                    outputs, error = finished
+                    if error:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(outputs)
+                else:
+                    self._futures[prompt_id] = future
+        self.start()
+        return future
+
+    def reset(self, prompt_id):
+        """
+        Drops what is known about an earlier, finished run of a prompt id, so watch() awaits
+        the next run (the same job resubmitted) instead of resolving with the old outputs or error.
+        A prompt still being watched is left alone.
+        """
+        with self._lock:
+            if prompt_id in self._futures:
+                return
+            self._finished.pop(prompt_id, None)
+            self._outputs.pop(prompt_id, None)
+            self._progress.pop(prompt_id, None)
+
+    def forget(self, prompt_id):
+        """Stops tracking a prompt (e.g. after the caller gave up waiting)."""
+        with self._lock:
+            self._futures.pop(prompt_id, None)
+            self._outputs.pop(prompt_id, None)
+            self._progress.pop(prompt_id, None)
+
+    def add_progress_callback(self, callback):
+        """Registers callback(event) for every progress event; event is a progress snapshot dict."""
+        self._progress_callbacks.append(callback)
+
+    def progress(self, prompt_id):
+        """Returns a copy of the latest progress snapshot for a prompt, or None."""
+        with self._lock:
+            state = self._progress.get(prompt_id)
+            return dict(state) if state else None
+
+    def _update_progress(self, prompt_id, event_type, **changes):
+        """Applies changes to a prompt's progress snapshot and notifies callbacks."""
+        now = time.time()
+        with self._lock:
+            state = self._progress.setdefault(prompt_id, {
+                "prompt_id": prompt_id,
+                "started_at": now,
+                "node": None,
+                "value": 0,
+                "max": 0,
+                "steps_per_second": None,
+                "eta_seconds": None,
+                "cached_nodes": [],
+                "_step_origin": None,
+            })
+            state.update(changes)
+            state["type"] = event_type
+            state["updated_at"] = now
+            state["elapsed_seconds"] = now - state["started_at"]
+            event = {k: v for k, v in state.items() if not k.startswith("_")}
+
+        for callback in list(self._progress_callbacks):
+            try:
+                callback(event)
+            except Exception as e:
+                logging.debug(f"Progress callback failed: {e}")
+
+    def _on_step(self, prompt_id, node, value, maximum):
+        """Records a sampler step and derives the step rate and ETA for the current node."""
+        now = time.time()
+        with self._lock:
+            state = self._progress.get(prompt_id) or {}
+            origin = state.get("_step_origin")
+            if not origin or origin[0] != node or value < origin[1]:
+                origin = (node, value, now)
+        rate = eta = None
+        steps_done = value - origin[1]
+        if steps_done > 0 and now > origin[2]:
+            rate = steps_done / (now - origin[2])
+            eta = max(0, maximum - value) / rate
+        self._update_progress(
+            prompt_id, "progress", node=node, value=value, max=maximum,
+            steps_per_second=rate, eta_seconds=eta, _step_origin=origin
+        )
+
+    def pending(self):
+        """Prompt ids being watched that have not finished yet."""
+        with self._lock:
+            return list(self._futures)
+
+    def complete(self, prompt_id, outputs=None):
+        """Marks a prompt finished; used for WebSocket events and for completions found via /history."""
+        with self._lock:
+            if prompt_id in self._finished:
+                return
+            collected = self._outputs.pop(prompt_id, {})
+            if outputs:
+                collected.update(outputs)
+            self._remember(prompt_id, (collected, None))
+            future = self._futures.pop(prompt_id, None)
+            track = prompt_id in self._progress
+        if track:
+            self._update_progress(prompt_id, "completed", eta_seconds=0)
+        if future and not future.done():
+            future.set_result(collected)
+
+    def fail(self, prompt_id, data=None):
+        """Marks a prompt failed; its future raises ComfyExecutionError."""
+        error = ComfyExecutionError(prompt_id, data)
+        with self._lock:
+            if prompt_id in self._finished:
+                return
+            self._outputs.pop(prompt_id, None)
+            self._remember(prompt_id, (None, error))
+            future = self._futures.pop(prompt_id, None)
+            track = prompt_id in self._progress
+        if track:
+            self._update_progress(prompt_id, "failed", eta_seconds=None)
+        if future and not future.done():
+            future.set_exception(error)
+
+    def _remember(self, prompt_id, entry):
+        self._finished[prompt_id] = entry
+        while len(self._finished) > self.finished_cache_size:
+            evicted, _ = self._finished.popitem(last=False)
+            self._progress.pop(evicted, None)
+
+    def _dispatch(self, raw):
+        """Routes one JSON WebSocket message."""
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            logging.debug(f"Ignoring non-JSON WebSocket message: {raw[:100]}")
+            return
+
+        msg_type = message.get("type")
+        data = message.get("data") or {}
+        prompt_id = data.get("prompt_id")
+        if msg_type == "progress" and not prompt_id:
+            prompt_id = self._current_prompt
+        if not prompt_id:
+            return
+
+        if msg_type == "executed":
+            with self._lock:
+                if prompt_id not in self._finished:
+                    self._outputs.setdefault(prompt_id, {})[data.get("node")] = data.get("output")
+        elif msg_type == "executing" and data.get("node") is None:
+            # When node is None the workflow has finished
+            self.complete(prompt_id)
+        elif msg_type == "executing":
+            self._current_prompt = prompt_id
+            self._update_progress(prompt_id, "executing", node=data.get("node"))
+        elif msg_type == "execution_start":
+            self._current_prompt = prompt_id
+            self._update_progress(prompt_id, "execution_start", started_at=time.time())
+        elif msg_type == "execution_cached":
+            self._update_progress(prompt_id, "execution_cached", cached_nodes=list(data.get("nodes") or []))
+        elif msg_type == "progress":
+            self._on_step(prompt_id, data.get("node"), data.get("value", 0), data.get("max", 0))
+        elif msg_type == "execution_success":
+            self.complete(prompt_id)
+        elif msg_type in ("execution_error", "execution_interrupted"):
+            logging.error(f"ComfyUI reported {msg_type} for Prompt ID {prompt_id}")
+            self.fail(prompt_id, data)
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            ws = None
+            try:
+                ws = websocket.WebSocket()
+                ws.settimeout(self.connect_timeout)
+                ws.connect(self.ws_url, sslopt=self.sslopt)
+                ws.settimeout(RECV_POLL_INTERVAL)
+                self._ws = ws
+                self.connected.set()
+                self._attempted.set()
+                backoff = 1
+                logging.info(f"WebSocket connected: {self.ws_url}")
+
+                if self.on_connect:
+                    pending = self.pending()
+                    if pending:
+                        threading.Thread(target=self.on_connect, args=(pending,), daemon=True).start()
+
+                while not self._stop.is_set():
+                    try:
+                        out = ws.recv()
+                    except websocket.WebSocketTimeoutException:
+                        continue
+                    # Binary frames are preview images; only JSON text carries events
+                    if out and isinstance(out, str):
+                        self._dispatch(out)
+            except Exception as e:
+                if not self._stop.is_set():
+                    logging.warning(f"ComfyUI WebSocket error: {e}. Reconnecting in {backoff}s...")
+            finally:
+                self.connected.clear()
+                self._attempted.set()
+                self._ws = None
+                if ws:
+                    try:
+                        ws.close()
+                    except Exception:
+                        pass
+
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
@@ -0,0 +1,222 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from tools.comfy import ComfyClient
+
+
+def comfy_urls_from_env():
+    """Returns the render node URLs from COMFYUI_URLS (comma-separated), else COMFYUI_URL."""
+    urls = [u.strip() for u in os.getenv("COMFYUI_URLS", "").split(",") if u.strip()]
+    return urls or [os.getenv("COMFYUI_URL", "http://localhost:8188")]
+
+
+class ComfyPool:
+    """
+    A set of ComfyUI render nodes behind the ComfyClient interface used by the workflow.
+
+    Each prompt is routed to the healthy node with the lowest predicted finish
+    time ((queue depth + 1) x that node's average render time, measured from
+    ComfyUI's execution_start event so queue wait is not counted twice). The node that
+    accepted a prompt is remembered so waiting and downloading stay pinned to it.
+    Nodes whose /queue or /prompt calls fail are taken out of rotation for a cooldown.
+    """
+
+    def __init__(self, urls, output_dir="output", cooldown=None, **client_kwargs):
+        self.nodes = [ComfyClient(url=url, output_dir=output_dir, **client_kwargs) for url in urls]
+        self.cooldown = cooldown if cooldown is not None else float(os.getenv("COMFYUI_NODE_COOLDOWN", "60"))
+        self._output_dir = output_dir
+        self._lock = threading.Lock()
+        self._owners = {}
+        # prompt_id -> seconds from execution_start to completion, reported by each node's listener
+        self._execution_seconds = {}
+        self._unhealthy_until = {node.url: 0 for node in self.nodes}
+        # Exponentially weighted average render seconds per node (None until observed)
+        self._avg_render = {node.url: None for node in self.nodes}
+        for node in self.nodes:
+            node.add_progress_callback(self._record_execution)
+
+    @property
+    def output_dir(self):
+        return self._output_dir
+
+    @output_dir.setter
+    def output_dir(self, value):
+        self._output_dir = value
+        for node in self.nodes:
+            node.output_dir = value
+
+    @property
+    def max_pending(self):
+        return sum(node.max_pending for node in self.nodes)
+
+    def add_progress_callback(self, callback):
+        """Registers callback(event) for progress/ETA events from every node."""
+        for node in self.nodes:
+            node.add_progress_callback(callback)
+
+    def warm_up_async(self):
+        """Warms every node in the background. Returns the started threads."""
+        return [thread for thread in (node.warm_up_async() for node in self.nodes) if thread]
+
+    def close(self):
+        for node in self.nodes:
+            node.close()
+
+    def build_prompt(self, *args, **kwargs):
+        return self.nodes[0].build_prompt(*args, **kwargs)
+
+    def node_for(self, prompt_id):
+        """The node that accepted a prompt (first node if unknown)."""
+        with self._lock:
+            return self._owners.get(prompt_id, self.nodes[0])
+
+    def healthy_nodes(self):
+        now = time.time()
+        healthy = [node for node in self.nodes if self._unhealthy_until[node.url] <= now]
+        if not healthy:
+            logging.warning("All ComfyUI nodes are marked unhealthy. Trying all of them.")
+            return list(self.nodes)
+        return healthy
+
+    def mark_unhealthy(self, node):
+        logging.warning(f"Taking ComfyUI node {node.url} out of rotation for {self.cooldown:.0f}s")
+        self._unhealthy_until[node.url] = time.time() + self.cooldown
+
+    def _ranked_nodes(self, max_pending=None):
+        """Healthy nodes with room in their queue, best predicted finish time first."""
+        candidates = []
+        for node in self.healthy_nodes():
+            depth = node.queue_depth()
+            if depth is None:
+                self.mark_unhealthy(node)
+                continue
+            if depth >= (max_pending or node.max_pending):
+                continue
+            candidates.append(((depth + 1) * self.predicted_render_seconds(node), depth, node))
+        candidates.sort(key=lambda c: (c[0], c[1]))
+        return [node for _, _, node in candidates]
+
+    def predicted_render_seconds(self, node):
+        """Average render time for a node; unobserved nodes assume the pool average."""
+        avg = self._avg_render[node.url]
+        if avg is not None:
+            return avg
+        observed = [v for v in self._avg_render.values() if v is not None]
+        return sum(observed) / len(observed) if observed else 1.0
+
+    def _record_submission(self, node, result):
+        prompt_id = result["prompt_id"]
+        with self._lock:
+            self._owners[prompt_id] = node
+        logging.info(f"Routed Prompt ID {prompt_id} to {node.url}")
+
+    def _record_execution(self, event):
+        """Keeps the execution time of finished prompts; elapsed_seconds runs from execution_start."""
+        if event["type"] == "completed":
+            with self._lock:
+                self._execution_seconds[event["prompt_id"]] = event["elapsed_seconds"]
+
+    def _record_completion(self, prompt_id):
+        """Folds a prompt's execution time into its node's average. Skipped when no events were seen."""
+        with self._lock:
+            node = self._owners.get(prompt_id)
+            elapsed = self._execution_seconds.pop(prompt_id, None)
+            if node is None or elapsed is None:
+                return
+            previous = self._avg_render[node.url]
+            self._avg_render[node.url] = elapsed if previous is None else 0.7 * previous + 0.3 * elapsed
+
+    def submit_when_ready(self, max_pending=None, timeout=3600, poll_interval=2, **job):
+        """Submits to the best node with a free queue slot, waiting while every node is full."""
+        deadline = time.time() + timeout
+        while True:
+            for node in self._ranked_nodes(max_pending):
+                result = node.submit_prompt(**job)
+                if result and "prompt_id" in result:
+                    self._record_submission(node, result)
+                    node.events.watch(result["prompt_id"])
+                    return result
+                self.mark_unhealthy(node)
+            if time.time() > deadline:
+                logging.error("Timed out waiting for a ComfyUI node with a free queue slot")
+                return None
+            time.sleep(poll_interval)
+
+    def submit_prompt(self, **job):
+        """Submits to the best node immediately, ignoring queue limits."""
+        return self.submit_when_ready(max_pending=float("inf"), timeout=0, **job)
+
+    def submit_batch(self, jobs, max_pending=None):
+        prompt_ids = []
+        for job in jobs:
+            result = self.submit_when_ready(max_pending=max_pending, **job)
+            prompt_ids.append(result.get("prompt_id") if result else None)
+        return prompt_ids
+
+    def get_history(self, prompt_id):
+        return self.node_for(prompt_id).get_history(prompt_id)
+
+    def pop_takes(self, prompt_id):
+        return self.node_for(prompt_id).pop_takes(prompt_id)
+
+    def cancel(self, prompt_id):
+        return self.node_for(prompt_id).cancel(prompt_id)
+
+    def reattach(self):
+        """Runs ComfyClient.reattach on every node and pins each reattached prompt to its node."""
+        reattached = {}
+        for node in self.nodes:
+            entries = node.reattach()
+            with self._lock:
+                for prompt_id in entries:
+                    self._owners[prompt_id] = node
+            reattached.update(entries)
+        return reattached
+
+    def cleanup_orphans(self):
+        """Runs ComfyClient.cleanup_orphans on every node and sums the counts."""
+        totals = {"cancelled": 0, "pruned": 0}
+        for node in self.nodes:
+            for key, count in node.cleanup_orphans().items():
+                totals[key] += count
+        return totals
+
+    def wait_and_download_output(self, prompt_id, timeout=1200):
+        path = self.node_for(prompt_id).wait_and_download_output(prompt_id, timeout)
+        self._record_completion(prompt_id)
+        return path
+
+    def await_all(self, prompt_ids, timeout=1200):
+        """Waits on every node in parallel. Yields (prompt_id, local_path) in completion order."""
+        by_node = {}
+        for prompt_id in prompt_ids:
+            if prompt_id:
+                by_node.setdefault(self.node_for(prompt_id), []).append(prompt_id)
+
+        results = queue.Queue()
+
+        def collect(node, ids):
+            try:
+                for prompt_id, path in node.await_all(ids, timeout):
+                    results.put((prompt_id, path))
+            except Exception as e:
+                logging.error(f"Error collecting renders from {node.url}: {e}")
+                for prompt_id in ids:
+                    results.put((prompt_id, None))
+
+        for node, ids in by_node.items():
+            threading.Thread(target=collect, args=(node, ids), daemon=True).start()
+
+        # Each collector yields every id it owns exactly once, except after an error mid-batch
+        seen = set()
+        total = sum(len(ids) for ids in by_node.values())
+        while len(seen) < total:
+            prompt_id, path = results.get()
+            if prompt_id in seen:
+                continue
+            seen.add(prompt_id)
+            self._record_completion(prompt_id)
+            yield prompt_id, path
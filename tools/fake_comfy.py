@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for a ComfyUI server, for offline tests and benchmarks.
+
+Implements the parts of the ComfyUI API Songbird uses: POST /prompt, GET/POST /queue,
+GET/POST /history, GET /view (with Range support), POST /interrupt and the /ws event
+stream (status, execution_start, execution_cached, executing, progress, executed,
+execution_success / execution_error / execution_interrupted). Renders take a
+configurable time and produce synthetic MP3 bytes; failures, dropped WebSockets,
+slow HTTP and a pre-filled queue can be injected.
+
+    python -m tools.fake_comfy --port 8188 --render-seconds 5 --fail-rate 0.1
+"""
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import random
+import socket
+import struct
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# One MPEG-1 Layer III frame header (128 kbps, 44.1 kHz, no padding) and its frame length
+MP3_FRAME_HEADER = b"\xff\xfb\x90\x64"
+MP3_FRAME_LENGTH = 417
+
+
+def synthetic_mp3(size):
+    """Returns `size` bytes that look like an MP3 file: an empty ID3v2 tag followed by silent frames."""
+    frame = MP3_FRAME_HEADER + b"\x00" * (MP3_FRAME_LENGTH - len(MP3_FRAME_HEADER))
+    data = b"ID3\x04\x00\x00\x00\x00\x00\x00" + frame * (size // MP3_FRAME_LENGTH + 1)
+    return data[:size]
+
+
+class _WebSocketConnection:
+    """Server side of one /ws connection: unmasked text frames out, control frames in."""
+
+    def __init__(self, handler, client_id):
+        self.client_id = client_id
+        self.sock = handler.connection
+        self.rfile = handler.rfile
+        self.wfile = handler.wfile
+        self.closed = threading.Event()
+        self._send_lock = threading.Lock()
+
+    def send_text(self, text):
+        payload = text.encode("utf-8")
+        self._send_frame(0x1, payload)
+
+    def _send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+        with self._send_lock:
+            if self.closed.is_set():
+                raise ConnectionError("WebSocket closed")
+            self.wfile.write(header + payload)
+            self.wfile.flush()
+
+    def drop(self):
+        """Closes the TCP connection without a close handshake, like a crashed tunnel."""
+        self.closed.set()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def serve(self):
+        """Reads client frames until the client closes or the connection drops."""
+        try:
+            while not self.closed.is_set():
+                head = self.rfile.read(2)
+                if len(head) < 2:
+                    break
+                opcode = head[0] & 0x0F
+                length = head[1] & 0x7F
+                if length == 126:
+                    length = struct.unpack("!H", self.rfile.read(2))[0]
+                elif length == 127:
+                    length = struct.unpack("!Q", self.rfile.read(8))[0]
+                mask = self.rfile.read(4) if head[1] & 0x80 else b"\x00\x00\x00\x00"
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self.rfile.read(length)))
+                if opcode == 0x8:
+                    self._send_frame(0x8, payload[:2])
+                    break
+                if opcode == 0x9:
+                    self._send_frame(0xA, payload)
+        except (OSError, ValueError, struct.error):
+            pass
+        finally:
+            self.closed.set()
+
+
+class _Job:
+    def __init__(self, number, prompt_id, prompt, client_id, extra_data=None):
+        self.number = number
+        self.prompt_id = prompt_id
+        self.prompt = prompt
+        self.client_id = client_id
+        self.extra_data = dict(extra_data or {}, client_id=client_id)
+        self.interrupted = threading.Event()
+
+    def queue_item(self):
+        # [number, prompt_id, prompt, extra_data, outputs_to_execute], as ComfyUI reports it
+        return [self.number, self.prompt_id, self.prompt, self.extra_data, []]
+
+
+def _node_signatures(nodes):
+    """Maps node ids to a signature of their inputs, with links replaced by the upstream signature."""
+    signatures = {}
+
+    def signature(node_id, seen=()):
+        if node_id not in signatures:
+            node = nodes.get(node_id) or {}
+            inputs = {}
+            for name, value in (node.get("inputs") or {}).items():
+                if isinstance(value, list) and len(value) == 2 and str(value[0]) in nodes and str(value[0]) not in seen:
+                    value = [signature(str(value[0]), seen + (node_id,)), value[1]]
+                inputs[name] = value
+            signatures[node_id] = json.dumps([node.get("class_type"), inputs], sort_keys=True, default=str)
+        return signatures[node_id]
+
+    for node_id in nodes:
+        signature(node_id)
+    return signatures
+
+
+class FakeComfyServer:
+    """
+    In-process fake ComfyUI.
+
+    :param render_seconds: Wall time per render, spread over the sampler's steps.
+    :param fail_rate: Probability that a render ends in execution_error.
+    :param ws_drop_rate: Probability that sending any WebSocket event drops the connection instead.
+    :param ws_enabled: When False, /ws answers 404 so clients must fall back to HTTP polling.
+    :param backlog: Prompts from other clients queued at startup (each takes render_seconds).
+    :param http_latency: Delay added before every HTTP response.
+    :param http_error_rate: Probability that POST /prompt answers 503.
+    :param lost_response_rate: Probability that POST /prompt queues the job but drops the connection unanswered.
+    :param audio_bytes: Size of each synthetic MP3.
+    :param seed: Seed for the injected randomness, for repeatable runs.
+    :param output_dir: Also write outputs here, like ComfyUI's output directory (for COMFYUI_OUTPUT_DIR).
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, render_seconds=0.2, fail_rate=0.0, ws_drop_rate=0.0,
+                 ws_enabled=True, backlog=0, http_latency=0.0, http_error_rate=0.0, lost_response_rate=0.0, audio_bytes=256 * 1024, seed=None, output_dir=None):
+        self.render_seconds = render_seconds
+        self.fail_rate = fail_rate
+        self.ws_drop_rate = ws_drop_rate
+        self.ws_enabled = ws_enabled
+        self.http_latency = http_latency
+        self.http_error_rate = http_error_rate
+        self.lost_response_rate = lost_response_rate
+        self.audio_bytes = audio_bytes
+        self.random = random.Random(seed)
+        self.output_dir = output_dir
+
+        self.request_counts = Counter()
+        self.files = {}
+        self.history = OrderedDict()
+
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)
+        self._pending = []
+        self._running = None
+        self._counter = 0
+        self._file_counters = Counter()
+        # Input signatures of the nodes the last prompt executed, like ComfyUI's classic cache
+        self._cache_signatures = set()
+        self._sockets = {}
+        self._stop = threading.Event()
+
+        self.httpd = ThreadingHTTPServer((host, port), _FakeComfyHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self._threads = []
+
+        for _ in range(backlog):
+            self.enqueue({}, client_id="backlog")
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        for target, name in ((self.httpd.serve_forever, "fake-comfy-http"), (self._worker, "fake-comfy-render")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._work:
+            if self._running:
+                self._running.interrupted.set()
+            self._work.notify_all()
+        for connections in list(self._sockets.values()):
+            for ws in list(connections):
+                ws.drop()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    # --- Queue -------------------------------------------------------------------------
+
+    def enqueue(self, prompt, client_id=None, prompt_id=None, extra_data=None):
+        with self._work:
+            self._counter += 1
+            job = _Job(self._counter, prompt_id or str(uuid.uuid4()), prompt, client_id, extra_data)
+            self._pending.append(job)
+            self._work.notify()
+            return job
+
+    def queue_snapshot(self):
+        with self._lock:
+            running = [self._running.queue_item()] if self._running else []
+            return {"queue_running": running, "queue_pending": [job.queue_item() for job in self._pending]}
+
+    def delete_pending(self, prompt_ids=None):
+        """Removes pending prompts (all of them when prompt_ids is None)."""
+        with self._lock:
+            self._pending = [job for job in self._pending if prompt_ids is not None and job.prompt_id not in prompt_ids]
+
+    def interrupt(self, prompt_id=None):
+        with self._lock:
+            if self._running and (prompt_id is None or self._running.prompt_id == prompt_id):
+                self._running.interrupted.set()
+
+    # --- WebSocket fan-out ---------------------------------------------------------------
+
+    def _attach(self, ws):
+        with self._lock:
+            self._sockets.setdefault(ws.client_id, set()).add(ws)
+            remaining = len(self._pending) + (1 if self._running else 0)
+        self._send_to(ws, "status", {"status": {"exec_info": {"queue_remaining": remaining}}, "sid": ws.client_id})
+
+    def _detach(self, ws):
+        with self._lock:
+            self._sockets.get(ws.client_id, set()).discard(ws)
+
+    def _send_to(self, ws, msg_type, data):
+        if self.ws_drop_rate and self.random.random() < self.ws_drop_rate:
+            logging.info(f"Fake ComfyUI: dropping WebSocket for {ws.client_id} instead of sending {msg_type}")
+            ws.drop()
+            return
+        try:
+            ws.send_text(json.dumps({"type": msg_type, "data": data}))
+        except (OSError, ConnectionError):
+            ws.closed.set()
+
+    def _emit(self, client_id, msg_type, data):
+        with self._lock:
+            connections = list(self._sockets.get(client_id, ()))
+        for ws in connections:
+            self._send_to(ws, msg_type, data)
+
+    # --- Rendering -----------------------------------------------------------------------
+
+    def _worker(self):
+        while not self._stop.is_set():
+            with self._work:
+                while not self._pending and not self._stop.is_set():
+                    self._work.wait(0.5)
+                if self._stop.is_set():
+                    return
+                job = self._pending.pop(0)
+                self._running = job
+            try:
+                self._render(job)
+            finally:
+                with self._lock:
+                    self._running = None
+
+    def _render(self, job):
+        emit = lambda msg_type, **data: self._emit(job.client_id, msg_type, dict(data, prompt_id=job.prompt_id))
+        started = time.time()
+        messages = [["execution_start", {"prompt_id": job.prompt_id, "timestamp": int(started * 1000)}]]
+        emit("execution_start", timestamp=int(started * 1000))
+
+        outputs = {}
+        failed = None
+        nodes = sorted(job.prompt.items(), key=lambda item: item[0]) if isinstance(job.prompt, dict) else []
+        signatures = _node_signatures(dict(nodes))
+        # Output nodes always run here, so every prompt gets its files
+        cached = [node_id for node_id, node in nodes if signatures[node_id] in self._cache_signatures
+                  and not str(node.get("class_type", "")).startswith("SaveAudio")]
+        messages.append(["execution_cached", {"nodes": cached, "prompt_id": job.prompt_id}])
+        emit("execution_cached", nodes=cached)
+        executed = set()
+        sampler = next((node_id for node_id, node in nodes if node.get("class_type") == "KSampler"), None)
+        batch_size = max(1, int(next(
+            (node.get("inputs", {}).get("batch_size") or 1 for _, node in nodes if "Latent" in str(node.get("class_type"))), 1
+        )))
+        if sampler is None:
+            self._wait(job, self.render_seconds)
+
+        for node_id, node in nodes:
+            if job.interrupted.is_set():
+                break
+            if node_id in cached:
+                executed.add(signatures[node_id])
+                continue
+            emit("executing", node=node_id, display_node=node_id)
+            inputs = node.get("inputs", {})
+            if node_id == sampler:
+                steps = max(1, int(inputs.get("steps") or 10))
+                for step in range(1, steps + 1):
+                    if self._wait(job, self.render_seconds / steps):
+                        break
+                    emit("progress", value=step, max=steps, node=node_id)
+                if self.fail_rate and self.random.random() < self.fail_rate:
+                    failed = {
+                        "prompt_id": job.prompt_id, "node_id": node_id, "node_type": node.get("class_type"),
+                        "exception_message": "Injected failure from fake ComfyUI", "exception_type": "RuntimeError",
+                    }
+                    break
+            elif str(node.get("class_type", "")).startswith("SaveAudio"):
+                prefix = inputs.get("filename_prefix", "ComfyUI")
+                outputs[node_id] = {"audio": [self._save_audio(prefix) for _ in range(batch_size)]}
+                emit("executed", node=node_id, display_node=node_id, output=outputs[node_id])
+            if not job.interrupted.is_set() and not failed:
+                executed.add(signatures[node_id])
+        self._cache_signatures = executed
+
+        if job.interrupted.is_set():
+            data = {"prompt_id": job.prompt_id, "node_id": sampler, "executed": list(outputs)}
+            messages.append(["execution_interrupted", data])
+            emit("execution_interrupted", **{k: v for k, v in data.items() if k != "prompt_id"})
+            status = "error"
+        elif failed:
+            messages.append(["execution_error", failed])
+            emit("execution_error", **{k: v for k, v in failed.items() if k != "prompt_id"})
+            status = "error"
+        else:
+            emit("executing", node=None)
+            messages.append(["execution_success", {"prompt_id": job.prompt_id}])
+            emit("execution_success", timestamp=int(time.time() * 1000))
+            status = "success"
+
+        with self._lock:
+            self.history[job.prompt_id] = {
+                "prompt": job.queue_item(),
+                "outputs": outputs,
+                "status": {"status_str": status, "completed": status == "success", "messages": messages},
+            }
+
+    def _wait(self, job, seconds):
+        """Sleeps for part of a render. Returns True if the job was interrupted meanwhile."""
+        return job.interrupted.wait(seconds) or self._stop.is_set()
+
+    def _save_audio(self, filename_prefix):
+        subfolder, _, base = filename_prefix.rpartition("/")
+        with self._lock:
+            self._file_counters[filename_prefix] += 1
+            filename = f"{base}_{self._file_counters[filename_prefix]:05}_.mp3"
+            self.files[(subfolder, filename)] = synthetic_mp3(self.audio_bytes)
+        if self.output_dir:
+            folder = os.path.join(self.output_dir, subfolder)
+            os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, filename), "wb") as f:
+                f.write(self.files[(subfolder, filename)])
+        return {"filename": filename, "subfolder": subfolder, "type": "output"}
+
+
+class _FakeComfyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; without this, Nagle + delayed ACK add ~40ms per keep-alive call
+    disable_nagle_algorithm = True
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def log_message(self, format, *args):
+        logging.debug(f"Fake ComfyUI: {format % args}")
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return None
+
+    def _route(self, method):
+        parsed = urlparse(self.path)
+        path = parsed.path.rstrip("/") or "/"
+        route = "/history/{id}" if path.startswith("/history/") else path
+        self.fake.request_counts[f"{method} {route}"] += 1
+        if self.fake.http_latency and route != "/ws":
+            time.sleep(self.fake.http_latency)
+        return path, parse_qs(parsed.query)
+
+    def do_GET(self):
+        path, query = self._route("GET")
+        if path == "/ws":
+            return self._websocket(query)
+        if path == "/queue":
+            return self._send_json(self.fake.queue_snapshot())
+        if path.startswith("/history/"):
+            prompt_id = path[len("/history/"):]
+            entry = self.fake.history.get(prompt_id)
+            return self._send_json({prompt_id: entry} if entry else {})
+        if path == "/history":
+            max_items = int(query.get("max_items", ["0"])[0] or 0)
+            items = list(self.fake.history.items())
+            return self._send_json(dict(items[-max_items:] if max_items else items))
+        if path == "/view":
+            return self._view(query)
+        if path == "/system_stats":
+            return self._send_json({"system": {"comfyui_version": "fake"}, "devices": []})
+        self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        path, _ = self._route("POST")
+        body = self._read_json()
+        if body is None:
+            return self._send_json({"error": "invalid json"}, 400)
+
+        if path == "/prompt":
+            if self.fake.http_error_rate and self.fake.random.random() < self.fake.http_error_rate:
+                return self._send_json({"error": "Service Unavailable (injected)"}, 503)
+            prompt = body.get("prompt")
+            if not isinstance(prompt, dict):
+                return self._send_json({"error": {"type": "invalid_prompt", "message": "No prompt provided"}, "node_errors": {}}, 400)
+            job = self.fake.enqueue(prompt, client_id=body.get("client_id"), prompt_id=body.get("prompt_id"),
+                                    extra_data=body.get("extra_data"))
+            if self.fake.lost_response_rate and self.fake.random.random() < self.fake.lost_response_rate:
+                # Queued, but the client never hears back (a proxy or read timeout in real life)
+                self.close_connection = True
+                return
+            return self._send_json({"prompt_id": job.prompt_id, "number": job.number, "node_errors": {}})
+        if path == "/queue":
+            if body.get("clear"):
+                self.fake.delete_pending()
+            if body.get("delete"):
+                self.fake.delete_pending(set(body["delete"]))
+            return self._send_json({})
+        if path == "/history":
+            with self.fake._lock:
+                if body.get("clear"):
+                    self.fake.history.clear()
+                for prompt_id in body.get("delete", []):
+                    self.fake.history.pop(prompt_id, None)
+            return self._send_json({})
+        if path == "/interrupt":
+            self.fake.interrupt(body.get("prompt_id"))
+            return self._send_json({})
+        self._send_json({"error": "not found"}, 404)
+
+    def _view(self, query):
+        key = (query.get("subfolder", [""])[0], query.get("filename", [""])[0])
+        data = self.fake.files.get(key)
+        if data is None:
+            return self._send_json({"error": "file not found"}, 404)
+
+        start, end, status = 0, len(data) - 1, 200
+        range_header = self.headers.get("Range", "")
+        if range_header.startswith("bytes="):
+            first, _, last = range_header[len("bytes="):].partition("-")
+            start = int(first or 0)
+            end = min(int(last), len(data) - 1) if last else len(data) - 1
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.end_headers()
+        try:
+            self.wfile.write(data[start:end + 1])
+        except (BrokenPipeError, ConnectionResetError):
+            # Clients abandon a full-body GET when they switch to ranged segments
+            self.close_connection = True
+
+    def _websocket(self, query):
+        key = self.headers.get("Sec-WebSocket-Key")
+        if not self.fake.ws_enabled or not key or self.headers.get("Upgrade", "").lower() != "websocket":
+            return self._send_json({"error": "websocket unavailable"}, 404)
+
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.wfile.flush()
+
+        ws = _WebSocketConnection(self, query.get("clientId", [uuid.uuid4().hex])[0])
+        self.fake._attach(ws)
+        try:
+            ws.serve()
+        finally:
+            self.fake._detach(ws)
+            self.close_connection = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake ComfyUI server for offline testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--render-seconds", type=float, default=5.0, help="Wall time per render")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Probability of an execution_error")
+    parser.add_argument("--ws-drop-rate", type=float, default=0.0, help="Probability per event of dropping the WebSocket")
+    parser.add_argument("--no-ws", action="store_true", help="Disable /ws to force HTTP polling")
+    parser.add_argument("--backlog", type=int, default=0, help="Prompts from other clients queued at startup")
+    parser.add_argument("--http-latency", type=float, default=0.0, help="Seconds added to every HTTP response")
+    parser.add_argument("--http-error-rate", type=float, default=0.0, help="Probability of 503 on POST /prompt")
+    parser.add_argument("--lost-response-rate", type=float, default=0.0, help="Probability that POST /prompt queues but never answers")
+    parser.add_argument("--audio-kb", type=int, default=256, help="Size of each synthetic MP3")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output-dir", default=None, help="Also write outputs to this directory")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = FakeComfyServer(
+        host=args.host, port=args.port, render_seconds=args.render_seconds, fail_rate=args.fail_rate,
+        ws_drop_rate=args.ws_drop_rate, ws_enabled=not args.no_ws, backlog=args.backlog,
+        http_latency=args.http_latency, http_error_rate=args.http_error_rate,
+        lost_response_rate=args.lost_response_rate,
+        audio_bytes=args.audio_kb * 1024, seed=args.seed, output_dir=args.output_dir,
+    ).start()
+    print(f"Fake ComfyUI listening on {server.url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+class LLMCache:
+    """
+    On-disk cache of Ollama responses.
+
+    Keys are hashes of everything that determines an answer: model, full prompt, sampling
+    options, output format, any extra request fields and the seed. Entries expire after
+    a TTL, and the least recently used ones are evicted beyond max_entries. Hits only
+    update their last-use time in memory; it is written with the next put() or at exit.
+
+    Outside replay mode only seeded calls are answered from the cache (an unseeded call
+    is expected to vary between runs); in replay mode every cached answer is reused, so a
+    failed run can be repeated without waiting on the LLM again.
+    """
+
+    def __init__(self, cache_file=None, ttl=None, max_entries=None, replay=False):
+        """
+        :param cache_file: JSON cache path (SONGBIRD_LLM_CACHE). Empty (the default) disables the cache.
+        :param ttl: Seconds an answer stays valid (SONGBIRD_LLM_CACHE_TTL, default 7 days).
+        :param max_entries: Entries kept before the least recently used are evicted
+                            (SONGBIRD_LLM_CACHE_MAX_ENTRIES, default 2000).
+        :param replay: Serve every cached answer, seeded or not.
+        """
+        self.cache_file = cache_file if cache_file is not None else os.getenv("SONGBIRD_LLM_CACHE", "")
+        self.ttl = ttl or float(os.getenv("SONGBIRD_LLM_CACHE_TTL", str(7 * 86400)))
+        self.max_entries = max_entries or int(os.getenv("SONGBIRD_LLM_CACHE_MAX_ENTRIES", "2000"))
+        self.replay = replay
+        self._lock = threading.Lock()
+        # Hits since the last save, whose last_used is not on disk yet
+        self._dirty = False
+        self.entries = self._load() if self.cache_file else {}
+        if self.enabled:
+            atexit.register(self.flush)
+
+    @property
+    def enabled(self):
+        return bool(self.cache_file)
+
+    def _load(self):
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, "r") as f:
+                    return json.load(f)
+            except Exception as e:
+                logging.warning(f"Failed to load LLM cache: {e}")
+        return {}
+
+    def _save(self):
+        try:
+            tmp_path = f"{self.cache_file}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp_path, self.cache_file)
+            self._dirty = False
+        except Exception as e:
+            logging.warning(f"Failed to save LLM cache: {e}")
+
+    @staticmethod
+    def key(payload):
+        """SHA-256 of a generate payload (model, prompt, options, seed, ...), ignoring transport fields."""
+        fields = {k: v for k, v in payload.items() if k not in ("stream", "keep_alive")}
+        fields["seed"] = (payload.get("options") or {}).get("seed")
+        canonical = json.dumps(fields, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, payload):
+        """Returns the cached response text for a payload, or None on a miss."""
+        if not self.enabled:
+            return None
+        if not self.replay and (payload.get("options") or {}).get("seed") is None:
+            return None
+        key = self.key(payload)
+        with self._lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+            if time.time() - entry.get("timestamp", 0) >= self.ttl:
+                logging.info(f"LLM cache entry expired for {payload.get('model')}")
+                del self.entries[key]
+                self._save()
+                return None
+            entry["last_used"] = time.time()
+            self._dirty = True
+            logging.info(f"LLM cache hit for {payload.get('model')}")
+            return entry.get("response")
+
+    def put(self, payload, response):
+        """Records an answer, evicting expired and least recently used entries."""
+        if not self.enabled or not response:
+            return
+        now = time.time()
+        with self._lock:
+            self.entries[self.key(payload)] = {
+                "model": payload.get("model"),
+                "response": response,
+                "timestamp": now,
+                "last_used": now,
+            }
+            self._evict(now)
+            self._save()
+
+    def flush(self):
+        """Writes last-use times recorded by cache hits since the last save."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _evict(self, now):
+        for key in [k for k, entry in self.entries.items() if now - entry.get("timestamp", 0) >= self.ttl]:
+            del self.entries[key]
+        excess = len(self.entries) - self.max_entries
+        if excess > 0:
+            by_use = sorted(self.entries, key=lambda k: self.entries[k].get("last_used", 0))
+            for key in by_use[:excess]:
+                del self.entries[key]
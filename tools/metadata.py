@@ -94,6 +94,10 @@ def save_metadata(state):
         f"Background: {state.get('artist_background', 'N/A')}",
         f"Genre: {state.get('genre', 'Unknown')}",
         f"Style (Reference): {state.get('artist_style', 'N/A')}",
+    ]
+    if state.get("take_paths"):
+        content.append(f"Takes: {', '.join(os.path.basename(p) for p in state['take_paths'])}")
+    content += [
         "\n--- Musical Direction ---",
         json.dumps(state['musical_direction'], indent=2) if isinstance(state.get('musical_direction'), dict) else str(state.get('musical_direction', 'N/A')),
         "\n--- Lyrics ---",
@@ -108,3 +112,60 @@ def save_metadata(state):
         logging.info(f"Saved song metadata to {meta_path}")
     except Exception as e:
         logging.error(f"Error saving metadata: {e}")
+
+    if state.get("draft"):
+        save_render_job(state)
+
+def remove_metadata(audio_path):
+    """Deletes the metadata file and draft render job saved for an audio path, e.g. after its render failed."""
+    base_path = os.path.splitext(audio_path)[0]
+    for path in (f"{base_path}_metadata.txt", render_job_path(audio_path)):
+        try:
+            os.remove(path)
+            logging.info(f"Removed {path}: its render failed")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.error(f"Error removing {path}: {e}")
+
+def render_job_path(path):
+    """Sidecar path holding the render job for an audio, metadata or sidecar path."""
+    base = os.fspath(path)
+    for suffix in ("_render.json", "_metadata.txt"):
+        if base.endswith(suffix):
+            return f"{base[:-len(suffix)]}_render.json"
+    return f"{os.path.splitext(base)[0]}_render.json"
+
+def save_render_job(state):
+    """Saves the full-quality render job of a draft next to its metadata, so it can be promoted later."""
+    if not state.get("render_job") or not state.get("audio_path") or state["audio_path"] == "error":
+        return
+
+    record = {
+        "job": state["render_job"],
+        "track_number": state.get("track_number"),
+        "song_title": state.get("song_title"),
+        "genre": state.get("genre"),
+    }
+    job_path = render_job_path(state["audio_path"])
+    try:
+        with open(job_path, "w") as f:
+            json.dump(record, f, indent=2)
+        logging.info(f"Saved render job to {job_path}")
+    except Exception as e:
+        logging.error(f"Error saving render job: {e}")
+
+def load_render_job(path):
+    """Loads a draft's render job record ({"job", "track_number", "song_title", ...}), or None."""
+    job_path = render_job_path(path)
+    try:
+        with open(job_path, "r") as f:
+            record = json.load(f)
+    except Exception as e:
+        logging.error(f"Error loading render job {job_path}: {e}")
+        return None
+    if not isinstance(record, dict) or not isinstance(record.get("job"), dict):
+        logging.error(f"Invalid render job file: {job_path}")
+        return None
+    return record
+
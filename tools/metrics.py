@@ -0,0 +1,48 @@
+import json
+import logging
+import os
+import threading
+import time
+
+
+class Metrics:
+    """
+    In-process metrics recorder.
+
+    Keeps counters and the most recent value of each gauge in memory, and appends
+    every recorded event as a JSON line to SONGBIRD_METRICS_FILE when it is set.
+    """
+
+    def __init__(self, path=None):
+        self.path = path if path is not None else os.getenv("SONGBIRD_METRICS_FILE", "")
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def record(self, name, **fields):
+        """Records a named event with arbitrary fields."""
+        self.increment(name)
+        if not self.path:
+            return
+        line = json.dumps(dict(fields, event=name, timestamp=time.time()), default=str)
+        try:
+            with self._lock:
+                with open(self.path, "a") as f:
+                    f.write(line + "\n")
+        except Exception as e:
+            logging.warning(f"Failed to write metrics: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            return {"counters": dict(self.counters), "gauges": dict(self.gauges)}
+
+
+metrics = Metrics()
@@ -0,0 +1,350 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from urllib3.util.retry import Retry
+
+import config
+from tools.llm_cache import LLMCache
+from tools.metrics import metrics
+
+# A call whose model load took at least this long (seconds) counts as a cold load
+MODEL_LOAD_THRESHOLD = 0.5
+# keep_alive restored on unpin when OLLAMA_KEEP_ALIVE is unset (Ollama's own default)
+DEFAULT_KEEP_ALIVE = "5m"
+
+
+class OllamaClient:
+    """
+    Process-wide HTTP client for the Ollama API, shared by every agent.
+
+    One pooled keep-alive session means connection setup is paid once per process;
+    timeouts and retries are configured in one place (OLLAMA_* environment variables),
+    and every call is timed and recorded in the metrics layer. Answers can be served
+    from an on-disk LLMCache (SONGBIRD_LLM_CACHE).
+    """
+
+    def __init__(self, base_url=None, timeout=None, connect_timeout=None, max_retries=None, backoff_factor=None, pool_size=None, seed=None, cache=None):
+        self.base_url = (base_url or config.OLLAMA_BASE_URL).rstrip("/")
+        self.timeout = timeout or float(os.getenv("OLLAMA_TIMEOUT", "120"))
+        self.connect_timeout = connect_timeout or float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "10"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("OLLAMA_MAX_RETRIES", "2"))
+        self.backoff_factor = backoff_factor if backoff_factor is not None else float(os.getenv("OLLAMA_RETRY_BACKOFF", "0.5"))
+        self.pool_size = pool_size or int(os.getenv("OLLAMA_POOL_SIZE", "4"))
+        # Explicit sampling seed for every call (OLLAMA_SEED); seeded answers are reproducible and cacheable
+        seed = seed if seed is not None else os.getenv("OLLAMA_SEED", "")
+        self.seed = int(seed) if seed != "" else None
+        self.cache = cache if cache is not None else LLMCache()
+        # How long Ollama keeps a model loaded after a call (OLLAMA_KEEP_ALIVE, e.g. "30m"); unset uses the server default
+        self.keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "") or None
+        self.pinned_models = set()
+        self.last_model = None
+        self._model_lock = threading.Lock()
+        self.session = self._create_session()
+
+    def _create_session(self):
+        """
+        Creates the pooled keep-alive session. Failed connections and 502/503/504 answers
+        (Ollama answers 503 when its queue is full) are retried with exponential backoff;
+        generation requests have no side effects, so POST is retried too. Read timeouts
+        are not retried, as the model may simply be slow.
+        """
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,
+            status=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=None,
+            raise_on_status=False
+        )
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @property
+    def request_timeout(self):
+        """(connect, read) timeout tuple used for every HTTP call."""
+        return (self.connect_timeout, self.timeout)
+
+    def close(self):
+        self.session.close()
+
+    def generate(self, model, prompt, options=None, format=None, timeout=None, **fields):
+        """
+        Runs a non-streaming /api/generate call and returns the response text (stripped).
+
+        options are Ollama sampling options; format="json" requests JSON output; extra
+        fields (e.g. system, keep_alive) are passed through. timeout overrides the read
+        timeout for this call. Raises requests.RequestException on HTTP errors.
+        """
+        payload = self._payload(model, options, format, fields, prompt=prompt, stream=False)
+        return self._complete("/api/generate", payload, timeout)
+
+    def chat(self, model, system, prompt, options=None, format=None, timeout=None, **fields):
+        """
+        Runs a non-streaming /api/chat call with a system and a user message and returns
+        the reply text (stripped). Arguments are as for generate().
+
+        Keep system identical across calls (static instructions) and put the per-call
+        variables in prompt: Ollama then reuses the cached prefix of the previous call
+        and only evaluates the part that changed.
+        """
+        payload = self._payload(model, options, format, fields, messages=_messages(system, prompt), stream=False)
+        return self._complete("/api/chat", payload, timeout)
+
+    def generate_stream(self, model, prompt, options=None, format=None, timeout=None, stop_condition=None, **fields):
+        """
+        Streaming variant of generate(): yields response text chunks as Ollama produces them.
+
+        Closing the generator early (e.g. breaking out of the loop and calling close())
+        closes the HTTP response, which makes Ollama stop generating. The read timeout
+        applies between chunks rather than to the whole completion.
+
+        A stream that is stopped early is not the full answer, so it is only cached when
+        the caller names its stop rule in stop_condition (e.g. "lyric-guard:bars=96"). The
+        cache key then includes that rule, so the truncated text is only ever served to
+        callers that would have stopped at the same point.
+        """
+        payload = self._payload(model, options, format, fields, prompt=prompt, stream=True)
+        return self._stream("/api/generate", payload, timeout, stop_condition)
+
+    def chat_stream(self, model, system, prompt, options=None, format=None, timeout=None, stop_condition=None, **fields):
+        """Streaming variant of chat(); behaves like generate_stream()."""
+        payload = self._payload(model, options, format, fields, messages=_messages(system, prompt), stream=True)
+        return self._stream("/api/chat", payload, timeout, stop_condition)
+
+    def _payload(self, model, options, format, fields, **body):
+        """Builds a request body with the configured seed and keep_alive applied."""
+        payload = dict(fields, model=model, **body)
+        self._apply_keep_alive(payload)
+        if self.seed is not None and "seed" not in (options or {}):
+            options = dict(options or {}, seed=self.seed)
+        if options:
+            payload["options"] = options
+        if format:
+            payload["format"] = format
+        return payload
+
+    def _complete(self, endpoint, payload, timeout):
+        model = payload["model"]
+        cached = self.cache.get(payload)
+        if cached is not None:
+            metrics.increment("ollama.cache_hit")
+            return cached
+
+        self._note_model(model)
+        started = time.time()
+        try:
+            response = self.session.post(
+                f"{self.base_url}{endpoint}",
+                json=payload,
+                timeout=(self.connect_timeout, timeout or self.timeout)
+            )
+            response.raise_for_status()
+            result = response.json()
+        except Exception:
+            metrics.record("ollama.generate_failed", model=model, elapsed_seconds=time.time() - started)
+            raise
+
+        self._record(model, result, time.time() - started)
+        text = _text(result).strip()
+        self.cache.put(payload, text)
+        return text
+
+    def _stream(self, endpoint, payload, timeout, stop_condition=None):
+        model = payload["model"]
+        cache_payload = dict(payload, stop_condition=stop_condition) if stop_condition else payload
+        cached = self.cache.get(cache_payload)
+        if cached is not None:
+            metrics.increment("ollama.cache_hit")
+            yield cached
+            return
+
+        self._note_model(model)
+        started = time.time()
+        chunks = []
+        try:
+            response = self.session.post(
+                f"{self.base_url}{endpoint}",
+                json=payload,
+                timeout=(self.connect_timeout, timeout or self.timeout),
+                stream=True
+            )
+            response.raise_for_status()
+        except Exception:
+            metrics.record("ollama.generate_failed", model=model, elapsed_seconds=time.time() - started)
+            raise
+
+        try:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                result = json.loads(line)
+                if result.get("error"):
+                    raise requests.RequestException(f"Ollama error: {result['error']}")
+                text = _text(result)
+                if text:
+                    chunks.append(text)
+                    yield text
+                if result.get("done"):
+                    self._record(model, result, time.time() - started)
+                    break
+        except GeneratorExit:
+            metrics.record("ollama.generate_stopped", model=model, elapsed_seconds=time.time() - started, output_chars=len("".join(chunks)))
+            if stop_condition:
+                self.cache.put(cache_payload, "".join(chunks).strip())
+            raise
+        except Exception:
+            metrics.record("ollama.generate_failed", model=model, elapsed_seconds=time.time() - started)
+            raise
+        finally:
+            response.close()
+        self.cache.put(cache_payload, "".join(chunks).strip())
+
+    def _apply_keep_alive(self, payload):
+        """Sets keep_alive on a request unless the caller did: pinned models stay loaded (-1)."""
+        keep_alive = -1 if payload["model"] in self.pinned_models else self.keep_alive
+        if keep_alive is not None:
+            payload.setdefault("keep_alive", keep_alive)
+
+    def _note_model(self, model):
+        """Counts a model switch whenever a call targets a different model than the previous one."""
+        with self._model_lock:
+            if self.last_model is not None and model != self.last_model:
+                metrics.increment("ollama.model_switches")
+                logging.debug(f"Ollama model switch: {self.last_model} -> {model}")
+            self.last_model = model
+
+    def _note_load(self, model, load_seconds):
+        """Counts a cold model load; Ollama reports a near-zero load_duration for a resident model."""
+        if load_seconds >= MODEL_LOAD_THRESHOLD:
+            metrics.increment("ollama.model_loads")
+            metrics.increment("ollama.model_load_seconds", load_seconds)
+            logging.info(f"Ollama loaded {model} in {load_seconds:.1f}s")
+
+    def preload(self, model):
+        """
+        Loads a model without generating anything, so the next call to it starts hot.
+        Skipped when it was the last model used (it is still loaded). Returns True if
+        the model is ready.
+        """
+        if model == self.last_model:
+            return True
+        payload = {"model": model}
+        self._apply_keep_alive(payload)
+        self._note_model(model)
+        try:
+            response = self.session.post(f"{self.base_url}/api/generate", json=payload, timeout=self.request_timeout)
+            response.raise_for_status()
+            self._note_load(model, (response.json().get("load_duration") or 0) / 1e9)
+            return True
+        except Exception as e:
+            logging.warning(f"Failed to preload Ollama model {model}: {e}")
+            return False
+
+    def preload_async(self, model):
+        """Starts preload() in a background thread. Returns the thread or None if nothing to do."""
+        if not model or model == self.last_model:
+            return None
+        thread = threading.Thread(target=self.preload, args=(model,), name="ollama-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def pin(self, *models):
+        """Keeps the given models loaded (keep_alive=-1) on every call until unpin()."""
+        self.pinned_models.update(m for m in models if m)
+
+    def unpin(self):
+        """
+        Releases pinned models: the ones still loaded get the normal keep_alive again,
+        so Ollama unloads them once idle instead of holding them forever.
+        """
+        models, self.pinned_models = self.pinned_models, set()
+        if not models:
+            return
+        loaded = self.loaded_models()
+        for model in models:
+            if _model_name(model) not in loaded:
+                continue
+            try:
+                response = self.session.post(
+                    f"{self.base_url}/api/generate",
+                    json={"model": model, "keep_alive": self.keep_alive or DEFAULT_KEEP_ALIVE},
+                    timeout=self.request_timeout
+                )
+                response.raise_for_status()
+            except Exception as e:
+                logging.warning(f"Failed to unpin Ollama model {model}: {e}")
+
+    def loaded_models(self):
+        """Names of the models Ollama currently holds in memory (/api/ps); empty if unreachable."""
+        try:
+            response = self.session.get(f"{self.base_url}/api/ps", timeout=self.request_timeout)
+            response.raise_for_status()
+            return {_model_name(m.get("name") or m.get("model", "")) for m in response.json().get("models", [])}
+        except Exception as e:
+            logging.warning(f"Error fetching loaded Ollama models: {e}")
+            return set()
+
+    @staticmethod
+    def model_swap_summary():
+        """Model switches and cold loads counted in this process (the main LLM latency driver)."""
+        counters = metrics.snapshot()["counters"]
+        return {
+            "switches": counters.get("ollama.model_switches", 0),
+            "loads": counters.get("ollama.model_loads", 0),
+            "load_seconds": counters.get("ollama.model_load_seconds", 0),
+        }
+
+    def _record(self, model, result, elapsed):
+        """Records a finished call; token counts and rates come from Ollama's response timings."""
+        self._note_load(model, (result.get("load_duration") or 0) / 1e9)
+        eval_count = result.get("eval_count")
+        eval_duration = result.get("eval_duration")
+        tokens_per_second = eval_count / (eval_duration / 1e9) if eval_count and eval_duration else None
+        if tokens_per_second:
+            metrics.gauge(f"ollama.tokens_per_second.{model}", tokens_per_second)
+        metrics.record(
+            "ollama.generate", model=model, elapsed_seconds=elapsed,
+            prompt_tokens=result.get("prompt_eval_count"), output_tokens=eval_count,
+            tokens_per_second=tokens_per_second,
+            load_seconds=(result.get("load_duration") or 0) / 1e9
+        )
+        logging.debug(f"Ollama {model} answered in {elapsed:.1f}s ({eval_count} tokens)")
+
+
+def _messages(system, prompt):
+    """Chat messages with the stable system prefix first and the per-call prompt last."""
+    return [{"role": "system", "content": system}, {"role": "user", "content": prompt}]
+
+
+def _text(result):
+    """Response text of a /api/generate or /api/chat result (or stream chunk)."""
+    if "message" in result:
+        return (result.get("message") or {}).get("content", "")
+    return result.get("response", "")
+
+
+def _model_name(model):
+    """Normalises a model name the way Ollama reports it ("llama3" -> "llama3:latest")."""
+    return model if ":" in model else f"{model}:latest"
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_ollama_client():
+    """Returns the process-wide OllamaClient, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OllamaClient()
+    return _client
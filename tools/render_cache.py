@@ -0,0 +1,120 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+# Workflow inputs that name the output file but do not change the audio
+IGNORED_INPUTS = ("filename_prefix",)
+
+
+class RenderCache:
+    """
+    Content-addressed index of finished ComfyUI renders.
+
+    Keys are hashes of the fully patched workflow prompt (minus output naming), values
+    point at local audio files that were produced from exactly those inputs. A hit is
+    materialized as a hardlink (or a copy across filesystems) instead of re-rendering.
+    """
+
+    def __init__(self, index_file=None):
+        """
+        :param index_file: JSON index path (SONGBIRD_RENDER_CACHE). Opt-in: unset or empty
+                           disables the cache.
+        """
+        self.index_file = index_file if index_file is not None else os.getenv("SONGBIRD_RENDER_CACHE", "")
+        self._lock = threading.Lock()
+        self.entries = self._load() if self.index_file else {}
+
+    @property
+    def enabled(self):
+        return bool(self.index_file)
+
+    def _load(self):
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, "r") as f:
+                    return json.load(f)
+            except Exception as e:
+                logging.warning(f"Failed to load render cache: {e}")
+        return {}
+
+    def _save(self):
+        try:
+            tmp_path = f"{self.index_file}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp_path, self.index_file)
+        except Exception as e:
+            logging.warning(f"Failed to save render cache: {e}")
+
+    @staticmethod
+    def key(prompt):
+        """SHA-256 of a patched workflow prompt, ignoring output naming. None if it cannot be hashed."""
+        if not isinstance(prompt, dict):
+            return None
+        try:
+            nodes = {
+                node_id: dict(node, inputs={k: v for k, v in node.get("inputs", {}).items() if k not in IGNORED_INPUTS})
+                for node_id, node in prompt.items()
+            }
+            canonical = json.dumps(nodes, sort_keys=True, separators=(",", ":"))
+        except (AttributeError, TypeError, ValueError) as e:
+            logging.debug(f"Render not cacheable: {e}")
+            return None
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returns the cached audio path for a key, dropping entries whose file is gone or changed."""
+        if not key or not self.enabled:
+            return None
+        with self._lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+            path = entry.get("path")
+            if path and os.path.isfile(path) and os.path.getsize(path) == entry.get("size"):
+                logging.info(f"Render cache hit: {path}")
+                return path
+            logging.info(f"Render cache entry is stale, dropping: {path}")
+            del self.entries[key]
+            self._save()
+            return None
+
+    def put(self, key, path):
+        """Records a finished render."""
+        if not key or not self.enabled or not path or not os.path.isfile(path):
+            return
+        with self._lock:
+            self.entries[key] = {
+                "path": os.path.abspath(path),
+                "size": os.path.getsize(path),
+                "timestamp": time.time(),
+            }
+            self._save()
+
+    @staticmethod
+    def materialize(source, target):
+        """
+        Places a cached render at target (hardlink, else copy) and returns the path used.
+        An existing different file at target is never overwritten; a numbered name is used instead.
+        """
+        if os.path.exists(target) and os.path.samefile(source, target):
+            return target
+
+        base, ext = os.path.splitext(target)
+        counter = 2
+        while os.path.exists(target):
+            target = f"{base}_{counter}{ext}"
+            counter += 1
+
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        try:
+            os.link(source, target)
+            logging.info(f"Hardlinked cached render {source} -> {target}")
+        except OSError:
+            shutil.copy2(source, target)
+            logging.info(f"Copied cached render {source} -> {target}")
+        return target
@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+
+class RenderJournal:
+    """
+    Local record of ComfyUI prompts that were submitted but not collected yet.
+
+    Entries are keyed by prompt id and hold what a later run needs to collect the render
+    if this one dies: the server URL, the job prefix and batch size, the output directory
+    and caller-supplied context (e.g. track number and title). The file is rewritten
+    atomically on every change, so it survives a crash at any point.
+
+    Every entry is tagged with the run that submitted it (run id, host and pid). Changes
+    are applied to the file's current contents rather than this run's copy, so several
+    runs can share a journal, and orphaned() only offers entries whose run has exited.
+    """
+
+    def __init__(self, journal_file=None, output_dir="output"):
+        """
+        :param journal_file: JSON journal path (SONGBIRD_RENDER_JOURNAL, default
+                             <output_dir>/.render_journal.json). An empty value disables the journal.
+        :param output_dir: Directory holding the default journal file.
+        """
+        if journal_file is None:
+            journal_file = os.getenv("SONGBIRD_RENDER_JOURNAL", os.path.join(output_dir, ".render_journal.json"))
+        self.journal_file = journal_file
+        self.owner = {"run_id": uuid.uuid4().hex, "host": socket.gethostname(), "pid": os.getpid()}
+        self._lock = threading.Lock()
+        self.entries = self._load() if self.journal_file else {}
+
+    @property
+    def enabled(self):
+        return bool(self.journal_file)
+
+    def _load(self):
+        if os.path.exists(self.journal_file):
+            try:
+                with open(self.journal_file, "r") as f:
+                    return json.load(f)
+            except Exception as e:
+                logging.warning(f"Failed to load render journal: {e}")
+        return {}
+
+    def _save(self):
+        try:
+            directory = os.path.dirname(self.journal_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.journal_file}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp_path, self.journal_file)
+        except Exception as e:
+            logging.warning(f"Failed to save render journal: {e}")
+
+    def add(self, prompt_id, **fields):
+        """Records a submitted prompt."""
+        if not prompt_id or not self.enabled:
+            return
+        with self._lock:
+            self.entries = self._load()
+            self.entries[prompt_id] = dict(fields, context={}, owner=dict(self.owner), submitted_at=time.time())
+            self._save()
+
+    def annotate(self, prompt_id, **context):
+        """Attaches caller context (JSON-serializable) to a recorded prompt."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.entries = self._load()
+            entry = self.entries.get(prompt_id)
+            if entry is None:
+                return
+            entry.setdefault("context", {}).update(context)
+            self._save()
+
+    def claim(self, prompt_id):
+        """Re-tags an orphaned entry as this run's, so other runs leave it alone while it is collected."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.entries = self._load()
+            entry = self.entries.get(prompt_id)
+            if entry is None:
+                return
+            entry["owner"] = dict(self.owner)
+            self._save()
+
+    def remove(self, prompt_id):
+        """Drops a prompt once it has been collected, cancelled or has failed."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.entries = self._load()
+            if self.entries.pop(prompt_id, None) is not None:
+                self._save()
+
+    def pending(self, url=None):
+        """Copies of the recorded entries ({prompt_id: entry}), optionally only those for one server."""
+        with self._lock:
+            return {
+                prompt_id: dict(entry) for prompt_id, entry in self.entries.items()
+                if url is None or entry.get("url") == url
+            }
+
+    def orphaned(self, url=None):
+        """
+        Like pending(), but only entries left behind by runs that are no longer running:
+        untagged entries and entries from an exited process on this host. Entries of live
+        runs, and of runs on other hosts (whose state cannot be checked), are skipped.
+        """
+        if self.enabled:
+            with self._lock:
+                self.entries = self._load()
+        return {
+            prompt_id: entry for prompt_id, entry in self.pending(url).items()
+            if not self._owner_running(entry.get("owner"))
+        }
+
+    def _owner_running(self, owner):
+        if not owner:
+            return False
+        if owner.get("run_id") == self.owner["run_id"]:
+            return True
+        if owner.get("host") != self.owner["host"]:
+            return True
+        return _process_alive(owner.get("pid"))
+
+
+def _process_alive(pid):
+    """True if a process with this pid exists on this host."""
+    if not pid:
+        return False
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows, so liveness cannot be probed there
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
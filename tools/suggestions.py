@@ -3,9 +3,9 @@ import glob
 import re
 import logging
 import json
-import requests
 from collections import Counter
-from config import OLLAMA_BASE_URL, ALBUM_MODEL, MUSIC_PROMPTS
+from config import ALBUM_MODEL, MUSIC_PROMPTS
+from tools.ollama import get_ollama_client
 
 def scan_history(output_dir):
     """
@@ -73,18 +73,7 @@ def generate_suggestion(history):
     """
 
     try:
-        response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/generate",
-            json={
-                "model": ALBUM_MODEL,
-                "prompt": prompt,
-                "stream": False,
-                "format": "json"
-            },
-            timeout=120
-        )
-        response.raise_for_status()
-        result = json.loads(response.json().get("response", "{}"))
+        result = json.loads(get_ollama_client().generate(ALBUM_MODEL, prompt, format="json") or "{}")
         
         # Final validation to ensure genre is supported
         if result.get("genre"):
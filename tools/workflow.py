@@ -0,0 +1,194 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+import config
+
+# ComfyUI class_types that provide each node role Songbird patches
+ROLE_CLASS_TYPES = {
+    "sampler": ("KSampler",),
+    "text_encoder": ("TextEncodeAceStepAudio1.5",),
+    "latent": ("EmptyAceStep1.5LatentAudio",),
+    "save_audio": ("SaveAudioMP3",),
+}
+
+# Node ids of the bundled ACE-Step workflow, used for templates without class_type metadata
+LEGACY_NODE_IDS = {
+    "sampler": "3",
+    "text_encoder": "94",
+    "latent": "98",
+    "save_audio": "104",
+}
+
+# (role, node input, build_prompt parameter)
+PATCH_SPEC = [
+    ("sampler", "seed", "seed"),
+    ("sampler", "steps", "steps"),
+    ("sampler", "cfg", "cfg"),
+    ("sampler", "sampler_name", "sampler_name"),
+    ("sampler", "scheduler", "scheduler"),
+    ("text_encoder", "tags", "tags"),
+    ("text_encoder", "lyrics", "lyrics"),
+    ("text_encoder", "seed", "encoder_seed"),
+    ("text_encoder", "bpm", "bpm"),
+    ("text_encoder", "duration", "duration"),
+    ("text_encoder", "keyscale", "keyscale"),
+    ("text_encoder", "min_p", "min_p"),
+    ("text_encoder", "cfg_scale", "cfg_scale"),
+    ("latent", "seconds", "duration"),
+    ("latent", "batch_size", "batch_size"),
+    ("save_audio", "filename_prefix", "filename_prefix"),
+    ("negative", "text", "negative_prompt"),
+]
+
+# Text inputs normalised before patching, so cosmetic differences don't defeat ComfyUI's execution cache
+TAG_PARAMS = ("tags", "negative_prompt")
+TEXT_PARAMS = ("lyrics",)
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def resolve_workflow_path(path=None):
+    """Resolves a workflow path relative to the project root."""
+    path = path or getattr(config, "COMFYUI_WORKFLOW", "audio_ace_step_1_5_checkpoint.json")
+    if not os.path.isabs(path):
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        path = os.path.join(base_dir, path)
+    return os.path.abspath(path)
+
+
+def get_workflow_template(path=None):
+    """
+    Returns the cached WorkflowTemplate for a workflow file, loading it on first use.
+    Raises if the file cannot be read or parsed; failures are not cached.
+    """
+    path = resolve_workflow_path(path)
+    with _templates_lock:
+        template = _templates.get(path)
+        if template is None:
+            template = WorkflowTemplate.load(path)
+            _templates[path] = template
+    return template
+
+
+def canonical_tags(text):
+    """Comma-separated tag text with whitespace collapsed and empty entries dropped."""
+    parts = (" ".join(part.split()) for part in str(text).split(","))
+    return ", ".join(part for part in parts if part)
+
+
+def canonical_text(text):
+    """Multi-line text with trailing spaces, leading/trailing blank lines and runs of blank lines removed."""
+    lines = [line.rstrip() for line in str(text).strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+def canonical_params(params):
+    """Returns params with tag and lyric text canonicalised; other values are left as given."""
+    params = dict(params)
+    for name in TAG_PARAMS:
+        if isinstance(params.get(name), str):
+            params[name] = canonical_tags(params[name])
+    for name in TEXT_PARAMS:
+        if isinstance(params.get(name), str):
+            params[name] = canonical_text(params[name])
+    return params
+
+
+def content_seed(*values):
+    """A stable seed derived from the given values (same inputs, same seed)."""
+    digest = hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+    return int(digest[:12], 16)
+
+
+def clear_workflow_cache():
+    """Drops all cached templates so the next request re-reads them from disk."""
+    with _templates_lock:
+        _templates.clear()
+
+
+class WorkflowTemplate:
+    """
+    A parsed ComfyUI API-format workflow with its node roles resolved and a
+    precompiled patch plan, so prompts can be produced without touching disk.
+    """
+
+    def __init__(self, nodes, path=None):
+        self.nodes = nodes
+        self.path = path
+        self.roles = self._discover_roles(nodes)
+        self.plan = [
+            (node_id, input_name, param)
+            for role, input_name, param in PATCH_SPEC
+            for node_id in self.roles.get(role, [])
+            if self._patch_applies(role, node_id, input_name)
+        ]
+
+        missing = [role for role in list(ROLE_CLASS_TYPES) + ["negative"] if not self.roles.get(role)]
+        if missing:
+            logging.warning(f"Workflow {path or '<inline>'} has no node for roles: {', '.join(missing)}")
+
+    def _patch_applies(self, role, node_id, input_name):
+        # The ACE-Step text encoder only samples with its seed when it generates audio codes;
+        # otherwise the template's seed is kept so the conditioning stays cacheable across renders
+        if role == "text_encoder" and input_name == "seed":
+            return self.nodes[node_id].get("inputs", {}).get("generate_audio_codes", True) is not False
+        return True
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            nodes = json.load(f)
+        logging.info(f"Loaded workflow template: {path}")
+        return cls(nodes, path=path)
+
+    @staticmethod
+    def _discover_roles(nodes):
+        roles = {}
+        for role, class_types in ROLE_CLASS_TYPES.items():
+            roles[role] = [
+                node_id for node_id, node in nodes.items()
+                if isinstance(node, dict) and node.get("class_type") in class_types
+            ]
+            legacy_id = LEGACY_NODE_IDS[role]
+            if not roles[role] and legacy_id in nodes:
+                roles[role] = [legacy_id]
+
+        # Negative prompt: explicit config override, else the CLIPTextEncode wired into the sampler
+        neg_node_id = getattr(config, "NEGATIVE_PROMPT_NODE_ID", "7")
+        if neg_node_id in nodes:
+            roles["negative"] = [neg_node_id]
+        else:
+            roles["negative"] = []
+            for sampler_id in roles["sampler"]:
+                link = nodes[sampler_id].get("inputs", {}).get("negative")
+                if isinstance(link, list) and link and nodes.get(str(link[0]), {}).get("class_type") == "CLIPTextEncode":
+                    roles["negative"] = [str(link[0])]
+                    break
+
+        return roles
+
+    def node_id(self, role, default=None):
+        """Returns the first node id serving a role."""
+        ids = self.roles.get(role)
+        return ids[0] if ids else default
+
+    def build_prompt(self, params):
+        """
+        Returns a fresh prompt dict with the given parameters applied.
+        Parameters not present in params keep the template's values; tag and
+        lyric text is canonicalised (see canonical_params).
+        """
+        params = canonical_params(params)
+        prompt = {
+            node_id: dict(node, inputs=dict(node.get("inputs", {})))
+            for node_id, node in self.nodes.items()
+        }
+        for node_id, input_name, param in self.plan:
+            if param in params:
+                prompt[node_id]["inputs"][input_name] = params[param]
+        return prompt